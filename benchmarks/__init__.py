@@ -0,0 +1,4 @@
+"""
+Birdiland 性能基准测试
+本地模拟的 OpenAI 兼容上游、负载生成器以及结果对比工具，无需访问真实的上游即可离线测量性能
+"""
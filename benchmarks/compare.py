@@ -0,0 +1,109 @@
+"""
+基准测试结果对比
+按负载模式对比两次运行的吞吐量和各延迟百分位数，变差超过阈值时返回非零退出码
+
+    python -m benchmarks.compare results/base.json results/head.json --threshold 10
+"""
+
+import argparse
+import json
+import sys
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+
+# 对比的指标：(路径, 是否越大越好)
+METRICS: List[Tuple[str, bool]] = [
+    ("throughput_rps", True),
+    ("error_rate", False),
+    ("ttft_ms.p50", False),
+    ("ttft_ms.p95", False),
+    ("ttft_ms.p99", False),
+    ("itl_ms.p50", False),
+    ("itl_ms.p99", False),
+    ("latency_ms.p50", False),
+    ("latency_ms.p95", False),
+    ("latency_ms.p99", False),
+]
+
+
+def load_result(path: str) -> Dict[str, Any]:
+    """读取结果文件"""
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def metric(run: Dict[str, Any], path: str) -> float:
+    """按点分路径读取指标（缺失时为 0）"""
+    value: Any = run
+    for key in path.split("."):
+        value = value.get(key, {}) if isinstance(value, dict) else {}
+    return float(value) if isinstance(value, (int, float)) else 0.0
+
+
+def compare(base: Dict[str, Any], head: Dict[str, Any], threshold: float = 10.0) -> Tuple[List[Dict[str, Any]], bool]:
+    """
+    对比两次运行，返回 (各指标的变化, 是否有指标变差超过 threshold%)
+
+    错误率按绝对值比较（百分点），其他指标按相对变化比较。
+    """
+    base_runs = {run["mode"]: run for run in base.get("runs", [])}
+    rows = []
+    regressed = False
+    for head_run in head.get("runs", []):
+        base_run = base_runs.get(head_run["mode"])
+        if base_run is None:
+            continue
+        for path, higher_is_better in METRICS:
+            before, after = metric(base_run, path), metric(head_run, path)
+            if path == "error_rate":
+                change = (after - before) * 100
+            elif before:
+                change = (after - before) / before * 100
+            else:
+                change = 0.0
+            worse = -change if higher_is_better else change
+            row_regressed = worse > threshold
+            regressed = regressed or row_regressed
+            rows.append({
+                "mode": head_run["mode"],
+                "metric": path,
+                "base": before,
+                "head": after,
+                "change_pct": round(change, 2),
+                "regressed": row_regressed,
+            })
+    return rows, regressed
+
+
+def format_rows(rows: List[Dict[str, Any]]) -> str:
+    """对比结果表格"""
+    lines = [f"{'模式':<8}{'指标':<18}{'基准':>12}{'当前':>12}{'变化':>10}"]
+    for row in rows:
+        flag = "  ⚠️" if row["regressed"] else ""
+        lines.append(
+            f"{row['mode']:<8}{row['metric']:<18}{row['base']:>12.3f}{row['head']:>12.3f}"
+            f"{row['change_pct']:>+9.1f}%{flag}"
+        )
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    """对比两个结果文件"""
+    parser = argparse.ArgumentParser(description="对比两次基准测试的结果")
+    parser.add_argument("base", help="基准结果文件")
+    parser.add_argument("head", help="当前结果文件")
+    parser.add_argument("--threshold", type=float, default=10.0, help="判定为变差的变化幅度（百分比）")
+    args = parser.parse_args(argv)
+
+    base, head = load_result(args.base), load_result(args.head)
+    print(f"基准: {base['meta'].get('commit')}  当前: {head['meta'].get('commit')}")
+    rows, regressed = compare(base, head, args.threshold)
+    print(format_rows(rows))
+    if regressed:
+        print(f"❌ 有指标变差超过 {args.threshold}%（{Path(args.head).name}）")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
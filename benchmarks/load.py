@@ -0,0 +1,198 @@
+"""
+负载生成器与统计
+以固定并发驱动 /api/v1/chat（流式与非流式）或 Gradio 聊天接口，记录每个请求的首字延迟、
+片段间隔和总耗时，汇总为吞吐量及 p50/p95/p99
+"""
+
+import asyncio
+import json
+import math
+import time
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+
+# 支持的负载模式
+MODES = ("chat", "stream", "gradio")
+
+
+class RequestResult:
+    """单个请求的测量结果（时间均为秒）"""
+
+    __slots__ = ("ok", "status", "ttft", "gaps", "total", "chunks", "error")
+
+    def __init__(self):
+        self.ok = False
+        self.status = 0
+        self.ttft: Optional[float] = None  # 首个内容片段到达的时间（非流式为完整响应的时间）
+        self.gaps: List[float] = []  # 相邻内容片段的间隔
+        self.total = 0.0
+        self.chunks = 0
+        self.error = ""
+
+
+def percentile(values: List[float], q: float) -> float:
+    """线性插值的百分位数（values 需已排序）"""
+    if not values:
+        return 0.0
+    position = (len(values) - 1) * q / 100
+    lower = math.floor(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+def describe(values: List[float]) -> Dict[str, float]:
+    """分布的均值、百分位数和最大值（毫秒）"""
+    values = sorted(value * 1000 for value in values)
+    if not values:
+        return {"count": 0}
+    return {
+        "count": len(values),
+        "mean": round(sum(values) / len(values), 3),
+        "p50": round(percentile(values, 50), 3),
+        "p95": round(percentile(values, 95), 3),
+        "p99": round(percentile(values, 99), 3),
+        "max": round(values[-1], 3),
+    }
+
+
+def summarize(results: List[RequestResult], elapsed: float) -> Dict[str, Any]:
+    """汇总一次负载测试的结果"""
+    ok = [result for result in results if result.ok]
+    errors: Dict[str, int] = {}
+    for result in results:
+        if not result.ok:
+            key = str(result.status or result.error or "unknown")
+            errors[key] = errors.get(key, 0) + 1
+    chunks = sum(result.chunks for result in ok)
+    return {
+        "requests": len(results),
+        "ok": len(ok),
+        "errors": errors,
+        "error_rate": round(1 - len(ok) / len(results), 4) if results else 0.0,
+        "duration_s": round(elapsed, 3),
+        "throughput_rps": round(len(ok) / elapsed, 3) if elapsed > 0 else 0.0,
+        "chunks_per_s": round(chunks / elapsed, 3) if elapsed > 0 else 0.0,
+        "ttft_ms": describe([result.ttft for result in ok if result.ttft is not None]),
+        "itl_ms": describe([gap for result in ok for gap in result.gaps]),
+        "latency_ms": describe([result.total for result in ok]),
+    }
+
+
+def _record_chunk(result: RequestResult, start: float, last: Optional[float]) -> float:
+    """记录一个内容片段的到达时间"""
+    now = time.perf_counter()
+    if last is None:
+        result.ttft = now - start
+    else:
+        result.gaps.append(now - last)
+    result.chunks += 1
+    return now
+
+
+async def _chat(client: httpx.AsyncClient, payload: Dict[str, Any], result: RequestResult):
+    """非流式对话请求"""
+    start = time.perf_counter()
+    response = await client.post("/api/v1/chat", json={**payload, "stream": False})
+    result.status = response.status_code
+    if response.status_code == 200 and response.json().get("response"):
+        _record_chunk(result, start, None)
+        result.ok = True
+
+
+async def _stream(client: httpx.AsyncClient, payload: Dict[str, Any], result: RequestResult):
+    """流式对话请求（解析SSE，每个非空内容帧记为一个片段）"""
+    start = time.perf_counter()
+    last = None
+    async with client.stream("POST", "/api/v1/chat", json={**payload, "stream": True}) as response:
+        result.status = response.status_code
+        if response.status_code != 200:
+            await response.aread()
+            return
+        async for line in response.aiter_lines():
+            if not line.startswith("data: "):
+                continue
+            data = line[6:]
+            if data == "[DONE]":
+                result.ok = True
+                break
+            if json.loads(data).get("content"):
+                last = _record_chunk(result, start, last)
+
+
+def _gradio(client, payload: Dict[str, Any], result: RequestResult):
+    """通过 Gradio 队列调用聊天界面的流式回复（同步，在线程中执行）"""
+    start = time.perf_counter()
+    last = None
+    previous = None
+    history = [{"role": "user", "content": payload["message"]}]
+    job = client.submit(
+        payload["message"], history, payload["agent_id"], payload["session_id"], api_name="/chat_with_birdiland"
+    )
+    for output in job:
+        # 每次界面刷新产出完整的对话列表，内容变化即为一个片段
+        content = output[1][-1]["content"] if output[1] else ""
+        if content and content != previous:
+            last = _record_chunk(result, start, last)
+            previous = content
+    result.ok = last is not None
+    result.status = 200 if result.ok else 0
+
+
+async def run_load(
+    base_url: str,
+    mode: str = "stream",
+    concurrency: int = 8,
+    requests: int = 100,
+    agent_id: str = "canary",
+    message: str = "你好，请介绍一下你自己",
+    transport: Optional[httpx.AsyncBaseTransport] = None,
+    timeout: float = 120.0,
+) -> Dict[str, Any]:
+    """
+    以固定并发发送 requests 个请求并汇总结果
+
+    每个并发用户使用独立的会话，每条消息带序号，避免请求合并和回复缓存使结果偏乐观；
+    传输错误、超时和非200响应计为失败（上游错误时服务返回的降级回复计为成功）。
+    """
+    if mode not in MODES:
+        raise ValueError(f"未知的负载模式: {mode}（可选: {', '.join(MODES)}）")
+
+    results: List[RequestResult] = []
+    counter = iter(range(requests))
+
+    if mode == "gradio":
+        from gradio_client import Client
+
+        gradio_client = Client(base_url.rstrip("/") + "/chat/", verbose=False)
+
+    async with httpx.AsyncClient(base_url=base_url, transport=transport, timeout=timeout) as client:
+
+        async def user(worker: int):
+            for index in counter:
+                payload = {
+                    "message": f"{message}（{index}）",
+                    "agent_id": agent_id,
+                    "session_id": f"bench-{mode}-{worker}",
+                }
+                result = RequestResult()
+                start = time.perf_counter()
+                try:
+                    if mode == "chat":
+                        await _chat(client, payload, result)
+                    elif mode == "stream":
+                        await _stream(client, payload, result)
+                    else:
+                        await asyncio.to_thread(_gradio, gradio_client, payload, result)
+                except Exception as e:
+                    result.ok = False
+                    result.error = type(e).__name__
+                result.total = time.perf_counter() - start
+                results.append(result)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(user(worker) for worker in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    return {"mode": mode, "concurrency": concurrency, **summarize(results, elapsed)}
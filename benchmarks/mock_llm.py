@@ -0,0 +1,166 @@
+"""
+模拟的 OpenAI 兼容上游
+提供 /v1/chat/completions（流式与非流式），首个token延迟、token间隔、回复长度和错误率均可配置
+
+    python -m benchmarks.mock_llm --port 9000 --ttft-ms 200 --token-delay-ms 20 --reply-tokens 64
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel
+
+
+# 回复由这段文本循环截取，每个字符为一个token
+REPLY_TEXT = "你好呀！今天过得怎么样？我很高兴能和你聊天，有什么想分享的吗？"
+
+
+class MockLLMConfig(BaseModel):
+    """模拟上游的行为参数"""
+    ttft_ms: float = 200.0  # 首个token的延迟（毫秒）
+    token_delay_ms: float = 20.0  # 相邻token的间隔（毫秒）
+    reply_tokens: int = 64  # 每个回复的token数
+    jitter: float = 0.0  # 延迟的随机波动比例（0.1 表示 ±10%）
+    error_rate: float = 0.0  # 返回错误的请求比例
+    error_status: int = 500  # 错误响应的状态码（如 500、429、503）
+    seed: Optional[int] = None  # 随机数种子，固定后错误和波动可复现
+
+
+def reply_tokens(count: int) -> List[str]:
+    """生成指定数量的回复token"""
+    return [REPLY_TEXT[i % len(REPLY_TEXT)] for i in range(count)]
+
+
+def create_mock_app(config: Optional[MockLLMConfig] = None) -> FastAPI:
+    """创建模拟上游应用"""
+    config = config or MockLLMConfig()
+    rng = random.Random(config.seed)
+    stats = {"requests": 0, "streams": 0, "errors": 0, "tokens": 0}
+
+    app = FastAPI(title="Mock LLM")
+    app.state.config = config
+    app.state.stats = stats
+
+    def delay(ms: float) -> float:
+        """带随机波动的延迟（秒）"""
+        if config.jitter > 0:
+            ms *= 1 + rng.uniform(-config.jitter, config.jitter)
+        return max(0.0, ms) / 1000
+
+    def chunk(completion_id: str, model: str, delta: Dict[str, Any], finish_reason: Optional[str] = None) -> str:
+        """一帧流式响应"""
+        data = {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+        }
+        return f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        model = body.get("model") or "mock-model"
+        stats["requests"] += 1
+        if config.error_rate > 0 and rng.random() < config.error_rate:
+            stats["errors"] += 1
+            return JSONResponse(
+                {"error": {"message": "mock upstream error", "type": "server_error", "code": None}},
+                status_code=config.error_status,
+            )
+
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        tokens = reply_tokens(config.reply_tokens)
+        stats["tokens"] += len(tokens)
+
+        if body.get("stream"):
+            stats["streams"] += 1
+
+            async def generate():
+                await asyncio.sleep(delay(config.ttft_ms))
+                yield chunk(completion_id, model, {"role": "assistant", "content": ""})
+                for i, token in enumerate(tokens):
+                    if i:
+                        await asyncio.sleep(delay(config.token_delay_ms))
+                    yield chunk(completion_id, model, {"content": token})
+                yield chunk(completion_id, model, {}, "stop")
+                yield "data: [DONE]\n\n"
+
+            return StreamingResponse(generate(), media_type="text/event-stream")
+
+        # 非流式：等待生成全部token的时间后一次返回
+        await asyncio.sleep(delay(config.ttft_ms) + delay(config.token_delay_ms) * max(0, len(tokens) - 1))
+        prompt_tokens = sum(len(str(message.get("content", ""))) for message in body.get("messages", []))
+        return {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [
+                {"index": 0, "message": {"role": "assistant", "content": "".join(tokens)}, "finish_reason": "stop"}
+            ],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": len(tokens),
+                "total_tokens": prompt_tokens + len(tokens),
+            },
+        }
+
+    @app.get("/v1/models")
+    async def list_models():
+        return {"object": "list", "data": [{"id": "mock-model", "object": "model", "owned_by": "benchmarks"}]}
+
+    @app.get("/stats")
+    async def get_stats():
+        return stats
+
+    return app
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    """解析命令行参数"""
+    defaults = MockLLMConfig()
+    parser = argparse.ArgumentParser(description="模拟的 OpenAI 兼容上游")
+    parser.add_argument("--host", default="127.0.0.1", help="监听地址")
+    parser.add_argument("--port", type=int, default=9000, help="监听端口")
+    parser.add_argument("--ttft-ms", type=float, default=defaults.ttft_ms, help="首个token的延迟（毫秒）")
+    parser.add_argument("--token-delay-ms", type=float, default=defaults.token_delay_ms, help="相邻token的间隔（毫秒）")
+    parser.add_argument("--reply-tokens", type=int, default=defaults.reply_tokens, help="每个回复的token数")
+    parser.add_argument("--jitter", type=float, default=defaults.jitter, help="延迟的随机波动比例")
+    parser.add_argument("--error-rate", type=float, default=defaults.error_rate, help="返回错误的请求比例")
+    parser.add_argument("--error-status", type=int, default=defaults.error_status, help="错误响应的状态码")
+    parser.add_argument("--seed", type=int, default=None, help="随机数种子")
+    return parser.parse_args(argv)
+
+
+def config_from_args(args: argparse.Namespace) -> MockLLMConfig:
+    """根据命令行参数构建配置"""
+    return MockLLMConfig(
+        ttft_ms=args.ttft_ms,
+        token_delay_ms=args.token_delay_ms,
+        reply_tokens=args.reply_tokens,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        seed=args.seed,
+    )
+
+
+def main(argv=None):
+    """启动模拟上游"""
+    import uvicorn
+
+    args = parse_args(argv)
+    uvicorn.run(create_mock_app(config_from_args(args)), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
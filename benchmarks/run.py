@@ -0,0 +1,238 @@
+"""
+基准测试入口
+启动模拟上游和 Birdiland 服务（各自独立进程、随机空闲端口），依次运行各负载模式，
+结果以 JSON 输出，便于在不同提交之间用 benchmarks.compare 对比
+
+    python -m benchmarks.run --modes chat,stream --concurrency 16 --requests 200 --output results/head.json
+    python -m benchmarks.run --target http://127.0.0.1:8000 --modes stream   # 测试已在运行的服务
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+import httpx
+
+from .load import MODES, run_load
+from .mock_llm import MockLLMConfig, config_from_args
+
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def free_port() -> int:
+    """获取一个空闲端口"""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_ready(url: str, process: Optional[subprocess.Popen] = None, timeout: float = 60.0):
+    """轮询直到地址返回200"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError(f"进程已退出（返回码 {process.returncode}）: {' '.join(process.args)}")
+        try:
+            if httpx.get(url, timeout=1.0).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"等待服务就绪超时: {url}")
+
+
+@contextmanager
+def spawn(args: List[str], env: Dict[str, str], ready_url: str, log_path: Optional[Path]) -> Iterator[subprocess.Popen]:
+    """启动子进程并等待就绪，退出时终止"""
+    log = open(log_path, "w", encoding="utf-8") if log_path else subprocess.DEVNULL
+    process = subprocess.Popen(
+        [sys.executable, *args], cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT
+    )
+    try:
+        wait_ready(ready_url, process)
+        yield process
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            process.kill()
+        if log_path:
+            log.close()
+
+
+def server_env(mock_url: str, workers: int = 1, data_dir: Optional[str] = None) -> Dict[str, str]:
+    """
+    Birdiland 服务的环境变量：上游指向模拟服务，会话存储未显式设置时单进程使用内存存储，
+    多个工作进程使用 data_dir 中的临时 SQLite 数据库（多进程必须共享会话存储）
+    """
+    env = dict(os.environ)
+    env["OPENAI_BASE_URL"] = f"{mock_url}/v1"
+    env["OPENAI_API_KEY"] = "bench"
+    env.setdefault("MODEL_NAME", "mock-model")
+    if workers > 1:
+        if env.get("SESSION_BACKEND") not in ("sqlite", "redis"):
+            env["SESSION_BACKEND"] = "sqlite"
+            env["SESSION_SQLITE_PATH"] = str(Path(data_dir or tempfile.gettempdir()) / "sessions.db")
+    else:
+        env.setdefault("SESSION_BACKEND", "memory")
+    env.setdefault("ASSET_BUILD_ON_STARTUP", "false")
+    env.setdefault("STARTUP_REPORT", "false")
+    return env
+
+
+def git_commit() -> str:
+    """当前提交（工作区有改动时附加 -dirty）"""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+        dirty = subprocess.run(["git", "diff", "--quiet", "HEAD"], cwd=ROOT).returncode != 0
+        return f"{commit}-dirty" if dirty else commit
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def fetch_stats(url: str) -> Dict[str, Any]:
+    """读取统计接口（失败时返回空字典）"""
+    try:
+        return httpx.get(url, timeout=5.0).json()
+    except (httpx.HTTPError, ValueError):
+        return {}
+
+
+def run_modes(base_url: str, args: argparse.Namespace) -> List[Dict[str, Any]]:
+    """依次运行各负载模式（每个模式先以少量请求预热）"""
+    runs = []
+    for mode in args.modes:
+        if args.warmup:
+            asyncio.run(run_load(base_url, mode, args.concurrency, args.warmup, args.agent_id))
+        result = asyncio.run(
+            run_load(base_url, mode, args.concurrency, args.requests, args.agent_id, timeout=args.timeout)
+        )
+        print(format_run(result))
+        runs.append(result)
+    return runs
+
+
+def format_run(result: Dict[str, Any]) -> str:
+    """单个模式结果的摘要行"""
+    ttft, itl, latency = result["ttft_ms"], result["itl_ms"], result["latency_ms"]
+    return (
+        f"[{result['mode']}] {result['ok']}/{result['requests']} 成功, {result['throughput_rps']} req/s | "
+        f"TTFT p50/p95/p99 {ttft.get('p50', 0)}/{ttft.get('p95', 0)}/{ttft.get('p99', 0)} ms | "
+        f"ITL p50/p99 {itl.get('p50', 0)}/{itl.get('p99', 0)} ms | "
+        f"延迟 p50/p99 {latency.get('p50', 0)}/{latency.get('p99', 0)} ms"
+    )
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    """解析命令行参数"""
+    defaults = MockLLMConfig()
+    parser = argparse.ArgumentParser(description="Birdiland 基准测试")
+    parser.add_argument("--modes", default="chat,stream", help=f"负载模式，逗号分隔（可选: {','.join(MODES)}）")
+    parser.add_argument("--concurrency", type=int, default=8, help="并发用户数")
+    parser.add_argument("--requests", type=int, default=100, help="每个模式的请求总数")
+    parser.add_argument("--warmup", type=int, default=5, help="每个模式正式测量前的预热请求数")
+    parser.add_argument("--agent-id", default="canary", help="对话的agent")
+    parser.add_argument("--timeout", type=float, default=120.0, help="单个请求的超时时间（秒）")
+    parser.add_argument("--target", default="", help="测试已在运行的服务（不启动模拟上游和服务）")
+    parser.add_argument("--workers", type=int, default=1, help="服务的工作进程数（需要共享会话存储）")
+    parser.add_argument("--output", default="", help="结果 JSON 文件路径")
+    parser.add_argument("--log-dir", default="", help="保存模拟上游和服务日志的目录")
+    # 模拟上游的参数
+    parser.add_argument("--ttft-ms", type=float, default=defaults.ttft_ms, help="模拟上游首个token的延迟（毫秒）")
+    parser.add_argument("--token-delay-ms", type=float, default=defaults.token_delay_ms, help="模拟上游token间隔（毫秒）")
+    parser.add_argument("--reply-tokens", type=int, default=defaults.reply_tokens, help="模拟上游每个回复的token数")
+    parser.add_argument("--jitter", type=float, default=defaults.jitter, help="模拟上游延迟的随机波动比例")
+    parser.add_argument("--error-rate", type=float, default=defaults.error_rate, help="模拟上游返回错误的比例")
+    parser.add_argument("--error-status", type=int, default=defaults.error_status, help="模拟上游错误的状态码")
+    parser.add_argument("--seed", type=int, default=None, help="模拟上游的随机数种子")
+    args = parser.parse_args(argv)
+    args.modes = [mode.strip() for mode in args.modes.split(",") if mode.strip()]
+    unknown = [mode for mode in args.modes if mode not in MODES]
+    if unknown:
+        parser.error(f"未知的负载模式: {', '.join(unknown)}")
+    return args
+
+
+def main(argv=None):
+    """运行基准测试"""
+    args = parse_args(argv)
+    mock_config = config_from_args(args)
+    meta = {
+        "commit": git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": sys.version.split()[0],
+        "modes": args.modes,
+        "concurrency": args.concurrency,
+        "requests": args.requests,
+        "workers": args.workers,
+        "target": args.target or None,
+        "mock": None if args.target else mock_config.model_dump(),
+    }
+
+    if args.target:
+        base_url = args.target.rstrip("/")
+        runs = run_modes(base_url, args)
+        result = {"meta": meta, "runs": runs, "server_stats": fetch_stats(f"{base_url}/api/v1/stats")}
+    else:
+        log_dir = Path(args.log_dir) if args.log_dir else None
+        if log_dir:
+            log_dir.mkdir(parents=True, exist_ok=True)
+        mock_port, server_port = free_port(), free_port()
+        mock_url = f"http://127.0.0.1:{mock_port}"
+        base_url = f"http://127.0.0.1:{server_port}"
+
+        mock_args = [
+            "-m", "benchmarks.mock_llm", "--port", str(mock_port),
+            "--ttft-ms", str(args.ttft_ms), "--token-delay-ms", str(args.token_delay_ms),
+            "--reply-tokens", str(args.reply_tokens), "--jitter", str(args.jitter),
+            "--error-rate", str(args.error_rate), "--error-status", str(args.error_status),
+        ]
+        if args.seed is not None:
+            mock_args += ["--seed", str(args.seed)]
+        server_args = ["-m", "birdiland.main", "--host", "127.0.0.1", "--port", str(server_port)]
+        if args.workers > 1:
+            server_args += ["--workers", str(args.workers)]
+        if "gradio" not in args.modes:
+            # 只测API时不加载聊天界面，启动更快
+            server_args.append("--api-only")
+
+        with tempfile.TemporaryDirectory(prefix="birdiland-bench-") as data_dir, spawn(
+            mock_args, dict(os.environ), f"{mock_url}/stats", log_dir and log_dir / "mock_llm.log"
+        ):
+            env = server_env(mock_url, args.workers, data_dir)
+            with spawn(server_args, env, f"{base_url}/api/v1/health", log_dir and log_dir / "server.log"):
+                runs = run_modes(base_url, args)
+                result = {
+                    "meta": meta,
+                    "runs": runs,
+                    "server_stats": fetch_stats(f"{base_url}/api/v1/stats"),
+                    # 上游错误时服务返回降级回复，请求本身成功；上游实际返回的错误数见此处
+                    "mock_stats": fetch_stats(f"{mock_url}/stats"),
+                }
+
+    output = json.dumps(result, ensure_ascii=False, indent=2)
+    if args.output:
+        path = Path(args.output)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(output + "\n", encoding="utf-8")
+        print(f"📄 结果已保存: {path}")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,225 @@
+"""
+准入控制
+限制全局和每个agent的并发请求数，超出时进入有界的优先级等待队列，
+队列已满或等待超时则快速拒绝，避免负载高峰时所有请求一起变慢
+"""
+
+import asyncio
+import bisect
+import itertools
+import math
+import time
+from typing import Dict, List, Optional
+
+from .config import settings
+
+
+# 优先级类别（数值越小越优先）
+PRIORITY_CLASSES: Dict[str, int] = {
+    "interactive": 0,
+    "default": 1,
+    "batch": 2,
+}
+
+
+class AdmissionRejected(Exception):
+    """请求被准入控制拒绝"""
+
+    def __init__(self, status_code: int, detail: str, retry_after: int):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = retry_after
+
+
+class AdmissionTicket:
+    """已获得的执行名额（release 可重复调用）"""
+
+    def __init__(self, controller: "AdmissionController", agent_id: str):
+        self.controller = controller
+        self.agent_id = agent_id
+        self.acquired_at = time.monotonic()
+        self.released = False
+
+    def release(self):
+        """释放名额"""
+        if not self.released:
+            self.released = True
+            self.controller._release(self)
+
+
+class _Waiter:
+    """队列中等待名额的请求"""
+
+    __slots__ = ("order", "agent_id", "future", "enqueued_at")
+
+    def __init__(self, order: tuple, agent_id: str, future: asyncio.Future):
+        self.order = order
+        self.agent_id = agent_id
+        self.future = future
+        self.enqueued_at = time.monotonic()
+
+    def __lt__(self, other: "_Waiter") -> bool:
+        return self.order < other.order
+
+
+class AdmissionController:
+    """准入控制器"""
+
+    def __init__(
+        self,
+        max_concurrency: Optional[int] = None,
+        max_per_agent: Optional[int] = None,
+        queue_size: Optional[int] = None,
+        queue_timeout: Optional[float] = None,
+    ):
+        self.max_concurrency = max_concurrency or settings.ADMISSION_MAX_CONCURRENCY
+        self.max_per_agent = max_per_agent or settings.ADMISSION_MAX_PER_AGENT
+        self.queue_size = queue_size if queue_size is not None else settings.ADMISSION_QUEUE_SIZE
+        self.queue_timeout = queue_timeout if queue_timeout is not None else settings.ADMISSION_QUEUE_TIMEOUT
+
+        self.active = 0
+        self.active_per_agent: Dict[str, int] = {}
+        # 按 (优先级, 到达顺序) 排序的等待队列
+        self._waiters: List[_Waiter] = []
+        self._counter = itertools.count()
+
+        # 统计信息
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.avg_hold = 0.0  # 名额平均占用时间（指数移动平均，用于估算 Retry-After）
+
+    @property
+    def queue_depth(self) -> int:
+        """当前排队的请求数"""
+        return len(self._waiters)
+
+    def _can_run(self, agent_id: str) -> bool:
+        """是否还有空闲名额"""
+        return (
+            self.active < self.max_concurrency
+            and self.active_per_agent.get(agent_id, 0) < self.max_per_agent
+        )
+
+    def _grant(self, agent_id: str, waited: float) -> AdmissionTicket:
+        """分配名额"""
+        self.active += 1
+        self.active_per_agent[agent_id] = self.active_per_agent.get(agent_id, 0) + 1
+        self.admitted += 1
+        self.total_wait += waited
+        self.max_wait = max(self.max_wait, waited)
+        return AdmissionTicket(self, agent_id)
+
+    def retry_after(self) -> int:
+        """估算客户端应在多少秒后重试"""
+        hold = self.avg_hold or 1.0
+        return max(1, math.ceil(hold * (self.queue_depth + 1) / self.max_concurrency))
+
+    async def acquire(self, agent_id: str, priority: str = "interactive") -> AdmissionTicket:
+        """
+        获取执行名额
+
+        Raises:
+            AdmissionRejected: 等待队列已满（429）或等待超时（503）
+        """
+        # 有空闲名额且无人排队时直接执行
+        if self._can_run(agent_id) and not self._waiters:
+            return self._grant(agent_id, 0.0)
+
+        if len(self._waiters) >= self.queue_size:
+            self.rejected += 1
+            raise AdmissionRejected(429, "请求过多，请稍后重试", self.retry_after())
+
+        order = (PRIORITY_CLASSES.get(priority, PRIORITY_CLASSES["default"]), next(self._counter))
+        waiter = _Waiter(order, agent_id, asyncio.get_running_loop().create_future())
+        bisect.insort(self._waiters, waiter)
+        # 排在前面的等待者可能因所属agent已满而阻塞，此时新请求可以直接执行
+        self._dispatch()
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), self.queue_timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # 名额已分配但等待方已放弃，归还给下一个等待者
+                waiter.future.result().release()
+            else:
+                waiter.future.cancel()
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+            if isinstance(e, asyncio.TimeoutError):
+                self.timed_out += 1
+                raise AdmissionRejected(503, "服务繁忙，请稍后重试", self.retry_after()) from None
+            raise
+        return waiter.future.result()
+
+    def slot(self, agent_id: str, priority: str = "interactive") -> "_SlotContext":
+        """以 async with 方式获取并自动释放名额"""
+        return _SlotContext(self, agent_id, priority)
+
+    def _release(self, ticket: AdmissionTicket):
+        """归还名额并唤醒可以执行的等待者"""
+        self.active -= 1
+        remaining = self.active_per_agent.get(ticket.agent_id, 1) - 1
+        if remaining > 0:
+            self.active_per_agent[ticket.agent_id] = remaining
+        else:
+            self.active_per_agent.pop(ticket.agent_id, None)
+
+        hold = time.monotonic() - ticket.acquired_at
+        self.avg_hold = hold if not self.avg_hold else 0.9 * self.avg_hold + 0.1 * hold
+        self._dispatch()
+
+    def _dispatch(self):
+        """按优先级顺序为可以执行的等待者分配名额（跳过所属agent已满的等待者）"""
+        index = 0
+        now = time.monotonic()
+        while index < len(self._waiters) and self.active < self.max_concurrency:
+            waiter = self._waiters[index]
+            if waiter.future.done():
+                self._waiters.pop(index)
+                continue
+            if self._can_run(waiter.agent_id):
+                self._waiters.pop(index)
+                waiter.future.set_result(self._grant(waiter.agent_id, now - waiter.enqueued_at))
+                continue
+            index += 1
+
+    def stats(self) -> Dict[str, object]:
+        """获取准入控制统计信息"""
+        return {
+            "active": self.active,
+            "active_per_agent": dict(self.active_per_agent),
+            "queue_depth": self.queue_depth,
+            "max_concurrency": self.max_concurrency,
+            "max_per_agent": self.max_per_agent,
+            "queue_size": self.queue_size,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+            "avg_wait_ms": round(self.total_wait / self.admitted * 1000, 1) if self.admitted else 0.0,
+            "max_wait_ms": round(self.max_wait * 1000, 1),
+        }
+
+
+class _SlotContext:
+    """AdmissionController.slot 返回的异步上下文"""
+
+    def __init__(self, controller: AdmissionController, agent_id: str, priority: str):
+        self.controller = controller
+        self.agent_id = agent_id
+        self.priority = priority
+        self.ticket: Optional[AdmissionTicket] = None
+
+    async def __aenter__(self) -> AdmissionTicket:
+        self.ticket = await self.controller.acquire(self.agent_id, self.priority)
+        return self.ticket
+
+    async def __aexit__(self, *exc_info):
+        if self.ticket is not None:
+            self.ticket.release()
+
+
+# 全局准入控制器实例
+admission_controller = AdmissionController()
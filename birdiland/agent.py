@@ -5,103 +5,253 @@ Birdiland 数字人代理
 
 import os
 import json
+import random
 import asyncio
-from typing import List, Dict, Any, AsyncGenerator
-from openai import AsyncOpenAI
+from collections import OrderedDict
+from typing import List, Dict, Any, AsyncGenerator, Optional
 from .config import settings
+from .llm import get_client, get_hedge_client, upstream_slot
+from .session import DEFAULT_SESSION_ID, Session, SessionStore
+from .storage import create_session_store
+from .context import pack_turns
+from .summarizer import RollingSummarizer
+from .prompts import get_system_prompt, invalidate_system_prompts
+from .registry import profile_registry
+from .cache import ResponseCache, iter_chunks, make_cache_key, response_cache
+from .emotion import EmotionTracker, get_lexicon
+from .emotion_model import emotion_classifier
+from .singleflight import SingleFlight, inflight_requests
+from .resilience import upstream_guard
+from .tokenizer import count_message_tokens
 
 
-# 定义所有agent的个人资料（统一数据源）
-AGENT_PROFILES = {
-    "canary": {
-        "name": "Canary",
-        "personality": "一个友好、聪明、富有同情心的AI助手，喜欢帮助他人，对世界充满好奇心",
-        "interests": ["学习新事物", "帮助他人", "艺术创作", "科技发展", "自然探索"],
-        "speaking_style": "温暖、自然、富有同理心，喜欢用积极的方式与人交流",
-        "background": "我是一个AI驱动的数字人，专门设计来与人类进行有意义的对话和提供帮助",
-        "avatar": "images/canary/avatar.png",
-        "full_image": "images/canary/full.png"
-    },
-    "snow_fairy": {
-        "name": "Snow Fairy",
-        "personality": "神秘、优雅、充满智慧，对宇宙和自然有着深刻的理解",
-        "interests": ["冰雪魔法", "星空观测", "古老传说", "哲学思考", "自然探索"],
-        "speaking_style": "诗意、富有哲理、略带神秘感，喜欢用比喻和象征来表达",
-        "background": "来自北极冰雪王国的精灵，掌握着古老的冰雪魔法，喜欢在星空下思考宇宙的奥秘",
-        "avatar": "images/snow_fairy/avatar.png",
-        "full_image": "images/snow_fairy/full.png"
-    }
-}
+# 所有agent的个人资料（统一数据源：资料目录中的文件，变化时自动重新加载）
+AGENT_PROFILES = profile_registry
+
+
+# 默认agent（未知agent_id时使用其资料）
+DEFAULT_AGENT_ID = "canary"
 
 
 class BirdilandAgent:
     """Birdiland 数字人代理类（表示特定的agent）"""
     
-    def __init__(self, agent_id: str):
+    def __init__(self, agent_id: str, session_store: Optional[SessionStore] = None):
         """初始化数字人代理"""
-        self.client = AsyncOpenAI(
-            api_key=settings.OPENAI_API_KEY,
-            base_url=settings.OPENAI_BASE_URL,
-            timeout=30.0  # 添加超时设置
-        )
+        # 所有agent共享同一个上游客户端和连接池
+        self.client = get_client()
         self.model = settings.MODEL_NAME
         self.agent_id = agent_id
         
-        # 设置角色配置
-        self.character_profile = AGENT_PROFILES.get(agent_id)
+        # 采样参数
+        self.temperature = 0.7
+        self.max_tokens = 500
+        
+        # 对话历史管理（按session_id区分，可由多个agent共享同一个存储）
+        self.sessions = session_store if session_store is not None else SessionStore()
         
-        # 对话历史管理（单个agent的对话历史）
-        self.conversation_history: List[Dict[str, str]] = []
+        # 最大对话历史长度（每个会话）
+        self.max_history_length = settings.HISTORY_MAX_MESSAGES
         
-        # 最大对话历史长度
-        self.max_history_length = 10
+        # 提示词token预算
+        self.context_token_budget = settings.CONTEXT_TOKEN_BUDGET
+        
+        # 滚动摘要器（移出窗口的旧消息折叠进摘要）
+        self.summarizer = RollingSummarizer(self.client, self.model, self.sessions) if settings.SUMMARY_ENABLED else None
+        
+        # 回复缓存（可选，相同提示词直接复用回复）
+        self.response_cache: Optional[ResponseCache] = response_cache if settings.RESPONSE_CACHE_ENABLED else None
+        
+        # 合并相同的并发上游请求
+        self.inflight: Optional[SingleFlight] = inflight_requests if settings.SINGLEFLIGHT_ENABLED else None
+    
+    @property
+    def character_profile(self) -> Dict[str, Any]:
+        """角色资料（每次读取注册表，资料热重载后立即生效；未知agent_id回退到默认agent）"""
+        return AGENT_PROFILES.get(self.agent_id) or AGENT_PROFILES[DEFAULT_AGENT_ID]
+    
+    @property
+    def conversation_history(self) -> List[Dict[str, str]]:
+        """默认会话的对话历史"""
+        return self.get_conversation_history(DEFAULT_SESSION_ID)
+    
+    def get_conversation_history(self, session_id: str = DEFAULT_SESSION_ID) -> List[Dict[str, str]]:
+        """获取指定会话的对话历史"""
+        session = self.sessions.get(self.agent_id, session_id)
+        return session.history if session is not None else []
     
     def _build_system_prompt(self) -> str:
-        """构建系统提示词"""
-        profile = self.character_profile
-        return f"""
-        你是{profile['name']}，一个AI驱动的数字人。
-
-        性格特点：{profile['personality']}
-        兴趣爱好：{', '.join(profile['interests'])}
-        说话风格：{profile['speaking_style']}
-        背景：{profile['background']}
-
-        请以自然、友好的方式与用户对话，展现你的个性和特点。
-        保持对话的连贯性和一致性，记住之前的对话内容。
-        如果用户询问你的个人信息，可以适当分享。
-        用中文进行对话，保持温暖和积极的态度。
-        """
+        """构建系统提示词（使用预编译缓存）"""
+        return get_system_prompt(self.agent_id, self.character_profile).text
     
-    def _update_conversation_history(self, role: str, content: str):
+    def _update_conversation_history(self, role: str, content: str, session_id: str = DEFAULT_SESSION_ID):
         """更新对话历史"""
-        self.conversation_history.append({"role": role, "content": content})
+        session = self.sessions.get_or_create(self.agent_id, session_id, self.max_history_length)
+        self.sessions.append(session, role, content)
+    
+    def _record_exchange(self, message: str, reply: str, session_id: str) -> Optional[Session]:
+        """记录一轮对话（可在存储线程中执行），返回需要在后台折叠旧消息的会话"""
+        self._update_conversation_history("user", message, session_id)
+        self._update_conversation_history("assistant", reply, session_id)
         
-        # 保持历史长度不超过限制
-        if len(self.conversation_history) > self.max_history_length:
-            self.conversation_history.pop(0)
+        session = self.sessions.get(self.agent_id, session_id)
+        if session is None:
+            return None
+        if self.summarizer is None and session.pending_summary:
+            session.pending_summary.clear()
+            session.summarized_seq = session.window_start
+            self.sessions.save(session)
+        return session
     
-    def _build_messages(self, user_message: str) -> List[Dict[str, str]]:
-        """构建完整的消息列表"""
+    async def _finish_exchange(self, message: str, reply: str, session_id: str):
+        """记录一轮对话，并在后台折叠移出窗口的旧消息"""
+        session = await self.sessions.run(self._record_exchange, message, reply, session_id)
+        if session is not None and self.summarizer is not None:
+            self.summarizer.schedule(session)
+    
+    def _cache_key(self, messages: List[Dict[str, str]]) -> str:
+        """计算回复缓存键"""
+        return make_cache_key(
+            self.agent_id,
+            self.model,
+            messages,
+            temperature=self.temperature,
+            max_tokens=self.max_tokens,
+        )
+    
+    def _get_cached_response(self, messages: List[Dict[str, str]]) -> Optional[str]:
+        """读取缓存的回复（未启用缓存时返回None）"""
+        if self.response_cache is None:
+            return None
+        return self.response_cache.get(self._cache_key(messages))
+    
+    def _cache_response(self, messages: List[Dict[str, str]], response: str):
+        """缓存回复"""
+        if self.response_cache is not None and response:
+            self.response_cache.put(self._cache_key(messages), response)
+    
+    def _build_messages(self, user_message: str, session_id: str = DEFAULT_SESSION_ID) -> List[Dict[str, str]]:
+        """
+        构建完整的消息列表
+        
+        消息顺序为 系统提示 -> 摘要 -> 历史 -> 当前消息，窗口起点只在超出预算时
+        才推进（并一次推进到低水位），使前缀在多轮对话间保持字节级一致，
+        从而命中上游的提示词前缀缓存。
+        """
+        system_prompt = get_system_prompt(self.agent_id, self.character_profile)
         messages = [
-            {"role": "system", "content": self._build_system_prompt()}
+            {"role": "system", "content": system_prompt.text}
         ]
         
-        # 添加对话历史
-        messages.extend(self.conversation_history)
+        session = self.sessions.get(self.agent_id, session_id)
+        if session is not None:
+            budget = (
+                self.context_token_budget
+                - system_prompt.tokens
+                - count_message_tokens(user_message)
+            )
+            
+            # 已移出窗口的旧对话以摘要形式提供
+            if session.summary:
+                summary_content = f"之前对话的摘要：{session.summary}"
+                messages.append({"role": "system", "content": summary_content})
+                budget -= count_message_tokens(summary_content)
+            
+            # 在token预算内添加对话历史（从最新到最旧），放不下的旧消息移出窗口等待摘要
+            window = session.window_turns()
+            packed = pack_turns(window, budget)
+            if len(packed) < len(window):
+                # 推进到低水位，为后续若干轮留出空间，避免每轮都改变前缀
+                packed = pack_turns(window, int(budget * settings.CONTEXT_LOW_WATERMARK))
+                session.advance_window(packed[0].seq if packed else session.next_seq)
+                self.sessions.save(session)
+            messages.extend(turn.to_message() for turn in packed)
         
         # 添加当前用户消息
         messages.append({"role": "user", "content": user_message})
         
         return messages
     
-    async def chat(self, message: str, stream: bool = False) -> str:
+    def _hedge_target(self) -> Optional[tuple]:
+        """对冲请求使用的 (客户端, 模型)，未配置时返回None"""
+        client = get_hedge_client()
+        if client is None:
+            return None
+        return client, settings.UPSTREAM_HEDGE_MODEL or self.model
+    
+    async def _request_completion(self, client, model: str, messages: List[Dict[str, str]]) -> str:
+        """向指定上游请求完整回复"""
+        async with upstream_slot():
+            response = await client.chat.completions.create(
+                model=model,
+                messages=messages,
+                temperature=self.temperature,
+                max_tokens=self.max_tokens
+            )
+        return response.choices[0].message.content
+    
+    async def _request_stream(self, client, model: str, messages: List[Dict[str, str]]) -> AsyncGenerator[str, None]:
+        """向指定上游请求流式回复（读取完整个流之前一直占用上游名额）"""
+        async with upstream_slot():
+            response = await client.chat.completions.create(
+                model=model,
+                messages=messages,
+                stream=True,
+                temperature=self.temperature,
+                max_tokens=self.max_tokens
+            )
+            
+            async for chunk in response:
+                if chunk.choices and chunk.choices[0].delta.content is not None:
+                    yield chunk.choices[0].delta.content
+    
+    async def _complete(self, messages: List[Dict[str, str]]) -> str:
+        """调用上游生成完整回复（熔断、重试，超时未返回时发起对冲请求）"""
+        hedge = self._hedge_target()
+        return await upstream_guard.call(
+            lambda: self._request_completion(self.client, self.model, messages),
+            (lambda: self._request_completion(*hedge, messages)) if hedge else None,
+        )
+    
+    def _stream_completion(self, messages: List[Dict[str, str]]) -> AsyncGenerator[str, None]:
+        """调用上游流式生成回复（熔断、重试，首个token超时未到达时发起对冲请求）"""
+        hedge = self._hedge_target()
+        return upstream_guard.stream(
+            lambda: self._request_stream(self.client, self.model, messages),
+            (lambda: self._request_stream(*hedge, messages)) if hedge else None,
+        )
+    
+    def _fallback_response(self, message: str) -> str:
+        """上游不可用时的降级回复（流式与非流式共用）"""
+        name = self.character_profile["name"]
+        fallback_responses = [
+            f"你好！我是{name}。你说了：{message}",
+            f"很高兴和你聊天！你刚才说：{message}",
+            f"我注意到你说：{message}。虽然目前AI服务暂时不可用，但我还是很乐意和你交流！"
+        ]
+        return random.choice(fallback_responses)
+    
+    def _coalesced_stream(self, messages: List[Dict[str, str]]) -> AsyncGenerator[str, None]:
+        """流式生成回复；相同的并发请求共享同一个上游流"""
+        if self.inflight is None:
+            return self._stream_completion(messages)
+        return self.inflight.stream(self._cache_key(messages), lambda: self._stream_completion(messages))
+    
+    async def chat(
+        self,
+        message: str,
+        stream: bool = False,
+        session_id: str = DEFAULT_SESSION_ID,
+        fallback: bool = True,
+    ) -> str:
         """
         与数字人进行对话
         
         Args:
             message: 用户消息
             stream: 是否使用流式响应
+            session_id: 会话ID
+            fallback: 上游不可用时是否返回降级回复（否则抛出异常，由调用方报告错误）
             
         Returns:
             数字人的回复
@@ -109,92 +259,87 @@ class BirdilandAgent:
         try:
             # 检查API配置
             if not settings.OPENAI_API_KEY or settings.OPENAI_API_KEY == "":
+                if not fallback:
+                    raise RuntimeError("AI服务未配置")
                 return "你好！我是Canary。目前AI服务正在配置中，暂时无法提供智能对话。"
             
-            messages = self._build_messages(message)
+            messages = await self.sessions.run(self._build_messages, message, session_id)
+            
+            # 命中缓存时跳过上游调用
+            cached = self._get_cached_response(messages)
+            if cached is not None:
+                await self._finish_exchange(message, cached, session_id)
+                return cached
             
             if stream:
                 # 流式响应
-                response = await self.client.chat.completions.create(
-                    model=self.model,
-                    messages=messages,
-                    stream=True,
-                    temperature=0.7,
-                    max_tokens=500
-                )
-                
-                full_response = ""
-                async for chunk in response:
-                    if chunk.choices[0].delta.content is not None:
-                        content = chunk.choices[0].delta.content
-                        full_response += content
+                parts = [content async for content in self._coalesced_stream(messages)]
+                full_response = "".join(parts)
                 
                 # 更新对话历史
-                self._update_conversation_history("user", message)
-                self._update_conversation_history("assistant", full_response)
+                self._cache_response(messages, full_response)
+                await self._finish_exchange(message, full_response, session_id)
                 
                 return full_response
             else:
-                # 非流式响应
-                response = await self.client.chat.completions.create(
-                    model=self.model,
-                    messages=messages,
-                    temperature=0.7,
-                    max_tokens=500
-                )
-                
-                assistant_response = response.choices[0].message.content
+                # 非流式响应（相同的并发请求只调用一次上游）
+                if self.inflight is not None:
+                    assistant_response = await self.inflight.do(
+                        self._cache_key(messages), lambda: self._complete(messages)
+                    )
+                else:
+                    assistant_response = await self._complete(messages)
                 
                 # 更新对话历史
-                self._update_conversation_history("user", message)
-                self._update_conversation_history("assistant", assistant_response)
+                self._cache_response(messages, assistant_response)
+                await self._finish_exchange(message, assistant_response, session_id)
                 
                 return assistant_response
                 
-        except Exception as e:
-            # 如果API调用失败，返回友好的回退响应
-            fallback_responses = [
-                f"你好！我是Canary。你说了：{message}",
-                f"很高兴和你聊天！你刚才说：{message}",
-                f"我注意到你说：{message}。虽然目前AI服务暂时不可用，但我还是很乐意和你交流！"
-            ]
-            import random
-            return random.choice(fallback_responses)
+        except Exception:
+            if not fallback:
+                raise
+            # 如果API调用失败（含熔断快速失败），返回友好的回退响应
+            return self._fallback_response(message)
     
-    async def chat_stream(self, message: str) -> AsyncGenerator[str, None]:
+    async def chat_stream(self, message: str, session_id: str = DEFAULT_SESSION_ID) -> AsyncGenerator[str, None]:
         """
         流式对话响应
         
         Args:
             message: 用户消息
+            session_id: 会话ID
             
         Yields:
             流式响应的文本片段
         """
+        parts = []
         try:
-            messages = self._build_messages(message)
+            messages = await self.sessions.run(self._build_messages, message, session_id)
             
-            response = await self.client.chat.completions.create(
-                model=self.model,
-                messages=messages,
-                stream=True,
-                temperature=0.7,
-                max_tokens=500
-            )
-            
-            full_response = ""
-            async for chunk in response:
-                if chunk.choices[0].delta.content is not None:
-                    content = chunk.choices[0].delta.content
-                    full_response += content
+            # 命中缓存时以合成的流式片段回放
+            cached = self._get_cached_response(messages)
+            if cached is not None:
+                for content in iter_chunks(cached, settings.RESPONSE_CACHE_REPLAY_CHUNK_CHARS):
                     yield content
+                await self._finish_exchange(message, cached, session_id)
+                return
             
-            # 更新对话历史
-            self._update_conversation_history("user", message)
-            self._update_conversation_history("assistant", full_response)
+            async for content in self._coalesced_stream(messages):
+                parts.append(content)
+                yield content
+            full_response = "".join(parts)
             
-        except Exception as e:
-            yield f"抱歉，我在处理你的消息时遇到了问题：{str(e)}"
+            # 更新对话历史（回复流结束后再调度摘要，不影响首字延迟）
+            self._cache_response(messages, full_response)
+            await self._finish_exchange(message, full_response, session_id)
+            
+        except Exception:
+            # 与非流式一致的降级：尚未输出内容时返回回退回复，否则提示回复中断
+            if parts:
+                yield "……（连接中断，回复未完成）"
+            else:
+                yield self._fallback_response(message)
     
     def analyze_emotion(self, response: str) -> str:
         """
@@ -206,58 +351,79 @@ class BirdilandAgent:
         Returns:
             情感标签
         """
-        response_lower = response.lower()
-        
-        # 简单的情感分析
-        positive_words = ["开心", "高兴", "愉快", "兴奋", "喜欢", "爱", "美好", "很棒", "太好了"]
-        negative_words = ["难过", "伤心", "失望", "生气", "讨厌", "糟糕", "不好", "遗憾"]
-        neutral_words = ["知道", "了解", "明白", "理解", "思考", "考虑"]
-        
-        positive_count = sum(1 for word in positive_words if word in response_lower)
-        negative_count = sum(1 for word in negative_words if word in response_lower)
-        neutral_count = sum(1 for word in neutral_words if word in response_lower)
-        
-        if positive_count > negative_count and positive_count > neutral_count:
-            return "happy"
-        elif negative_count > positive_count and negative_count > neutral_count:
-            return "sad"
-        else:
-            return "neutral"
+        return get_lexicon(self.agent_id).analyze(response)
+    
+    async def analyze_emotion_async(self, response: str) -> str:
+        """分析回复的情感倾向（配置了本地模型时使用模型，否则使用情感词典）"""
+        return await emotion_classifier.classify(response, self.agent_id)
+    
+    def create_emotion_tracker(self) -> EmotionTracker:
+        """创建用于流式回复的增量情感分析器"""
+        return EmotionTracker(get_lexicon(self.agent_id))
     
-    def clear_conversation_history(self):
-        """清除对话历史"""
-        self.conversation_history.clear()
+    def clear_conversation_history(self, session_id: str = DEFAULT_SESSION_ID):
+        """清除指定会话的对话历史"""
+        self.sessions.clear(self.agent_id, session_id)
 
 
 class AgentManager:
-    """Agent管理器，管理多个BirdilandAgent实例"""
+    """
+    Agent管理器，管理多个BirdilandAgent实例
     
-    def __init__(self):
+    agent在首次使用时创建，最多保留 max_agents 个最近使用的实例；
+    agent本身不保存会话状态（历史在共享的会话存储中），被淘汰后再次使用时重新创建即可。
+    """
+    
+    def __init__(self, max_agents: Optional[int] = None):
         """初始化Agent管理器"""
-        self.agents: Dict[str, BirdilandAgent] = {}
-        self._initialize_agents()
+        self.agents: "OrderedDict[str, BirdilandAgent]" = OrderedDict()
+        self.max_agents = max_agents or settings.AGENT_CACHE_SIZE
+        # 所有agent共享同一个会话存储，统一限制会话数量和内存；
+        # 使用 sqlite/redis 后端时多个工作进程共享会话
+        self.session_store = create_session_store()
+        # agent列表缓存（资料版本变化时重建）
+        self._agent_list: List[Dict[str, Any]] = []
+        self._agent_list_version: Optional[str] = None
+        profile_registry.subscribe(self._on_profiles_changed)
     
-    def _initialize_agents(self):
-        """初始化所有agent实例"""
-        for agent_id in AGENT_PROFILES.keys():
-            self.agents[agent_id] = BirdilandAgent(agent_id)
+    def _on_profiles_changed(self, changed):
+        """资料文件重新加载：清除发生变化的agent的系统提示词，移除已删除agent的实例"""
+        profiles = profile_registry.snapshot()
+        for agent_id in changed:
+            invalidate_system_prompts(agent_id)
+            if agent_id not in profiles:
+                self.agents.pop(agent_id, None)
     
-    def get_agent(self, agent_id: str) -> BirdilandAgent:
-        """获取指定agent_id的实例"""
-        return self.agents.get(agent_id)
+    def get_agent(self, agent_id: str) -> Optional[BirdilandAgent]:
+        """获取指定agent_id的实例（首次使用时创建），agent不存在时返回None"""
+        if agent_id not in AGENT_PROFILES:
+            return None
+        agent = self.agents.get(agent_id)
+        if agent is None:
+            agent = BirdilandAgent(agent_id, self.session_store)
+            self.agents[agent_id] = agent
+            while len(self.agents) > self.max_agents:
+                self.agents.popitem(last=False)
+        else:
+            self.agents.move_to_end(agent_id)
+        return agent
     
     def get_available_agents(self) -> List[Dict[str, Any]]:
-        """获取可用的agent列表"""
-        agents_list = []
-        for agent_id, profile in AGENT_PROFILES.items():
-            agents_list.append({
-                "id": agent_id,
-                "name": profile["name"],
-                "description": f"{profile['personality']} - {profile['speaking_style']}",
-                "avatar": profile["avatar"],
-                "full_image": profile["full_image"]
-            })
-        return agents_list
+        """获取可用的agent列表（按资料版本缓存）"""
+        profiles = profile_registry.snapshot()
+        if self._agent_list_version != profile_registry.version:
+            self._agent_list = [
+                {
+                    "id": agent_id,
+                    "name": profile["name"],
+                    "description": f"{profile['personality']} - {profile['speaking_style']}",
+                    "avatar": profile["avatar"],
+                    "full_image": profile["full_image"]
+                }
+                for agent_id, profile in profiles.items()
+            ]
+            self._agent_list_version = profile_registry.version
+        return self._agent_list
 
 
 # 全局Agent管理器实例
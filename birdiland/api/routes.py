@@ -2,11 +2,26 @@
 API路由
 """
 
-from fastapi import APIRouter, HTTPException
+import asyncio
+import json
+import time
+
+from fastapi import APIRouter, Header, HTTPException, Query, Response, WebSocket, WebSocketDisconnect
 from fastapi.responses import StreamingResponse
-from pydantic import BaseModel
+from starlette.background import BackgroundTask
+from pydantic import BaseModel, ValidationError
+from typing import List, Optional
 
-from ..agent import agent_manager, AGENT_PROFILES
+from ..agent import agent_manager
+from ..config import settings
+from ..session import DEFAULT_SESSION_ID
+from ..cache import response_cache
+from ..emotion_model import emotion_classifier
+from ..admission import AdmissionRejected, admission_controller
+from ..resilience import upstream_guard
+from ..startup import startup_timer
+from ..sse import DONE_FRAME, HEARTBEAT_FRAME, format_event
+from ..service import get_agent_metadata, get_history_page, get_profile, list_agents, profiles_version, stream_reply
 
 router = APIRouter()
 
@@ -15,7 +30,29 @@ class ChatRequest(BaseModel):
     """聊天请求"""
     message: str
     agent_id: str = "canary"  # 添加agent_id参数
+    session_id: str = DEFAULT_SESSION_ID  # 会话ID，不同用户使用不同会话
     stream: bool = False
+    priority: str = "interactive"  # 优先级类别：interactive / default / batch
+
+
+class SocketMessage(BaseModel):
+    """WebSocket 客户端消息"""
+    type: str = "message"  # message：发送消息 / cancel：中断当前回复 / ping：心跳
+    message: str = ""
+    priority: str = "interactive"
+
+
+class BatchChatItem(BaseModel):
+    """批量聊天中的单条请求"""
+    message: str
+    agent_id: str = "canary"
+    session_id: str = DEFAULT_SESSION_ID
+
+
+class BatchChatRequest(BaseModel):
+    """批量聊天请求"""
+    items: List[BatchChatItem]
+    concurrency: Optional[int] = None  # 并发数，不超过服务端配置的上限
 
 
 class ChatResponse(BaseModel):
@@ -24,11 +61,10 @@ class ChatResponse(BaseModel):
     emotion: str = "neutral"
 
 
-class StreamResponse(BaseModel):
-    """流式响应"""
-    content: str
-    emotion: str = "neutral"
-    is_final: bool = False
+class EmotionRequest(BaseModel):
+    """批量情感分析请求"""
+    texts: List[str]
+    agent_id: Optional[str] = None  # 指定时叠加该agent的专属词典
 
 
 @router.get("/health")
@@ -37,6 +73,29 @@ async def health_check():
     return {"status": "healthy", "service": "Birdiland API"}
 
 
+@router.get("/stats")
+async def get_stats():
+    """获取会话存储、回复缓存、准入控制、上游熔断及启动耗时的统计信息"""
+    # 共享存储的统计需要查询数据库，在存储线程中执行
+    store = agent_manager.session_store
+    return {
+        "sessions": await store.run(store.stats),
+        "response_cache": response_cache.stats(),
+        "admission": admission_controller.stats(),
+        "upstream": upstream_guard.breaker.stats(),
+        "startup": startup_timer.stats(),
+    }
+
+
+def _rejected_exception(e: AdmissionRejected) -> HTTPException:
+    """将准入拒绝转换为带 Retry-After 的HTTP错误"""
+    return HTTPException(
+        status_code=e.status_code,
+        detail=e.detail,
+        headers={"Retry-After": str(e.retry_after)},
+    )
+
+
 @router.post("/chat")
 async def chat_with_birdiland(request: ChatRequest):
     """与Birdiland聊天"""
@@ -45,75 +104,258 @@ async def chat_with_birdiland(request: ChatRequest):
         agent = agent_manager.get_agent(request.agent_id)
         
         if request.stream:
-            # 流式响应
+            # 流式响应：先获取名额（被拒绝时直接返回错误码），整个流结束后释放
+            ticket = await admission_controller.acquire(request.agent_id, request.priority)
+            
             async def generate_stream():
-                full_response = ""
-                async for chunk in agent.chat_stream(request.message):
-                    full_response += chunk
+                try:
+                    event_id = 0
+                    async for event in stream_reply(
+                        agent, request.message, request.session_id, settings.SSE_HEARTBEAT_SECONDS
+                    ):
+                        if event is None:
+                            yield HEARTBEAT_FRAME
+                            continue
+                        event_id += 1
+                        yield format_event(event_id, event.content, event.emotion, event.is_final)
                     
-                    # 分析情感
-                    emotion = agent.analyze_emotion(full_response)
-                    
-                    # 发送部分响应
-                    stream_data = StreamResponse(
-                        content=chunk,
-                        emotion=emotion,
-                        is_final=False
-                    )
-                    yield f"data: {stream_data.model_dump_json()}\n\n"
-                
-                # 发送最终响应
-                final_emotion = agent.analyze_emotion(full_response)
-                stream_data = StreamResponse(
-                    content="",
-                    emotion=final_emotion,
-                    is_final=True
-                )
-                yield f"data: {stream_data.model_dump_json()}\n\n"
-                
-                # 发送结束信号
-                yield "data: [DONE]\n\n"
+                    # 发送结束信号
+                    yield DONE_FRAME
+                finally:
+                    ticket.release()
             
             return StreamingResponse(
                 generate_stream(),
-                media_type="text/plain; charset=utf-8"
+                media_type="text/event-stream",
+                headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+                # 生成器未启动（客户端提前断开）时也要释放名额
+                background=BackgroundTask(ticket.release)
             )
         else:
             # 非流式响应
-            response = await agent.chat(request.message, stream=False)
-            emotion = agent.analyze_emotion(response)
+            async with admission_controller.slot(request.agent_id, request.priority):
+                response = await agent.chat(request.message, stream=False, session_id=request.session_id)
+            emotion = await agent.analyze_emotion_async(response)
             
             return ChatResponse(
                 response=response,
                 emotion=emotion
             )
+    except AdmissionRejected as e:
+        raise _rejected_exception(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"聊天服务错误: {str(e)}")
 
 
+def _socket_event(event_type: str, **fields) -> str:
+    """构造一条 WebSocket 事件"""
+    return json.dumps({"type": event_type, **fields}, ensure_ascii=False)
+
+
+@router.websocket("/chat/ws")
+async def chat_websocket(websocket: WebSocket, agent_id: str = "canary", session_id: str = DEFAULT_SESSION_ID):
+    """
+    WebSocket 对话：一个连接对应一个会话，连接保持期间可以连续发送多条消息
+
+    客户端发送 message / cancel / ping 消息；服务端按顺序处理消息，发送
+    start、chunk（情感只在变化时携带）、end、cancelled、error 和 pong 事件。
+    发送队列有上限，客户端读取过慢时暂停读取上游，而不是在内存中堆积片段。
+    """
+    agent = agent_manager.get_agent(agent_id)
+    if agent is None:
+        await websocket.close(code=1008, reason=f"未知的agent: {agent_id}")
+        return
+    await websocket.accept()
+    
+    outbox: asyncio.Queue = asyncio.Queue(maxsize=settings.WS_SEND_QUEUE_SIZE)
+    inbox: asyncio.Queue = asyncio.Queue(maxsize=settings.WS_MAX_PENDING_MESSAGES)
+    current: Optional[asyncio.Task] = None
+    
+    def notify(event: str):
+        """接收循环中发送控制事件（发送队列已满时丢弃，不能阻塞接收）"""
+        try:
+            outbox.put_nowait(event)
+        except asyncio.QueueFull:
+            pass
+    
+    async def send_events():
+        while True:
+            await websocket.send_text(await outbox.get())
+    
+    async def run_turn(turn: int, text: str, priority: str):
+        try:
+            ticket = await admission_controller.acquire(agent_id, priority)
+        except AdmissionRejected as e:
+            await outbox.put(_socket_event(
+                "error", turn=turn, status=e.status_code, detail=e.detail, retry_after=e.retry_after
+            ))
+            return
+        try:
+            await outbox.put(_socket_event("start", turn=turn))
+            async for event in stream_reply(agent, text, session_id):
+                if event.is_final:
+                    await outbox.put(_socket_event("end", turn=turn, emotion=event.emotion))
+                elif event.emotion is not None:
+                    await outbox.put(_socket_event("chunk", turn=turn, content=event.content, emotion=event.emotion))
+                else:
+                    await outbox.put(_socket_event("chunk", turn=turn, content=event.content))
+        finally:
+            ticket.release()
+    
+    async def process_turns():
+        nonlocal current
+        turn = 0
+        while True:
+            text, priority = await inbox.get()
+            turn += 1
+            current = asyncio.create_task(run_turn(turn, text, priority))
+            await asyncio.wait({current})
+            if current.cancelled():
+                await outbox.put(_socket_event("cancelled", turn=turn))
+            elif current.exception() is not None:
+                await outbox.put(_socket_event("error", turn=turn, status=500, detail=str(current.exception())))
+            current = None
+    
+    workers = [asyncio.create_task(send_events()), asyncio.create_task(process_turns())]
+    try:
+        while True:
+            raw = await websocket.receive_text()
+            try:
+                incoming = SocketMessage.model_validate_json(raw)
+            except ValidationError:
+                notify(_socket_event("error", status=400, detail="无效的消息格式"))
+                continue
+            
+            if incoming.type == "cancel":
+                # 中断当前回复，并丢弃尚未开始处理的消息
+                while not inbox.empty():
+                    inbox.get_nowait()
+                if current is not None:
+                    current.cancel()
+            elif incoming.type == "ping":
+                notify(_socket_event("pong"))
+            elif incoming.type == "message" and incoming.message.strip():
+                try:
+                    inbox.put_nowait((incoming.message, incoming.priority))
+                except asyncio.QueueFull:
+                    notify(_socket_event("error", status=429, detail="待处理的消息过多，请稍后重试"))
+            else:
+                notify(_socket_event("error", status=400, detail="无效的消息"))
+    except WebSocketDisconnect:
+        pass
+    finally:
+        # 连接断开时停止生成，释放上游流和准入名额
+        for task in workers + ([current] if current is not None else []):
+            task.cancel()
+
+
+@router.post("/emotion/analyze")
+async def analyze_emotion_batch(request: EmotionRequest):
+    """批量分析文本的情感标签"""
+    if request.agent_id is not None and get_profile(request.agent_id) is None:
+        raise HTTPException(status_code=404, detail=f"未知的agent: {request.agent_id}")
+    return {"emotions": await emotion_classifier.classify_many(request.texts, request.agent_id)}
+
+
+@router.post("/chat/batch")
+async def chat_batch(request: BatchChatRequest):
+    """
+    批量聊天
+
+    各条目在并发上限内同时处理，同一会话的条目按提交顺序依次处理；
+    结果以 NDJSON 格式按完成顺序逐行返回，包含条目序号、耗时以及错误信息。
+    """
+    if len(request.items) > settings.BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"批量请求最多包含{settings.BATCH_MAX_ITEMS}条")
+    
+    concurrency = min(request.concurrency or settings.BATCH_MAX_CONCURRENCY, settings.BATCH_MAX_CONCURRENCY)
+    semaphore = asyncio.Semaphore(max(concurrency, 1))
+    session_locks = {}
+    
+    async def run_item(index: int, item: BatchChatItem) -> dict:
+        result = {"index": index, "agent_id": item.agent_id, "session_id": item.session_id}
+        lock = session_locks.setdefault((item.agent_id, item.session_id), asyncio.Lock())
+        async with lock, semaphore:
+            start = time.perf_counter()
+            try:
+                agent = agent_manager.get_agent(item.agent_id)
+                if agent is None:
+                    raise ValueError(f"未知的agent: {item.agent_id}")
+                async with admission_controller.slot(item.agent_id, "batch"):
+                    # 上游失败时报告为条目错误，而不是返回降级回复
+                    response = await agent.chat(item.message, session_id=item.session_id, fallback=False)
+                result["response"] = response
+                result["emotion"] = await agent.analyze_emotion_async(response)
+            except Exception as e:
+                result["error"] = str(e) or type(e).__name__
+            result["elapsed_ms"] = round((time.perf_counter() - start) * 1000, 1)
+        return result
+    
+    async def generate_results():
+        tasks = [asyncio.create_task(run_item(i, item)) for i, item in enumerate(request.items)]
+        try:
+            for finished in asyncio.as_completed(tasks):
+                yield json.dumps(await finished, ensure_ascii=False) + "\n"
+        finally:
+            # 客户端断开时取消未完成的条目
+            for task in tasks:
+                task.cancel()
+    
+    return StreamingResponse(generate_results(), media_type="application/x-ndjson")
+
+
 @router.get("/agent/list")
 async def get_agents():
     """获取可用的agent列表"""
-    return agent_manager.get_available_agents()
+    return list_agents()
+
+
+@router.get("/agent/profiles")
+async def get_agents_metadata(if_none_match: Optional[str] = Header(default=None)):
+    """获取全部agent的列表与个人资料（带版本ETag，资料未变化时返回304）"""
+    etag = f'"{profiles_version()}"'
+    if if_none_match == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+    return Response(
+        content=json.dumps(get_agent_metadata(), ensure_ascii=False),
+        media_type="application/json",
+        headers={"ETag": etag},
+    )
 
 
 @router.get("/agent/{agent_id}/profile")
 async def get_agent_profile(agent_id: str):
     """获取指定agent的个人资料"""
-    if agent_id in AGENT_PROFILES:
-        return AGENT_PROFILES[agent_id]
-    else:
-        return None
+    return get_profile(agent_id)
 
 
 @router.get("/agent/{agent_id}/history")
-async def get_agent_conversation_history(agent_id: str):
-    """获取指定agent的对话历史"""
+async def get_agent_conversation_history(
+    agent_id: str,
+    session_id: str = DEFAULT_SESSION_ID,
+    before_seq: Optional[int] = Query(default=None, ge=0),
+    since_seq: Optional[int] = Query(default=None, ge=0),
+    limit: Optional[int] = Query(default=None, ge=1),
+    if_none_match: Optional[str] = Header(default=None),
+):
+    """
+    分页获取指定agent在指定会话中的对话历史
+
+    默认返回最新一页；before_seq 获取更早的一页，since_seq 增量获取该序号及之后的消息。
+    响应带历史版本ETag，历史未变化时返回304。
+    """
+    if before_seq is not None and since_seq is not None:
+        raise HTTPException(status_code=400, detail="before_seq 和 since_seq 不能同时指定")
     try:
-        agent = agent_manager.get_agent(agent_id)
-        if agent:
-            return agent.conversation_history
-        else:
-            return []
+        page = await get_history_page(agent_id, session_id, before_seq, since_seq, limit)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"获取对话历史失败: {str(e)}")
+
+    etag = f'"{page["version"]}"'
+    if if_none_match == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+    return Response(
+        content=json.dumps(page, ensure_ascii=False),
+        media_type="application/json",
+        headers={"ETag": etag},
+    )
@@ -0,0 +1,250 @@
+"""
+图片资源处理
+将 images/ 下的原图生成适合各处显示尺寸的压缩变体（WebP 头像与资料图、PNG 应用图标），
+文件名带内容哈希，以不可变缓存头提供；生成需要安装 Pillow（assets 可选依赖），未生成时继续使用原图
+"""
+
+import hashlib
+import json
+import os
+import re
+from io import BytesIO
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple, Union
+
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+from starlette.types import Scope
+
+from .config import settings
+
+
+ROOT_DIR = Path(__file__).parent.parent
+IMAGES_DIR = ROOT_DIR / "images"
+# 生成的变体目录（位于 images/ 下，与原图由同一个静态路由提供）
+BUILD_DIR = IMAGES_DIR / "_build"
+ASSET_MANIFEST = "assets.json"
+
+# 变体规格：名称 -> (源文件名, 尺寸, 格式)
+# 尺寸为 (宽, 高) 时居中裁剪为该尺寸，为整数时按宽度等比缩放；不会放大原图
+VARIANTS: Dict[str, Tuple[str, Union[int, Tuple[int, int]], str]] = {
+    "avatar": ("avatar.png", (128, 128), "WEBP"),  # 聊天头像、agent列表
+    "profile": ("full.png", 640, "WEBP"),  # 个人资料全身照
+    "icon-96": ("avatar.png", (96, 96), "PNG"),  # 应用图标（PNG 兼容所有平台）
+    "icon-192": ("avatar.png", (192, 192), "PNG"),
+    "icon-512": ("avatar.png", (512, 512), "PNG"),
+}
+
+# 个人资料字段使用的变体
+PROFILE_FIELDS = {"avatar": "avatar", "full_image": "profile"}
+
+# 带内容哈希的文件名，如 avatar.3f2a9c1b04de.webp
+HASHED_NAME = re.compile(r"\.[0-9a-f]{12}\.[a-z0-9]+$")
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+def _variant_key(source: bytes, variant: str, quality: int) -> str:
+    """源文件内容与变体规格的摘要，未变化时复用已生成的文件"""
+    spec = json.dumps([variant, VARIANTS[variant], quality])
+    return hashlib.sha256(source + spec.encode()).hexdigest()
+
+
+def _render(source: bytes, size: Union[int, Tuple[int, int]], fmt: str, quality: int) -> Tuple[bytes, Tuple[int, int]]:
+    """缩放并重新压缩一张图片，返回 (文件内容, 尺寸)"""
+    from PIL import Image, ImageOps
+
+    with Image.open(BytesIO(source)) as image:
+        image = image.convert("RGBA")
+        if isinstance(size, tuple):
+            if image.width >= size[0] and image.height >= size[1]:
+                image = ImageOps.fit(image, size, Image.LANCZOS)
+        elif image.width > size:
+            image = image.resize((size, round(image.height * size / image.width)), Image.LANCZOS)
+
+        output = BytesIO()
+        if fmt == "WEBP":
+            image.save(output, "WEBP", quality=quality, method=6)
+        else:
+            image.save(output, fmt, optimize=True)
+        return output.getvalue(), image.size
+
+
+def build_assets(
+    images_dir: Optional[Path] = None,
+    build_dir: Optional[Path] = None,
+    quality: Optional[int] = None,
+) -> Dict[str, Any]:
+    """
+    为每个agent目录生成图片变体并写入资源清单
+
+    源文件未变化的变体直接复用，不再使用的旧文件会被删除；需要安装 Pillow。
+    返回资源清单：agent_id -> 变体名 -> {"path", "width", "height", "key"}
+    """
+    images_dir = images_dir or IMAGES_DIR
+    build_dir = build_dir or BUILD_DIR
+    quality = quality or settings.ASSET_WEBP_QUALITY
+    previous = _read_manifest(build_dir)
+
+    manifest: Dict[str, Any] = {}
+    for agent_dir in sorted(path for path in images_dir.iterdir() if path.is_dir() and path != build_dir):
+        agent_id = agent_dir.name
+        output_dir = build_dir / agent_id
+        entries: Dict[str, Any] = {}
+        for variant, (source_name, size, fmt) in VARIANTS.items():
+            source_path = agent_dir / source_name
+            if not source_path.is_file():
+                continue
+            source = source_path.read_bytes()
+            key = _variant_key(source, variant, quality)
+
+            cached = previous.get(agent_id, {}).get(variant)
+            if cached is not None and cached["key"] == key and (ROOT_DIR / cached["path"]).is_file():
+                entries[variant] = cached
+                continue
+
+            data, (width, height) = _render(source, size, fmt, quality)
+            if isinstance(size, tuple) and (width, height) != size:
+                # 原图小于图标尺寸，不生成（避免声明的尺寸与实际不符）
+                continue
+            name = f"{variant}.{hashlib.sha256(data).hexdigest()[:12]}.{fmt.lower()}"
+            output_dir.mkdir(parents=True, exist_ok=True)
+            _write_atomic(output_dir / name, data)
+            entries[variant] = {
+                "path": (output_dir / name).relative_to(ROOT_DIR).as_posix(),
+                "width": width,
+                "height": height,
+                "key": key,
+            }
+
+        if entries:
+            manifest[agent_id] = entries
+            # 删除不再引用的旧变体
+            keep = {Path(entry["path"]).name for entry in entries.values()}
+            for path in output_dir.iterdir():
+                if path.name not in keep:
+                    path.unlink()
+
+    build_dir.mkdir(parents=True, exist_ok=True)
+    _write_atomic(build_dir / ASSET_MANIFEST, json.dumps(manifest, ensure_ascii=False, indent=2).encode("utf-8"))
+    return manifest
+
+
+def _write_atomic(path: Path, data: bytes):
+    """写入临时文件后替换，多个进程同时生成时不会读到写了一半的文件"""
+    temp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    temp.write_bytes(data)
+    os.replace(temp, path)
+
+
+def _read_manifest(build_dir: Path) -> Dict[str, Any]:
+    """读取资源清单，不存在或损坏时返回空清单"""
+    try:
+        return json.loads((build_dir / ASSET_MANIFEST).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+
+
+def prepare_assets() -> bool:
+    """启动时生成缺失或过期的图片变体，未安装 Pillow 时跳过"""
+    try:
+        import PIL  # noqa: F401
+    except ImportError:
+        print("⚠️ 未安装 Pillow，跳过图片变体生成，继续使用原图（pip install 'birdiland[assets]'）")
+        return False
+    build_assets()
+    return True
+
+
+class AssetRegistry:
+    """已生成的图片变体（启动时从资源清单加载）"""
+
+    def __init__(self, build_dir: Optional[Path] = None):
+        self.build_dir = build_dir or BUILD_DIR
+        self.manifest: Dict[str, Any] = {}
+
+    def load(self) -> bool:
+        """加载资源清单，返回是否有可用的变体"""
+        self.manifest = _read_manifest(self.build_dir)
+        return bool(self.manifest)
+
+    def get(self, agent_id: str, variant: str) -> Optional[Dict[str, Any]]:
+        """获取变体信息，未生成时返回None"""
+        return self.manifest.get(agent_id, {}).get(variant)
+
+    def path(self, agent_id: str, variant: str, default: str) -> str:
+        """获取变体路径，未生成时返回原图路径"""
+        entry = self.get(agent_id, variant)
+        return entry["path"] if entry is not None else default
+
+    def apply_to_profiles(self, profiles: Dict[str, Dict[str, Any]]):
+        """将个人资料中的头像和全身照替换为优化后的变体"""
+        for agent_id, profile in profiles.items():
+            for field, variant in PROFILE_FIELDS.items():
+                if field in profile:
+                    profile[field] = self.path(agent_id, variant, profile[field])
+
+    def rewrite_manifest(self, manifest: Dict[str, Any]) -> Dict[str, Any]:
+        """将 Web 应用清单中引用头像的图标替换为对应尺寸的图标变体"""
+
+        def rewrite(icon: Dict[str, Any]) -> Dict[str, Any]:
+            match = re.fullmatch(r"images/([^/]+)/avatar\.png", icon.get("src", ""))
+            size = icon.get("sizes", "").split("x")[0]
+            entry = self.get(match.group(1), f"icon-{size}") if match else None
+            if entry is None:
+                return icon
+            return {**icon, "src": entry["path"], "type": "image/png"}
+
+        manifest = dict(manifest)
+        if "icons" in manifest:
+            manifest["icons"] = [rewrite(icon) for icon in manifest["icons"]]
+        if "shortcuts" in manifest:
+            manifest["shortcuts"] = [
+                {**shortcut, "icons": [rewrite(icon) for icon in shortcut.get("icons", [])]}
+                for shortcut in manifest["shortcuts"]
+            ]
+        return manifest
+
+
+class CachedStaticFiles(StaticFiles):
+    """
+    带缓存头的静态文件
+
+    带内容哈希的文件内容永不变化，可以被浏览器和CDN长期缓存；
+    其他文件使用较短的缓存时间，并通过 ETag 校验（StaticFiles 自带）。
+    """
+
+    def file_response(
+        self,
+        full_path: Union[str, "os.PathLike[str]"],
+        stat_result: os.stat_result,
+        scope: Scope,
+        status_code: int = 200,
+    ) -> Response:
+        response = FileResponse(full_path, status_code=status_code, stat_result=stat_result)
+        if HASHED_NAME.search(str(full_path)):
+            response.headers["Cache-Control"] = IMMUTABLE_CACHE_CONTROL
+        else:
+            response.headers["Cache-Control"] = f"public, max-age={settings.ASSET_MAX_AGE}"
+        # 304 响应同样携带缓存头
+        if self.is_not_modified(response.headers, Headers(scope=scope)):
+            return NotModifiedResponse(response.headers)
+        return response
+
+
+# 全局图片变体注册表
+asset_registry = AssetRegistry()
+
+
+def main():
+    """离线生成图片变体：python -m birdiland.assets"""
+    manifest = build_assets()
+    for agent_id, entries in manifest.items():
+        for variant, entry in entries.items():
+            size = (ROOT_DIR / entry["path"]).stat().st_size
+            print(f"{agent_id}/{variant}: {entry['path']} ({entry['width']}x{entry['height']}, {size // 1024} KB)")
+
+
+if __name__ == "__main__":
+    main()
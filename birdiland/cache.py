@@ -0,0 +1,101 @@
+"""
+回复缓存
+对相同agent、模型、消息和采样参数的请求复用之前的回复，支持 LRU/TTL 淘汰和字节上限
+"""
+
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from .config import settings
+
+
+def make_cache_key(agent_id: str, model: str, messages: List[Dict[str, str]], **params: Any) -> str:
+    """根据agent、模型、消息和采样参数计算缓存键"""
+    payload = json.dumps(
+        [agent_id, model, messages, params],
+        ensure_ascii=False,
+        separators=(",", ":"),
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def iter_chunks(text: str, size: int) -> Iterator[str]:
+    """将缓存的回复切分为片段，用于模拟流式输出"""
+    for start in range(0, len(text), size):
+        yield text[start:start + size]
+
+
+class ResponseCache:
+    """回复缓存（LRU + TTL，按字节数限制大小）"""
+
+    def __init__(self, max_bytes: Optional[int] = None, ttl_seconds: Optional[float] = None):
+        self.max_bytes = max_bytes or settings.RESPONSE_CACHE_MAX_BYTES
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else settings.RESPONSE_CACHE_TTL_SECONDS
+
+        # key -> (回复, 过期时间, 字节数)，最久未使用的在最前面
+        self._entries: "OrderedDict[str, Tuple[str, float, int]]" = OrderedDict()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> Optional[str]:
+        """读取缓存，未命中或已过期时返回None"""
+        entry = self._entries.get(key)
+        if entry is not None and entry[1] < time.monotonic():
+            self._remove(key)
+            entry = None
+
+        if entry is None:
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def put(self, key: str, value: str):
+        """写入缓存"""
+        size = len(key) + len(value.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (value, time.monotonic() + self.ttl_seconds, size)
+        self.total_bytes += size
+
+        while self.total_bytes > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+
+    def clear(self):
+        """清空缓存"""
+        self._entries.clear()
+        self.total_bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """获取缓存统计信息"""
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self.total_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+    def _remove(self, key: str):
+        """移除缓存项"""
+        _, _, size = self._entries.pop(key)
+        self.total_bytes -= size
+
+
+# 全局回复缓存实例
+response_cache = ResponseCache()
@@ -3,7 +3,7 @@
 """
 
 import os
-from typing import List
+from typing import Dict, List
 
 from pydantic import ConfigDict
 from pydantic_settings import BaseSettings
@@ -16,6 +16,25 @@ class Settings(BaseSettings):
     HOST: str = "127.0.0.1"
     PORT: int = 8000
     LOG_LEVEL: str = "INFO"
+    WORKERS: int = 1  # 工作进程数，大于1时需要共享会话存储（SESSION_BACKEND=sqlite/redis）
+    SHUTDOWN_TIMEOUT: float = 10.0  # 优雅关闭时等待进行中请求的时间（秒）
+    RUN_MODE: str = "full"  # 运行模式：full（API + 聊天界面）/ api（只提供API，不导入 Gradio）
+    STARTUP_REPORT: bool = True  # 启动完成时输出各阶段耗时
+
+    # 界面配置
+    GRADIO_API_BASE_URL: str = ""  # 为空时界面在进程内调用服务；设置后通过HTTP访问远程API（如 http://api-host:8000/api/v1）
+    GRADIO_RENDER_FPS: float = 20.0  # 流式回复每秒最多刷新界面的次数
+    GRADIO_METADATA_TTL: float = 5.0  # 远程模式下agent元数据缓存的版本校验间隔（秒）
+
+    # agent资料配置
+    AGENT_PROFILES_DIR: str = ""  # agent资料目录（每个agent一个 <agent_id>.json），为空时使用内置资料
+    AGENT_RELOAD_INTERVAL: float = 2.0  # 后台检查资料文件变化的间隔（秒），0表示不热重载
+    AGENT_CACHE_SIZE: int = 256  # 内存中保留的agent实例数量上限（按最近使用淘汰，需要时重新创建）
+
+    # 图片资源配置
+    ASSET_BUILD_ON_STARTUP: bool = True  # 启动时生成缺失或过期的图片变体（需要安装 Pillow）
+    ASSET_WEBP_QUALITY: int = 80  # WebP 压缩质量
+    ASSET_MAX_AGE: int = 3600  # 不带内容哈希的图片的浏览器缓存时间（秒）
 
     # CORS配置
     ALLOWED_ORIGINS: List[str] = []
@@ -27,6 +46,99 @@ class Settings(BaseSettings):
     # 模型配置
     MODEL_NAME: str = ""
 
+    # 上游连接配置（所有agent共享一个连接池）
+    UPSTREAM_HTTP2: bool = True  # 启用HTTP/2（需要安装 httpx[http2]，否则回退到HTTP/1.1）
+    UPSTREAM_POOL_SIZE: int = 100  # 最大连接数
+    UPSTREAM_MAX_KEEPALIVE: int = 20  # 最大保活连接数
+    UPSTREAM_KEEPALIVE_EXPIRY: float = 60.0  # 保活连接空闲过期时间（秒）
+    UPSTREAM_CONNECT_TIMEOUT: float = 5.0  # 建立连接超时（秒）
+    UPSTREAM_READ_TIMEOUT: float = 30.0  # 读取超时（秒）
+    UPSTREAM_MAX_CONCURRENT_STREAMS: int = 100  # 同时进行的上游请求数上限
+    UPSTREAM_PREWARM_CONNECTIONS: int = 2  # 启动时预热的连接数
+
+    # 上游容错配置
+    UPSTREAM_MAX_RETRIES: int = 2  # 可重试错误（连接失败、限流、5xx）的重试次数
+    UPSTREAM_RETRY_BASE_DELAY: float = 0.2  # 重试退避的基础延迟（秒），实际延迟带随机抖动
+    CIRCUIT_FAILURE_THRESHOLD: int = 5  # 连续失败多少次后熔断
+    CIRCUIT_RESET_TIMEOUT: float = 30.0  # 熔断后多久放行探测请求（秒）
+    UPSTREAM_HEDGE_BASE_URL: str = ""  # 对冲请求的备用上游地址
+    UPSTREAM_HEDGE_API_KEY: str = ""  # 备用上游的API密钥，为空时使用 OPENAI_API_KEY
+    UPSTREAM_HEDGE_MODEL: str = ""  # 对冲请求使用的模型，为空时使用 MODEL_NAME
+    UPSTREAM_HEDGE_DELAY: float = 2.0  # 主请求在此时间内未返回首个token时发起对冲请求（秒），0表示关闭
+
+    # 流式输出配置
+    SSE_FLUSH_INTERVAL_MS: float = 40.0  # 片段最长缓冲时间（毫秒），到期后合并为一帧发送（第一个片段立即发送），0表示逐片段发送
+    SSE_FLUSH_BYTES: int = 256  # 缓冲内容达到此字节数时立即发送
+    SSE_HEARTBEAT_SECONDS: float = 15.0  # 超过此时间没有输出时发送心跳注释，0表示关闭
+
+    # WebSocket 配置
+    WS_SEND_QUEUE_SIZE: int = 32  # 每个连接待发送事件数上限，客户端读取过慢时暂停读取上游
+    WS_MAX_PENDING_MESSAGES: int = 8  # 每个连接排队等待处理的消息数上限
+
+    # 会话配置
+    SESSION_MAX_COUNT: int = 10000  # 最多保留的会话数量
+    SESSION_MAX_BYTES: int = 64 * 1024 * 1024  # 所有会话历史占用的内存上限（字节）
+    SESSION_TTL_SECONDS: float = 3600.0  # 会话闲置过期时间（秒），0表示不过期
+    SESSION_BACKEND: str = "durable"  # 会话存储后端：memory（不持久化）/ durable（单进程，异步写入SQLite）/ sqlite、redis（多个工作进程共享）
+    SESSION_SQLITE_PATH: str = "data/sessions.db"  # SQLite 数据库文件路径
+    HISTORY_FLUSH_INTERVAL: float = 0.5  # durable 后端批量写入磁盘的间隔（秒）
+    HISTORY_FLUSH_BATCH_SIZE: int = 256  # 积压的修改达到此数量时立即写入
+    SESSION_REDIS_URL: str = "redis://127.0.0.1:6379/0"  # Redis 协议服务地址
+    SESSION_REDIS_PREFIX: str = "birdiland"  # Redis 键前缀
+    SESSION_IO_THREADS: int = 8  # sqlite/redis 后端执行存储操作的线程数（读写不占用事件循环）
+    SESSION_SWEEP_INTERVAL: float = 60.0  # durable/sqlite 后端清理磁盘上过期及超出数量上限的会话的间隔（秒）
+
+    # 上下文配置
+    CONTEXT_TOKEN_BUDGET: int = 3000  # 单次请求提示词（系统提示+历史+当前消息）的token预算
+    HISTORY_MAX_MESSAGES: int = 100  # 每个会话最多保留的消息条数
+    HISTORY_PAGE_SIZE: int = 50  # 历史接口每页默认返回的消息条数
+    HISTORY_PAGE_MAX_SIZE: int = 200  # 历史接口每页最多返回的消息条数
+    CONTEXT_LOW_WATERMARK: float = 0.6  # 历史超出预算时一次裁剪到预算的该比例，保持提示词前缀稳定
+    TOKENIZER_ENCODING: str = "cl100k_base"  # tiktoken 编码名称（未安装tiktoken时使用估算）
+
+    # 滚动摘要配置
+    SUMMARY_ENABLED: bool = True  # 是否将移出窗口的旧消息折叠进摘要
+    SUMMARY_MAX_TOKENS: int = 300  # 摘要的最大长度
+    SUMMARY_MAX_PENDING: int = 200  # 每个会话最多保留的待摘要消息数
+
+    # 回复缓存配置
+    RESPONSE_CACHE_ENABLED: bool = False  # 是否缓存相同提示词的回复
+    RESPONSE_CACHE_TTL_SECONDS: float = 600.0  # 缓存有效期（秒）
+    RESPONSE_CACHE_MAX_BYTES: int = 16 * 1024 * 1024  # 缓存占用内存上限（字节）
+    RESPONSE_CACHE_REPLAY_CHUNK_CHARS: int = 16  # 流式回放缓存回复时每个片段的字符数
+
+    # 请求合并配置
+    SINGLEFLIGHT_ENABLED: bool = True  # 相同的并发请求只调用一次上游
+
+    # 情感分析配置
+    EMOTION_LANGUAGE: str = "zh"  # 情感词典语言（对应词典目录下的 <language>.json）
+    EMOTION_LEXICON_DIR: str = ""  # 情感词典目录，为空时使用内置词典
+    EMOTION_MODEL_NAME: str = ""  # 本地情感分类模型（transformers），为空时只使用情感词典
+    EMOTION_MODEL_PRELOAD: bool = False  # 是否在启动时加载模型（否则首次使用时在后台加载）
+    EMOTION_MODEL_BATCH_SIZE: int = 16  # 微批次的最大文本数
+    EMOTION_MODEL_MAX_WAIT_MS: float = 10.0  # 微批次的最长等待时间（毫秒）
+    EMOTION_MODEL_LABEL_MAP: Dict[str, str] = {  # 模型标签 -> 情感标签
+        "joy": "happy",
+        "happiness": "happy",
+        "love": "happy",
+        "surprise": "excited",
+        "sadness": "sad",
+        "anger": "sad",
+        "fear": "sad",
+        "disgust": "sad",
+        "neutral": "neutral",
+    }
+
+    # 准入控制配置
+    ADMISSION_MAX_CONCURRENCY: int = 64  # 全局同时处理的聊天请求数上限
+    ADMISSION_MAX_PER_AGENT: int = 32  # 每个agent同时处理的聊天请求数上限
+    ADMISSION_QUEUE_SIZE: int = 128  # 等待队列长度，队列已满时返回429
+    ADMISSION_QUEUE_TIMEOUT: float = 5.0  # 排队最长等待时间（秒），超时返回503
+
+    # 批量聊天配置
+    BATCH_MAX_CONCURRENCY: int = 8  # 批量请求中同时处理的条目数上限
+    BATCH_MAX_ITEMS: int = 1000  # 单个批量请求的最大条目数
+
     # 其他配置
     UV_INDEX_URL: str = ""
 
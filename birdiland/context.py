@@ -0,0 +1,30 @@
+"""
+上下文打包
+在给定的token预算内，从最新到最旧选取对话历史
+"""
+
+from typing import Iterable, List
+
+from .session import Turn
+
+
+def pack_turns(turns: Iterable[Turn], budget: int) -> List[Turn]:
+    """
+    按token预算打包对话历史
+
+    Args:
+        turns: 按时间顺序排列的对话消息
+        budget: 对话历史可用的token预算
+
+    Returns:
+        预算内最新的若干条消息（按时间顺序）
+    """
+    packed: List[Turn] = []
+    used = 0
+    for turn in reversed(turns):
+        if used + turn.tokens > budget:
+            break
+        used += turn.tokens
+        packed.append(turn)
+    packed.reverse()
+    return packed
@@ -0,0 +1,222 @@
+"""
+情感分析
+从词典文件加载带权重的情感词，编译为 Aho-Corasick 自动机进行单次多模式匹配，
+支持对流式回复进行增量分析
+"""
+
+import json
+import re
+from collections import deque
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+from pydantic import BaseModel
+
+from .config import settings
+
+
+# 内置词典目录
+DEFAULT_LEXICON_DIR = Path(__file__).parent / "lexicons"
+
+# 无明显倾向时的情感标签
+NEUTRAL_LABEL = "neutral"
+
+# agent专属词典的文件名（只允许字母、数字、下划线和连字符，不能指向词典目录之外）
+AGENT_LEXICON_NAME = re.compile(r"[A-Za-z0-9_-]+")
+
+# 缓存的编译后词典数量
+LEXICON_CACHE_SIZE = 64
+
+
+class LexiconFile(BaseModel):
+    """情感词典文件格式"""
+    language: str = ""
+    labels: Dict[str, Dict[str, float]]  # 标签 -> {情感词: 权重}
+
+
+def decide_emotion(scores: Dict[str, float]) -> str:
+    """得分唯一最高的标签胜出，并列或无命中时为中性"""
+    best_label = NEUTRAL_LABEL
+    best_score = 0.0
+    tied = False
+    for label, score in scores.items():
+        if score > best_score:
+            best_label, best_score, tied = label, score, False
+        elif score == best_score and score > 0:
+            tied = True
+    return NEUTRAL_LABEL if tied else best_label
+
+
+class EmotionLexicon:
+    """
+    编译后的情感词典
+
+    所有情感词构建为一个 Aho-Corasick 自动机，扫描代价只与文本长度有关，
+    不随词典规模增长。每个情感词在一段文本中最多计分一次。
+    """
+
+    def __init__(self, labels: Dict[str, Dict[str, float]]):
+        self.labels = list(labels)
+        # 情感词编号 -> (标签, 权重)
+        self._terms: List[Tuple[str, float]] = []
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[List[int]] = [[]]
+
+        for label, words in labels.items():
+            for word, weight in words.items():
+                word = word.lower()
+                if word:
+                    self._add_term(word, label, weight)
+        self._build_failure_links()
+
+    def _add_term(self, word: str, label: str, weight: float):
+        """将情感词插入字典树"""
+        state = 0
+        for char in word:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+            state = next_state
+        self._output[state].append(len(self._terms))
+        self._terms.append((label, weight))
+
+    def _build_failure_links(self):
+        """按广度优先构建失配指针，并合并后缀节点的输出"""
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                target = self._goto[fail].get(char, 0)
+                self._fail[next_state] = target if target != next_state else 0
+                self._output[next_state] = self._output[next_state] + self._output[self._fail[next_state]]
+
+    def scan(self, text: str, state: int, found: Set[int]) -> int:
+        """从给定自动机状态扫描文本，将命中的情感词编号加入found，返回结束状态"""
+        goto = self._goto
+        fail = self._fail
+        output = self._output
+        for char in text.lower():
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if output[state]:
+                found.update(output[state])
+        return state
+
+    def score(self, found: Set[int]) -> Dict[str, float]:
+        """计算各标签的得分"""
+        scores = {label: 0.0 for label in self.labels}
+        for term in found:
+            label, weight = self._terms[term]
+            scores[label] += weight
+        return scores
+
+    def analyze(self, text: str) -> str:
+        """分析文本的情感标签"""
+        found: Set[int] = set()
+        self.scan(text, 0, found)
+        return decide_emotion(self.score(found))
+
+    def analyze_batch(self, texts: List[str]) -> List[str]:
+        """批量分析多段文本的情感标签"""
+        return [self.analyze(text) for text in texts]
+
+
+def _lexicon_dir() -> Path:
+    """词典目录（可通过配置覆盖）"""
+    return Path(settings.EMOTION_LEXICON_DIR) if settings.EMOTION_LEXICON_DIR else DEFAULT_LEXICON_DIR
+
+
+def _read_lexicon_file(path: Path) -> Dict[str, Dict[str, float]]:
+    """读取并校验词典文件"""
+    with open(path, encoding="utf-8") as f:
+        return LexiconFile.model_validate(json.load(f)).labels
+
+
+def get_lexicon(agent_id: Optional[str] = None, language: Optional[str] = None) -> EmotionLexicon:
+    """
+    获取编译后的情感词典
+
+    先加载语言词典（<language>.json），如果存在 <agent_id>.json 则叠加agent专属词典；
+    agent_id 不是合法的文件名时只使用语言词典。
+    """
+    if agent_id and not AGENT_LEXICON_NAME.fullmatch(agent_id):
+        agent_id = None
+    return _compile_lexicon(agent_id, language)
+
+
+@lru_cache(maxsize=LEXICON_CACHE_SIZE)
+def _compile_lexicon(agent_id: Optional[str], language: Optional[str]) -> EmotionLexicon:
+    """加载并编译词典（按 agent_id 和语言缓存）"""
+    directory = _lexicon_dir()
+    labels = _read_lexicon_file(directory / f"{language or settings.EMOTION_LANGUAGE}.json")
+
+    if agent_id:
+        agent_path = directory / f"{agent_id}.json"
+        if agent_path.exists():
+            for label, words in _read_lexicon_file(agent_path).items():
+                labels.setdefault(label, {}).update(words)
+
+    return EmotionLexicon(labels)
+
+
+def analyze_emotion(text: str, agent_id: Optional[str] = None) -> str:
+    """
+    分析文本的情感倾向
+
+    Args:
+        text: 待分析的文本
+        agent_id: 使用该agent的专属词典（如有）
+
+    Returns:
+        情感标签
+    """
+    return get_lexicon(agent_id).analyze(text)
+
+
+def analyze_emotions(texts: List[str], agent_id: Optional[str] = None) -> List[str]:
+    """批量分析多段文本的情感倾向"""
+    return get_lexicon(agent_id).analyze_batch(texts)
+
+
+class EmotionTracker:
+    """
+    增量情感分析器
+
+    在片段之间保留自动机状态，跨片段的情感词无需回看即可匹配，
+    整个回复的分析代价为 O(n)，最终结果与 analyze_emotion 对完整文本的结果一致。
+    """
+
+    def __init__(self, lexicon: Optional[EmotionLexicon] = None):
+        self.lexicon = lexicon or get_lexicon()
+        self._state = 0
+        self._found: Set[int] = set()
+        self._parts: List[str] = []
+        self.emotion = NEUTRAL_LABEL
+
+    @property
+    def text(self) -> str:
+        """已接收的完整文本"""
+        return "".join(self._parts)
+
+    def feed(self, chunk: str) -> str:
+        """接收新的文本片段，返回当前的情感标签"""
+        if not chunk:
+            return self.emotion
+        self._parts.append(chunk)
+
+        matched = len(self._found)
+        self._state = self.lexicon.scan(chunk, self._state, self._found)
+        if len(self._found) != matched:
+            self.emotion = decide_emotion(self.lexicon.score(self._found))
+        return self.emotion
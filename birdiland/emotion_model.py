@@ -0,0 +1,154 @@
+"""
+本地情感分类模型（可选）
+在后台线程中运行 transformers 文本分类模型，将并发请求合并为微批次处理，
+模型未加载时退回到情感词典分析
+"""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .config import settings
+from .emotion import NEUTRAL_LABEL, get_lexicon
+
+
+# 模型推理函数：输入一批文本，输出每段文本的 {"label": ..., "score": ...}
+Predictor = Callable[[List[str]], List[Dict[str, Any]]]
+
+
+def load_transformers_pipeline(model_name: str) -> Predictor:
+    """加载 transformers 文本分类流水线（CPU）"""
+    from transformers import pipeline
+
+    classifier = pipeline("text-classification", model=model_name, device=-1)
+    return lambda texts: classifier(texts, batch_size=len(texts), truncation=True)
+
+
+class EmotionClassifier:
+    """情感分类器（模型惰性加载，推理在工作线程中以微批次进行）"""
+
+    def __init__(
+        self,
+        model_name: Optional[str] = None,
+        batch_size: Optional[int] = None,
+        max_wait_ms: Optional[float] = None,
+        label_map: Optional[Dict[str, str]] = None,
+        loader: Optional[Callable[[str], Predictor]] = None,
+    ):
+        self.model_name = model_name if model_name is not None else settings.EMOTION_MODEL_NAME
+        self.batch_size = batch_size or settings.EMOTION_MODEL_BATCH_SIZE
+        self.max_wait = (max_wait_ms if max_wait_ms is not None else settings.EMOTION_MODEL_MAX_WAIT_MS) / 1000
+        self.label_map = {k.lower(): v for k, v in (label_map or settings.EMOTION_MODEL_LABEL_MAP).items()}
+        self._loader = loader or load_transformers_pipeline
+
+        self._predictor: Optional[Predictor] = None
+        self._load_task: Optional[asyncio.Task] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._queue: Optional["asyncio.Queue[Tuple[str, asyncio.Future]]"] = None
+        self._worker: Optional[asyncio.Task] = None
+
+    @property
+    def enabled(self) -> bool:
+        """是否配置了本地模型"""
+        return bool(self.model_name)
+
+    @property
+    def loaded(self) -> bool:
+        """模型是否已加载完成"""
+        return self._predictor is not None
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        """模型推理使用单独的工作线程，避免阻塞事件循环"""
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="emotion-model")
+        return self._executor
+
+    async def load(self):
+        """加载模型（多次调用只会加载一次）"""
+        if not self.enabled or self.loaded:
+            return
+        if self._load_task is None:
+            self._load_task = asyncio.create_task(self._load())
+        await asyncio.shield(self._load_task)
+
+    async def _load(self):
+        """在工作线程中加载模型，失败时保持词典回退"""
+        loop = asyncio.get_running_loop()
+        try:
+            self._predictor = await loop.run_in_executor(self._get_executor(), self._loader, self.model_name)
+        except Exception as e:
+            print(f"加载情感模型失败，使用情感词典: {str(e)}")
+
+    async def classify(self, text: str, agent_id: Optional[str] = None) -> str:
+        """
+        分析文本的情感标签
+
+        模型未加载时在后台触发加载，并立即使用情感词典的结果。
+        """
+        if not self.enabled or not text:
+            return get_lexicon(agent_id).analyze(text)
+        if not self.loaded:
+            if self._load_task is None:
+                self._load_task = asyncio.create_task(self._load())
+            return get_lexicon(agent_id).analyze(text)
+
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.create_task(self._batch_worker())
+
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((text, future))
+        try:
+            return await future
+        except Exception:
+            return get_lexicon(agent_id).analyze(text)
+
+    async def classify_many(self, texts: List[str], agent_id: Optional[str] = None) -> List[str]:
+        """批量分析多段文本（并发提交，由微批次合并推理）"""
+        return list(await asyncio.gather(*(self.classify(text, agent_id) for text in texts)))
+
+    async def _batch_worker(self):
+        """收集请求组成微批次：凑满批次或等待超过最长时间后执行一次推理"""
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            texts = [text for text, _ in batch]
+            try:
+                labels = await loop.run_in_executor(self._get_executor(), self._predict, texts)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            for (_, future), label in zip(batch, labels):
+                if not future.done():
+                    future.set_result(label)
+
+    def _predict(self, texts: List[str]) -> List[str]:
+        """执行模型推理并映射为本项目的情感标签"""
+        outputs = self._predictor(texts)
+        return [self.label_map.get(str(output["label"]).lower(), NEUTRAL_LABEL) for output in outputs]
+
+    async def close(self):
+        """停止批处理任务并释放工作线程"""
+        if self._worker is not None:
+            self._worker.cancel()
+            self._worker = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+
+# 全局情感分类器实例
+emotion_classifier = EmotionClassifier()
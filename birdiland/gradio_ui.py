@@ -4,20 +4,273 @@ Gradio UI模块
 """
 
 import gradio as gr
-from typing import List, Tuple, Generator, AsyncGenerator
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, AsyncGenerator, AsyncIterator, Dict, List, Optional, Tuple
 import httpx
 import json
+import uuid
 from .config import settings
+from .agent import agent_manager
+from .admission import AdmissionRejected, admission_controller
+from .service import get_agent_metadata, get_history_page, profiles_version, stream_reply
+from .sse import throttle
+
+class BackendError(Exception):
+    """后端返回错误状态"""
+    
+    def __init__(self, status_code: int):
+        super().__init__(f"后端返回错误: {status_code}")
+        self.status_code = status_code
+
+
+class LocalBackend:
+    """进程内后端：直接调用对话服务层，不经过HTTP和SSE序列化"""
+    
+    # 进程内检查版本号没有开销，每次都检查
+    metadata_ttl = 0.0
+    
+    async def stream_chat(self, message: str, agent_id: str, session_id: str) -> AsyncIterator[Tuple[str, Optional[str]]]:
+        """流式对话，产出 (文本片段, 情感)，情感未变化时为None"""
+        agent = agent_manager.get_agent(agent_id)
+        if agent is None:
+            raise BackendError(404)
+        try:
+            ticket = await admission_controller.acquire(agent_id)
+        except AdmissionRejected as e:
+            raise BackendError(e.status_code) from None
+        try:
+            async for event in stream_reply(agent, message, session_id):
+                yield event.content, event.emotion
+        finally:
+            ticket.release()
+    
+    async def fetch_metadata(self, version: Optional[str]) -> Optional[Dict[str, Any]]:
+        """获取agent元数据，版本未变化时返回None"""
+        if version == profiles_version():
+            return None
+        return get_agent_metadata()
+    
+    async def fetch_history(
+        self, agent_id: str, session_id: str, since_seq: Optional[int] = None, version: Optional[str] = None
+    ) -> Optional[Dict[str, Any]]:
+        """获取一页对话历史，版本未变化时返回None"""
+        page = await get_history_page(agent_id, session_id, since_seq=since_seq, limit=settings.HISTORY_PAGE_MAX_SIZE)
+        return None if page["version"] == version else page
+    
+    async def close(self):
+        """释放资源"""
+
+
+class RemoteBackend:
+    """远程后端：通过HTTP访问独立部署的API服务"""
+    
+    def __init__(self, api_base_url: str):
+        self.api_base_url = api_base_url.rstrip("/")
+        self.metadata_ttl = settings.GRADIO_METADATA_TTL
+        self._client: Optional[httpx.AsyncClient] = None
+    
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """应用生命周期内共享的连接池客户端"""
+        if self._client is None:
+            self._client = httpx.AsyncClient(base_url=self.api_base_url, timeout=30.0)
+        return self._client
+    
+    async def stream_chat(self, message: str, agent_id: str, session_id: str) -> AsyncIterator[Tuple[str, Optional[str]]]:
+        """流式对话，解析SSE响应，产出 (文本片段, 情感)"""
+        async with self.client.stream(
+            "POST",
+            "/chat",
+            json={
+                "message": message,
+                "agent_id": agent_id,
+                "session_id": session_id,
+                "stream": True
+            },
+        ) as response:
+            if response.status_code != 200:
+                raise BackendError(response.status_code)
+            
+            async for line in response.aiter_lines():
+                if not line.startswith("data: "):
+                    continue
+                data_line = line[6:]  # 移除 "data: " 前缀
+                if data_line == "[DONE]":
+                    break
+                try:
+                    stream_data = json.loads(data_line)
+                except json.JSONDecodeError:
+                    continue
+                # 情感字段只在变化时出现
+                yield stream_data.get("content", ""), stream_data.get("emotion")
+    
+    async def fetch_metadata(self, version: Optional[str]) -> Optional[Dict[str, Any]]:
+        """获取agent元数据（带版本的条件请求），版本未变化时返回None"""
+        headers = {"If-None-Match": f'"{version}"'} if version is not None else None
+        response = await self.client.get("/agent/profiles", headers=headers)
+        if response.status_code == 304:
+            return None
+        if response.status_code != 200:
+            raise BackendError(response.status_code)
+        return response.json()
+    
+    async def fetch_history(
+        self, agent_id: str, session_id: str, since_seq: Optional[int] = None, version: Optional[str] = None
+    ) -> Optional[Dict[str, Any]]:
+        """获取一页对话历史（带版本的条件请求），版本未变化时返回None"""
+        params = {"session_id": session_id, "limit": settings.HISTORY_PAGE_MAX_SIZE}
+        if since_seq is not None:
+            params["since_seq"] = since_seq
+        headers = {"If-None-Match": f'"{version}"'} if version is not None else None
+        response = await self.client.get(f"/agent/{agent_id}/history", params=params, headers=headers)
+        if response.status_code == 304:
+            return None
+        if response.status_code != 200:
+            raise BackendError(response.status_code)
+        return response.json()
+    
+    async def close(self):
+        """关闭连接池"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+def create_backend():
+    """根据配置创建界面后端：默认进程内调用，配置了远程API地址时使用HTTP"""
+    if settings.GRADIO_API_BASE_URL:
+        return RemoteBackend(settings.GRADIO_API_BASE_URL)
+    return LocalBackend()
+
+
+def format_profile(profile: Dict[str, Any]) -> str:
+    """构建包含全身照的个人资料Markdown"""
+    profile_content = ""
+    profile_content += f"![{profile['name']}](/{profile['full_image']})\n\n"
+    
+    profile_content += f"""
+- **姓名**: {profile['name']}
+- **性格**: {profile['personality']}
+- **兴趣**: {', '.join(profile['interests'])}
+- **说话风格**: {profile['speaking_style']}
+- **背景**: {profile['background']}
+"""
+    return profile_content
+
+
+class AgentMetadata:
+    """
+    agent元数据缓存：列表、个人资料Markdown与头像路径
+    
+    按资料版本号失效；同时打开的多个页面共享一次刷新，远程模式下在 metadata_ttl 内不重复校验版本。
+    """
+    
+    def __init__(self, backend):
+        self.backend = backend
+        self.version: Optional[str] = None
+        self.agents: List[Dict[str, Any]] = []
+        self.profiles: Dict[str, str] = {}
+        self.avatars: Dict[str, str] = {}
+        self.checked_at = 0.0
+        self._refreshing: Optional[asyncio.Task] = None
+    
+    async def refresh(self):
+        """必要时从后端刷新（并发调用合并为一次）"""
+        if self.version is not None and time.monotonic() - self.checked_at < self.backend.metadata_ttl:
+            return
+        if self._refreshing is None:
+            self._refreshing = asyncio.create_task(self._refresh())
+        await asyncio.shield(self._refreshing)
+    
+    async def _refresh(self):
+        try:
+            metadata = await self.backend.fetch_metadata(self.version)
+            self.checked_at = time.monotonic()
+            if metadata is None:
+                return
+            self.agents = metadata["agents"]
+            self.profiles = {agent_id: format_profile(profile) for agent_id, profile in metadata["profiles"].items()}
+            self.avatars = {agent["id"]: agent.get("avatar", "images/canary/avatar.png") for agent in self.agents}
+            self.version = metadata["version"]
+        finally:
+            self._refreshing = None
+
+
+class ConversationHistory:
+    """
+    对话历史缓存：按 (agent_id, session_id) 缓存已获取的消息
+    
+    切换agent时只增量获取缓存版本之后的新消息，历史未变化时后端返回304；
+    会话被清空或重新创建（纪元变化）时重新获取最新一页。
+    """
+    
+    # 缓存的会话数量上限
+    max_entries = 256
+    
+    def __init__(self, backend):
+        self.backend = backend
+        # (agent_id, session_id) -> {"version", "epoch", "next_seq", "messages"}
+        self._entries: "OrderedDict[Tuple[str, str], Dict[str, Any]]" = OrderedDict()
+    
+    async def get(self, agent_id: str, session_id: str) -> List[dict]:
+        """获取对话历史（聊天API消息格式）"""
+        key = (agent_id, session_id)
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = await self._fetch_latest(agent_id, session_id)
+        else:
+            self._entries.move_to_end(key)
+            entry = await self._update(agent_id, session_id, entry)
+        
+        self._entries[key] = entry
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        # 返回副本，界面对列表的修改不影响缓存
+        return list(entry["messages"])
+    
+    async def _fetch_latest(self, agent_id: str, session_id: str) -> Dict[str, Any]:
+        """获取最新一页"""
+        page = await self.backend.fetch_history(agent_id, session_id)
+        return self._entry(page, [])
+    
+    async def _update(self, agent_id: str, session_id: str, entry: Dict[str, Any]) -> Dict[str, Any]:
+        """增量获取缓存之后的新消息"""
+        while True:
+            page = await self.backend.fetch_history(agent_id, session_id, entry["next_seq"], entry["version"])
+            if page is None:
+                return entry
+            if page["epoch"] != entry["epoch"]:
+                return await self._fetch_latest(agent_id, session_id)
+            entry = self._entry(page, entry["messages"])
+            if not page["has_more"]:
+                return entry
+            # 还有更新的消息：从本页之后继续获取，本页的版本号不代表已获取全部消息
+            entry["next_seq"] = page["turns"][-1]["seq"] + 1
+            entry["version"] = None
+    
+    def _entry(self, page: Dict[str, Any], messages: List[dict]) -> Dict[str, Any]:
+        """将一页消息合并进缓存条目（只保留最新的一页长度）"""
+        messages = messages + [{"role": turn["role"], "content": turn["content"]} for turn in page["turns"]]
+        return {
+            "version": page["version"],
+            "epoch": page["epoch"],
+            "next_seq": page["next_seq"],
+            "messages": messages[-settings.HISTORY_PAGE_MAX_SIZE:],
+        }
 
 
 class ChatUI:
     """聊天UI类"""
     
-    def __init__(self):
+    def __init__(self, backend=None):
         self.chat_history: List[dict] = []
-        self.api_base_url = f"http://{settings.HOST}:{settings.PORT}/api/v1"
+        self.backend = backend or create_backend()
+        self.metadata = AgentMetadata(self.backend)
+        self.histories = ConversationHistory(self.backend)
     
-    async def chat_with_birdiland(self, message: str, chat_history: List[dict], agent_id: str = "canary") -> AsyncGenerator[Tuple[str, List[dict]], None]:
+    async def chat_with_birdiland(self, message: str, chat_history: List[dict], agent_id: str = "canary", session_id: str = "default") -> AsyncGenerator[Tuple[str, List[dict]], None]:
         """与Birdiland聊天（支持流式响应）"""
         if not message.strip():
             # 如果消息为空，直接返回不处理
@@ -28,56 +281,32 @@ class ChatUI:
             # 预先添加空的助手消息，确保chat_history[-1]能正确修改
             chat_history.append({"role": "assistant", "content": ""})
             
-            # 调用后端API（使用流式响应）
-            async with httpx.AsyncClient() as client:
-                async with client.stream(
-                    "POST",
-                    f"{self.api_base_url}/chat",
-                    json={
-                        "message": message,
-                        "agent_id": agent_id,  # 传递选择的agent_id
-                        "stream": True
-                    },
-                    timeout=30.0
-                ) as response:
-                    
-                    if response.status_code == 200:
-                        full_response = ""
-                        emotion = "neutral"
-                        
-                        async for line in response.aiter_lines():
-                            if line.startswith("data: "):
-                                data_line = line[6:]  # 移除 "data: " 前缀
-                                
-                                if data_line == "[DONE]":
-                                    break
-                                
-                                try:
-                                    stream_data = json.loads(data_line)
-                                    content = stream_data.get("content", "")
-                                    emotion = stream_data.get("emotion", "neutral")
-                                    is_final = stream_data.get("is_final", False)
-                                    
-                                    # 更新响应内容
-                                    full_response += content
-                                    
-                                    # 更新聊天历史中的最后一条消息
-                                    chat_history[-1] = {"role": "assistant", "content": self._add_emotion_emoji(full_response, emotion)}
-                                    
-                                    # 返回更新后的聊天历史
-                                    yield "", chat_history
-                                    
-                                except json.JSONDecodeError:
-                                    continue
-                        
-                        # 最终更新（确保表情符号正确）
-                        chat_history[-1] = {"role": "assistant", "content": self._add_emotion_emoji(full_response, emotion)}
-                        yield "", chat_history
-                    else:
-                        error_msg = f"❌ 抱歉，服务暂时不可用 (错误: {response.status_code})"
-                        chat_history[-1] = {"role": "assistant", "content": error_msg}
-                        yield "", chat_history
+            full_response = ""
+            emotion = "neutral"
+            # 按帧率限制刷新：每次刷新只有最后一条消息的文本在末尾追加，
+            # Gradio 对流式输出按差异传输，追加的文本以增量形式发送给浏览器
+            updates = self.backend.stream_chat(message, agent_id, session_id)
+            async for batch in throttle(updates, 1 / settings.GRADIO_RENDER_FPS):
+                for content, new_emotion in batch:
+                    # 情感只在变化时给出
+                    if new_emotion is not None:
+                        emotion = new_emotion
+                    full_response += content
+                
+                # 更新聊天历史中的最后一条消息
+                chat_history[-1] = {"role": "assistant", "content": self._add_emotion_emoji(full_response, emotion)}
+                
+                # 返回更新后的聊天历史
+                yield "", chat_history
+            
+            # 最终更新（确保表情符号正确）
+            chat_history[-1] = {"role": "assistant", "content": self._add_emotion_emoji(full_response, emotion)}
+            yield "", chat_history
                     
+        except BackendError as e:
+            error_msg = f"❌ 抱歉，服务暂时不可用 (错误: {e.status_code})"
+            chat_history[-1] = {"role": "assistant", "content": error_msg}
+            yield "", chat_history
         except httpx.TimeoutException:
             error_msg = "⏰ 请求超时，请稍后重试"
             chat_history[-1] = {"role": "assistant", "content": error_msg}
@@ -106,62 +335,45 @@ class ChatUI:
     async def get_agents_list(self) -> list:
         """获取agent列表"""
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.get(f"{self.api_base_url}/agent/list")
-                if response.status_code == 200:
-                    return response.json()
-                else:
-                    return []
+            await self.metadata.refresh()
         except Exception as e:
             print(f"获取agent列表时出错: {str(e)}")
-            return []
+        return self.metadata.agents
     
     async def get_birdiland_profile(self, agent_id: str = "canary") -> str:
         """获取Birdiland个人资料"""
         try:
-            async with httpx.AsyncClient() as client:
-                # 获取个人资料详情
-                profile_response = await client.get(f"{self.api_base_url}/agent/{agent_id}/profile")
-                if profile_response.status_code == 200:
-                    profile = profile_response.json()
-                    
-                    # 构建包含全身照的个人资料
-                    profile_content = ""
-                    profile_content += f"![{profile['name']}](/{profile['full_image']})\n\n"
-                    
-                    profile_content += f"""
-- **姓名**: {profile['name']}
-- **性格**: {profile['personality']}
-- **兴趣**: {', '.join(profile['interests'])}
-- **说话风格**: {profile['speaking_style']}
-- **背景**: {profile['background']}
-"""
-                    return profile_content
-                else:
-                    return "❌ 无法获取个人资料信息"
+            await self.metadata.refresh()
         except Exception as e:
             return f"❌ 获取个人资料时出错: {str(e)}"
+        return self.metadata.profiles.get(agent_id, "❌ 无法获取个人资料信息")
+    
+    async def get_agent_avatar(self, agent_id: str) -> Optional[str]:
+        """根据agent_id获取对应的头像路径"""
+        try:
+            await self.metadata.refresh()
+        except Exception:
+            pass
+        return self.metadata.avatars.get(agent_id)
 
-    async def get_agent_conversation_history(self, agent_id: str) -> List[dict]:
+    async def get_agent_conversation_history(self, agent_id: str, session_id: str = "default") -> List[dict]:
         """获取指定agent的对话历史"""
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.get(f"{self.api_base_url}/agent/{agent_id}/history")
-                if response.status_code == 200:
-                    history = response.json()
-                    # 确保返回的格式与gradio兼容
-                    return history
-                else:
-                    return []
+            # 确保返回的格式与gradio兼容
+            return await self.histories.get(agent_id, session_id)
         except Exception as e:
             print(f"获取对话历史时出错: {str(e)}")
             return []
+    
+    async def close(self):
+        """关闭后端连接"""
+        await self.backend.close()
 
 
-def create_gradio_interface() -> gr.Blocks:
+def create_gradio_interface(chat_ui: Optional[ChatUI] = None) -> gr.Blocks:
     """创建Gradio界面"""
     
-    chat_ui = ChatUI()
+    chat_ui = chat_ui or ChatUI()
     
     with gr.Blocks(
         title="Birdiland 聊天助手",
@@ -197,6 +409,9 @@ def create_gradio_interface() -> gr.Blocks:
             # 隐藏组件用于保存用户输入
             user_message = gr.State()
             
+            # 每个页面加载时生成独立的会话ID
+            session_id = gr.State(lambda: uuid.uuid4().hex)
+            
             with gr.Column(scale=1):
                 # 数字人选择下拉框
                 gr.Markdown("### 选择数字人")
@@ -247,27 +462,14 @@ def create_gradio_interface() -> gr.Blocks:
             """当数字人选择改变时更新个人资料"""
             return await chat_ui.get_birdiland_profile(agent_id)
         
-        async def get_agent_avatar(agent_id: str) -> str:
-            """根据agent_id获取对应的头像路径"""
-            try:
-                async with httpx.AsyncClient() as client:
-                    response = await client.get(f"{chat_ui.api_base_url}/agent/list")
-                    if response.status_code == 200:
-                        agents = response.json()
-                        for agent in agents:
-                            if agent["id"] == agent_id:
-                                return agent.get("avatar", "images/canary/avatar.png")
-            except Exception as e:
-                return None
-        
         async def update_chatbot_avatar(agent_id):
             """更新聊天机器人的头像"""
-            avatar_path = await get_agent_avatar(agent_id)
+            avatar_path = await chat_ui.get_agent_avatar(agent_id)
             return gr.update(avatar_images=(None, avatar_path))
         
-        async def load_conversation_history_on_agent_change(agent_id):
+        async def load_conversation_history_on_agent_change(agent_id, session_id):
             """当切换角色时加载该角色的对话历史"""
-            history = await chat_ui.get_agent_conversation_history(agent_id)
+            history = await chat_ui.get_agent_conversation_history(agent_id, session_id)
             return history
         
         # 界面加载时自动加载agent列表和个人资料
@@ -294,7 +496,7 @@ def create_gradio_interface() -> gr.Blocks:
             outputs=[chatbot]
         ).then(
             load_conversation_history_on_agent_change,
-            inputs=[digital_human_dropdown],
+            inputs=[digital_human_dropdown, session_id],
             outputs=[chatbot]
         )
         
@@ -308,7 +510,7 @@ def create_gradio_interface() -> gr.Blocks:
             outputs=[msg, chatbot]
         ).then(
             chat_ui.chat_with_birdiland,
-            inputs=[user_message, chatbot, digital_human_dropdown],  # 添加agent_id输入
+            inputs=[user_message, chatbot, digital_human_dropdown, session_id],  # 添加agent_id和session_id输入
             outputs=[msg, chatbot]
         )
     
@@ -317,7 +519,10 @@ def create_gradio_interface() -> gr.Blocks:
 
 def mount_gradio_to_fastapi(app):
     """将Gradio界面挂载到FastAPI应用"""
-    interface = create_gradio_interface()
+    chat_ui = ChatUI()
+    interface = create_gradio_interface(chat_ui)
+    # 应用关闭时释放界面后端的连接池
+    app.state.chat_ui = chat_ui
     
     # 使用FastAPI的挂载方式，并配置防止阻塞
     import gradio as gr
@@ -0,0 +1,123 @@
+"""
+上游 LLM 客户端
+所有agent共享同一个 AsyncOpenAI 客户端及其连接池
+"""
+
+import asyncio
+import importlib.util
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional
+
+import httpx
+from openai import AsyncOpenAI
+
+from .config import settings
+
+
+_client: Optional[AsyncOpenAI] = None
+_hedge_client: Optional[AsyncOpenAI] = None
+_http_client: Optional[httpx.AsyncClient] = None
+_stream_slots: Optional[asyncio.Semaphore] = None
+
+
+def http2_available() -> bool:
+    """是否安装了 HTTP/2 支持（httpx[http2] 依赖的 h2 包）"""
+    return importlib.util.find_spec("h2") is not None
+
+
+def build_timeout() -> httpx.Timeout:
+    """根据配置构建上游请求超时"""
+    return httpx.Timeout(
+        settings.UPSTREAM_READ_TIMEOUT,
+        connect=settings.UPSTREAM_CONNECT_TIMEOUT,
+    )
+
+
+def create_http_client() -> httpx.AsyncClient:
+    """创建带连接池的 HTTP 客户端"""
+    return httpx.AsyncClient(
+        http2=settings.UPSTREAM_HTTP2 and http2_available(),
+        limits=httpx.Limits(
+            max_connections=settings.UPSTREAM_POOL_SIZE,
+            max_keepalive_connections=settings.UPSTREAM_MAX_KEEPALIVE,
+            keepalive_expiry=settings.UPSTREAM_KEEPALIVE_EXPIRY,
+        ),
+        timeout=build_timeout(),
+    )
+
+
+def get_client() -> AsyncOpenAI:
+    """获取共享的上游客户端（首次调用时创建）"""
+    global _client, _http_client
+    if _client is None:
+        _http_client = create_http_client()
+        _client = AsyncOpenAI(
+            api_key=settings.OPENAI_API_KEY,
+            base_url=settings.OPENAI_BASE_URL,
+            timeout=build_timeout(),
+            http_client=_http_client,
+            max_retries=0,  # 重试由 resilience.UpstreamGuard 统一处理
+        )
+    return _client
+
+
+def hedging_enabled() -> bool:
+    """是否配置了对冲请求的备用上游"""
+    return settings.UPSTREAM_HEDGE_DELAY > 0 and bool(
+        settings.UPSTREAM_HEDGE_BASE_URL or settings.UPSTREAM_HEDGE_MODEL
+    )
+
+
+def get_hedge_client() -> Optional[AsyncOpenAI]:
+    """获取对冲请求使用的客户端（与主客户端共享连接池；只配置了备用模型时即为主客户端）"""
+    global _hedge_client
+    if not hedging_enabled():
+        return None
+    if not settings.UPSTREAM_HEDGE_BASE_URL:
+        return get_client()
+    if _hedge_client is None:
+        get_client()
+        _hedge_client = AsyncOpenAI(
+            api_key=settings.UPSTREAM_HEDGE_API_KEY or settings.OPENAI_API_KEY,
+            base_url=settings.UPSTREAM_HEDGE_BASE_URL,
+            timeout=build_timeout(),
+            http_client=_http_client,
+            max_retries=0,
+        )
+    return _hedge_client
+
+
+@asynccontextmanager
+async def upstream_slot() -> AsyncIterator[None]:
+    """占用一个上游并发流名额（流式响应需在整个读取过程中持有）"""
+    global _stream_slots
+    if _stream_slots is None:
+        _stream_slots = asyncio.Semaphore(settings.UPSTREAM_MAX_CONCURRENT_STREAMS)
+    async with _stream_slots:
+        yield
+
+
+async def warm_up(connections: Optional[int] = None):
+    """预先建立上游连接（TCP/TLS握手），降低冷请求的首字延迟"""
+    if not settings.OPENAI_API_KEY:
+        return
+    count = connections if connections is not None else settings.UPSTREAM_PREWARM_CONNECTIONS
+    if count <= 0:
+        return
+
+    client = get_client()
+    # 并发请求才能建立多条连接；只关心握手，忽略响应状态
+    await asyncio.gather(
+        *(_http_client.head(str(client.base_url)) for _ in range(count)),
+        return_exceptions=True,
+    )
+
+
+async def close_client():
+    """关闭共享客户端及其连接池"""
+    global _client, _hedge_client, _http_client
+    if _client is not None:
+        await _client.close()
+    _client = None
+    _hedge_client = None
+    _http_client = None
@@ -2,27 +2,77 @@
 Birdiland 数字人主程序
 """
 
-import uvicorn
-from fastapi import FastAPI
-from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
+import argparse
+import asyncio
+import json
 import os
+from contextlib import asynccontextmanager, suppress
 from pathlib import Path
-from fastapi.responses import FileResponse
+
+# 最先导入，计时起点接近进程启动
+from .startup import startup_timer
+
+from fastapi import FastAPI
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import FileResponse, JSONResponse
 
 from .config import settings
-from .api.routes import router as api_router
-from .gradio_ui import mount_gradio_to_fastapi
+from .assets import CachedStaticFiles, asset_registry, prepare_assets
+
+
+# 运行模式：full 同时提供API和聊天界面，api 只提供API（不导入 Gradio）
+RUN_MODES = ("full", "api")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """应用生命周期：启动时预热上游连接并在后台检查资料文件变化，关闭时写入未落盘的历史并释放连接池"""
+    # 模块已在创建应用时导入
+    from . import llm
+    from .agent import agent_manager
+    from .emotion_model import emotion_classifier
+    from .registry import profile_registry
+
+    with startup_timer.phase("预热上游连接"):
+        await llm.warm_up()
+    if settings.EMOTION_MODEL_PRELOAD:
+        with startup_timer.phase("预加载情感模型"):
+            await emotion_classifier.load()
+    startup_timer.mark_ready()
+    if settings.STARTUP_REPORT:
+        print(startup_timer.report())
+    # 资料热重载在后台任务中检查，请求处理过程中不扫描文件系统
+    profiles_watcher = asyncio.create_task(profile_registry.watch())
+    yield
+    profiles_watcher.cancel()
+    with suppress(asyncio.CancelledError):
+        await profiles_watcher
+    chat_ui = getattr(app.state, "chat_ui", None)
+    if chat_ui is not None:
+        await chat_ui.close()
+    await emotion_classifier.close()
+    # 写入尚未落盘的对话历史
+    await agent_manager.session_store.close()
+    await llm.close_client()
 
 
 def create_app() -> FastAPI:
-    """创建FastAPI应用"""
+    """创建FastAPI应用（RUN_MODE=api 时不挂载聊天界面）"""
+    if settings.RUN_MODE not in RUN_MODES:
+        raise ValueError(f"未知的运行模式: {settings.RUN_MODE}（可选: {', '.join(RUN_MODES)}）")
+
+    with startup_timer.phase("导入对话服务"):
+        # 对话服务、上游客户端和会话存储在此导入，导入 birdiland.main 本身保持轻量
+        from .api.routes import router as api_router
+        from .registry import profile_registry
+
     app = FastAPI(
         title="Birdiland API",
         description="AI驱动的数字人API服务",
         version="0.1.0",
         docs_url="/docs",
         redoc_url="/redoc",
+        lifespan=lifespan,
     )
 
     # 添加CORS中间件
@@ -34,43 +84,100 @@ def create_app() -> FastAPI:
         allow_headers=["*"],
     )
 
+    # 个人资料改用优化后的图片变体（须在创建界面之前）
+    with startup_timer.phase("加载图片变体"):
+        if asset_registry.load():
+            # 资料文件热重载后同样适用
+            profile_registry.add_postprocessor(asset_registry.apply_to_profiles)
+
     # 注册API路由
     app.include_router(api_router, prefix="/api/v1")
 
-    # 挂载Gradio UI
-    app = mount_gradio_to_fastapi(app)
+    # 挂载Gradio UI（只在需要界面时导入 Gradio）
+    if settings.RUN_MODE == "full":
+        with startup_timer.phase("导入 Gradio"):
+            from .gradio_ui import mount_gradio_to_fastapi
+        with startup_timer.phase("构建聊天界面"):
+            app = mount_gradio_to_fastapi(app)
 
     root_dir = Path(__file__).parent.parent
 
-    app.mount("/images", StaticFiles(directory=str(root_dir / "images")), name="images")
+    # 带内容哈希的图片变体以不可变缓存头提供
+    app.mount("/images", CachedStaticFiles(directory=str(root_dir / "images")), name="images")
 
     @app.get("/favicon.ico", include_in_schema=False)
     async def get_favicon():
         return FileResponse(str(root_dir / "favicon.ico"))
 
+    # 应用清单中的图标指向对应尺寸的图标变体
+    web_manifest = asset_registry.rewrite_manifest(
+        json.loads((root_dir / "manifest.json").read_text(encoding="utf-8"))
+    )
+
     @app.get("/manifest.json", include_in_schema=False)
     async def manifest():
-        return FileResponse(str(root_dir / "manifest.json"))
+        return JSONResponse(web_manifest, media_type="application/manifest+json")
 
     return app
 
 
-def main():
+def parse_args(argv=None) -> argparse.Namespace:
+    """解析命令行参数（默认值来自配置）"""
+    parser = argparse.ArgumentParser(description="Birdiland 数字人服务")
+    parser.add_argument("--host", default=settings.HOST, help="监听地址")
+    parser.add_argument("--port", type=int, default=settings.PORT, help="监听端口")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=settings.WORKERS,
+        help="工作进程数，大于1时需要 sqlite 或 redis 会话存储",
+    )
+    parser.add_argument(
+        "--api-only",
+        action="store_true",
+        default=settings.RUN_MODE == "api",
+        help="只提供API，不加载聊天界面（等同于 RUN_MODE=api）",
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
     """主函数"""
-    app = create_app()
+    args = parse_args(argv)
+    if args.api_only:
+        # 写入环境变量，多进程模式下各工作进程重新读取配置时同样生效
+        os.environ["RUN_MODE"] = settings.RUN_MODE = "api"
+    if args.workers > 1 and settings.SESSION_BACKEND not in ("sqlite", "redis"):
+        # memory/durable 存储的会话只在单个进程内可见，请求随机落到不同进程会导致历史分裂
+        raise SystemExit("多个工作进程需要共享会话存储，请设置 SESSION_BACKEND=sqlite 或 SESSION_BACKEND=redis")
     
     print("🚀 Birdiland 数字人服务启动中...")
-    print(f"📖 API文档: http://{settings.HOST}:{settings.PORT}/docs")
-    print(f"💬 聊天界面: http://{settings.HOST}:{settings.PORT}/chat")
+    if settings.ASSET_BUILD_ON_STARTUP:
+        # 在启动工作进程之前生成一次，各工作进程只读取资源清单
+        prepare_assets()
+    print(f"📖 API文档: http://{args.host}:{args.port}/docs")
+    if settings.RUN_MODE == "api":
+        print("🔌 运行模式: 只提供API")
+    else:
+        print(f"💬 聊天界面: http://{args.host}:{args.port}/chat")
+    if args.workers > 1:
+        print(f"⚙️ 工作进程数: {args.workers}（会话存储: {settings.SESSION_BACKEND}）")
+        if settings.RUN_MODE == "full":
+            print("⚠️ 聊天界面的事件队列在进程内，多进程部署时需要负载均衡保持会话粘性")
     
+    import uvicorn
+
     uvicorn.run(
-        app,
-        host=settings.HOST,
-        port=settings.PORT,
+        # 多进程模式下每个工作进程各自导入并创建应用
+        "birdiland.main:create_app" if args.workers > 1 else create_app(),
+        factory=args.workers > 1,
+        workers=args.workers,
+        host=args.host,
+        port=args.port,
         log_level=settings.LOG_LEVEL.lower(),
         # 添加优雅关闭配置
         timeout_keep_alive=30,           # 保持连接超时时间（秒）
-        timeout_graceful_shutdown=3,   # 优雅关闭超时时间（秒）
+        timeout_graceful_shutdown=settings.SHUTDOWN_TIMEOUT,  # 优雅关闭超时时间（秒），之后写入未落盘的历史
     )
 
 
@@ -0,0 +1,71 @@
+"""
+系统提示词编译
+每个agent的系统提示词只构建一次，去除多余空白后连同token数一起缓存
+"""
+
+from typing import Any, Dict, Optional
+
+from .tokenizer import count_message_tokens
+
+
+SYSTEM_PROMPT_TEMPLATE = """
+你是{name}，一个AI驱动的数字人。
+
+性格特点：{personality}
+兴趣爱好：{interests}
+说话风格：{speaking_style}
+背景：{background}
+
+请以自然、友好的方式与用户对话，展现你的个性和特点。
+保持对话的连贯性和一致性，记住之前的对话内容。
+如果用户询问你的个人信息，可以适当分享。
+用中文进行对话，保持温暖和积极的态度。
+"""
+
+
+class CompiledPrompt:
+    """编译后的系统提示词"""
+
+    __slots__ = ("text", "tokens")
+
+    def __init__(self, text: str):
+        self.text = text
+        self.tokens = count_message_tokens(text)
+
+
+# 已编译的系统提示词缓存（agent_id -> CompiledPrompt）
+_compiled_prompts: Dict[str, CompiledPrompt] = {}
+
+
+def minify_prompt(text: str) -> str:
+    """去除每行首尾空白及空行"""
+    return "\n".join(line.strip() for line in text.splitlines() if line.strip())
+
+
+def compile_system_prompt(profile: Dict[str, Any]) -> CompiledPrompt:
+    """根据角色资料编译系统提示词"""
+    text = SYSTEM_PROMPT_TEMPLATE.format(
+        name=profile["name"],
+        personality=profile["personality"],
+        interests=", ".join(profile["interests"]),
+        speaking_style=profile["speaking_style"],
+        background=profile["background"],
+    )
+    return CompiledPrompt(minify_prompt(text))
+
+
+def get_system_prompt(agent_id: str, profile: Dict[str, Any]) -> CompiledPrompt:
+    """获取agent的系统提示词（首次调用时编译并缓存）"""
+    compiled = _compiled_prompts.get(agent_id)
+    if compiled is None:
+        compiled = compile_system_prompt(profile)
+        _compiled_prompts[agent_id] = compiled
+    return compiled
+
+
+def invalidate_system_prompts(agent_id: Optional[str] = None):
+    """使已编译的系统提示词失效（角色资料变更时调用）"""
+    if agent_id is None:
+        _compiled_prompts.clear()
+    else:
+        _compiled_prompts.pop(agent_id, None)
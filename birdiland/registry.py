@@ -0,0 +1,209 @@
+"""
+agent资料注册表
+从资料目录加载每个agent的资料文件（<agent_id>.json），经 Pydantic 校验后按id索引；
+文件变化时整体重新加载并原子替换，无需重启服务
+"""
+
+import asyncio
+import hashlib
+import json
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Mapping, Optional, Set, Tuple
+
+from pydantic import BaseModel
+
+from .config import settings
+
+
+# 内置资料目录
+DEFAULT_PROFILES_DIR = Path(__file__).parent / "profiles"
+
+
+class AgentProfile(BaseModel):
+    """agent资料文件格式"""
+    name: str
+    personality: str
+    interests: List[str]
+    speaking_style: str
+    background: str
+    avatar: str = ""
+    full_image: str = ""
+
+
+# 资料目录状态：每个文件的 (文件名, 修改时间, 大小)
+Signature = Tuple[Tuple[str, int, int], ...]
+
+
+class ProfileRegistry(Mapping[str, Dict[str, Any]]):
+    """
+    agent资料注册表（只读映射：agent_id -> 资料字典）
+
+    首次访问时加载；之后由 watch() 在后台每隔 reload_interval 秒检查资料文件是否变化，
+    扫描目录和读取文件都在线程中进行，访问注册表不会触及文件系统。重新加载时先完整读取并校验所有文件，
+    全部通过后才替换，任何文件有误都保留当前资料；替换后通知订阅者发生变化的agent。
+    """
+
+    def __init__(self, directory: Optional[Path] = None, reload_interval: Optional[float] = None):
+        self.directory = directory or _profiles_dir()
+        self.reload_interval = reload_interval if reload_interval is not None else settings.AGENT_RELOAD_INTERVAL
+        # 资料内容（含处理后的结果）的哈希，内容不变时重启前后保持一致，可直接作为 ETag
+        self.version = ""
+        self._profiles: Dict[str, Dict[str, Any]] = {}
+        self._signature: Optional[Signature] = None
+        # 加载后、替换前对资料的处理（如改用优化后的图片变体）
+        self._postprocessors: List[Callable[[Dict[str, Dict[str, Any]]], None]] = []
+        # 资料变化的订阅者，参数为发生变化（新增、修改、删除）的agent_id集合
+        self._listeners: List[Callable[[Set[str]], None]] = []
+
+    # 只读映射接口（首次读取时加载）
+
+    def __getitem__(self, agent_id: str) -> Dict[str, Any]:
+        self.ensure_loaded()
+        return self._profiles[agent_id]
+
+    def __iter__(self) -> Iterator[str]:
+        self.ensure_loaded()
+        return iter(list(self._profiles))
+
+    def __len__(self) -> int:
+        self.ensure_loaded()
+        return len(self._profiles)
+
+    def __contains__(self, agent_id: object) -> bool:
+        self.ensure_loaded()
+        return agent_id in self._profiles
+
+    def get(self, agent_id: str, default: Any = None) -> Any:
+        self.ensure_loaded()
+        return self._profiles.get(agent_id, default)
+
+    def keys(self):
+        return self.snapshot().keys()
+
+    def items(self):
+        return self.snapshot().items()
+
+    def values(self):
+        return self.snapshot().values()
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """当前全部资料（替换是原子的，返回的字典不会被后续的重新加载修改）"""
+        self.ensure_loaded()
+        return self._profiles
+
+    def subscribe(self, listener: Callable[[Set[str]], None]):
+        """订阅资料变化"""
+        self._listeners.append(listener)
+
+    def add_postprocessor(self, postprocessor: Callable[[Dict[str, Dict[str, Any]]], None]):
+        """添加资料处理函数，并立即对当前资料重新加载一次"""
+        if postprocessor not in self._postprocessors:
+            self._postprocessors.append(postprocessor)
+            self.reload(force=True)
+
+    def ensure_loaded(self):
+        """尚未加载时加载资料（之后的文件变化由 watch() 检查）"""
+        if self._signature is None:
+            self.reload()
+
+    async def watch(self):
+        """每隔 reload_interval 秒在线程中检查文件变化并重新加载（0 表示不热重载），由应用生命周期启动和取消"""
+        if self.reload_interval <= 0:
+            return
+        while True:
+            await asyncio.sleep(self.reload_interval)
+            signature = await asyncio.to_thread(self._scan)
+            if signature == self._signature:
+                continue
+            try:
+                profiles = await asyncio.to_thread(self._load, signature)
+            except (OSError, ValueError) as e:
+                self._replace(signature, None, e)
+            else:
+                self._replace(signature, profiles)
+
+    def reload(self, force: bool = False) -> bool:
+        """
+        资料文件有变化（或 force）时立即重新加载，返回是否替换了资料
+
+        首次加载失败时抛出异常；之后的加载失败只输出警告并保留当前资料，直到文件再次变化。
+        """
+        signature = self._scan()
+        if signature == self._signature and not force:
+            return False
+        try:
+            profiles = self._load(signature)
+        except (OSError, ValueError) as e:
+            return self._replace(signature, None, e)
+        return self._replace(signature, profiles)
+
+    def _replace(
+        self,
+        signature: Signature,
+        profiles: Optional[Dict[str, Dict[str, Any]]],
+        error: Optional[Exception] = None,
+    ) -> bool:
+        """用新加载的资料替换当前资料并通知订阅者；加载失败（error）时保留当前资料"""
+        first_load = self._signature is None
+        self._signature = signature
+        if error is not None:
+            if first_load:
+                raise error
+            print(f"⚠️ agent资料重新加载失败，继续使用当前资料: {error}")
+            return False
+
+        changed = {
+            agent_id
+            for agent_id in self._profiles.keys() | profiles.keys()
+            if self._profiles.get(agent_id) != profiles.get(agent_id)
+        }
+        self._profiles = profiles
+        self.version = content_version(profiles)
+        if changed:
+            for listener in self._listeners:
+                listener(changed)
+        return True
+
+    def _scan(self) -> Signature:
+        """读取资料目录中每个文件的修改时间和大小"""
+        entries = []
+        for path in self.directory.glob("*.json"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((path.name, stat.st_mtime_ns, stat.st_size))
+        return tuple(sorted(entries))
+
+    def _load(self, signature: Signature) -> Dict[str, Dict[str, Any]]:
+        """读取并校验所有资料文件（按文件名排序）"""
+        if not signature:
+            raise ValueError(f"资料目录中没有agent资料: {self.directory}")
+        profiles: Dict[str, Dict[str, Any]] = {}
+        for name, _, _ in signature:
+            path = self.directory / name
+            try:
+                with open(path, encoding="utf-8") as f:
+                    profile = AgentProfile.model_validate(json.load(f))
+            except ValueError as e:
+                # 校验错误和JSON格式错误都是 ValueError，附上文件名
+                raise ValueError(f"{name}: {e}") from None
+            profiles[path.stem] = profile.model_dump()
+        for postprocessor in self._postprocessors:
+            postprocessor(profiles)
+        return profiles
+
+
+def content_version(profiles: Dict[str, Dict[str, Any]]) -> str:
+    """资料内容的版本号（内容哈希）"""
+    data = json.dumps(profiles, ensure_ascii=False, sort_keys=True).encode("utf-8")
+    return hashlib.sha256(data).hexdigest()[:16]
+
+
+def _profiles_dir() -> Path:
+    """资料目录（可通过配置覆盖）"""
+    return Path(settings.AGENT_PROFILES_DIR) if settings.AGENT_PROFILES_DIR else DEFAULT_PROFILES_DIR
+
+
+# 全局agent资料注册表（首次访问时加载）
+profile_registry = ProfileRegistry()
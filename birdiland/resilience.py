@@ -0,0 +1,266 @@
+"""
+上游容错
+熔断器、带抖动的重试以及对冲请求（首个token超时后向备用上游发起第二个请求）
+"""
+
+import asyncio
+import random
+import time
+from typing import AsyncIterator, Awaitable, Callable, Dict, Optional, Tuple, TypeVar
+
+import httpx
+import openai
+
+from .config import settings
+
+T = TypeVar("T")
+
+# 流式请求的首个片段及剩余的流
+StreamStart = Tuple[Optional[str], AsyncIterator[str]]
+
+
+class CircuitOpenError(Exception):
+    """熔断器处于打开状态，请求被快速拒绝"""
+
+
+def is_retryable(error: BaseException) -> bool:
+    """是否为可重试的错误（连接失败、超时、限流、服务端错误）"""
+    return isinstance(
+        error,
+        (
+            openai.APIConnectionError,
+            openai.RateLimitError,
+            openai.InternalServerError,
+            httpx.TransportError,
+        ),
+    )
+
+
+def counts_as_failure(error: BaseException) -> bool:
+    """是否计入熔断失败（请求本身有误的4xx错误不代表上游故障）"""
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code >= 500 or error.status_code == 429
+    return True
+
+
+class CircuitBreaker:
+    """
+    熔断器
+
+    连续失败达到阈值后打开，打开期间直接拒绝请求；经过冷却时间后进入半开状态，
+    放行一个探测请求，成功则关闭，失败则重新打开。
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: Optional[int] = None, reset_timeout: Optional[float] = None):
+        self.failure_threshold = failure_threshold or settings.CIRCUIT_FAILURE_THRESHOLD
+        self.reset_timeout = reset_timeout if reset_timeout is not None else settings.CIRCUIT_RESET_TIMEOUT
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+
+    def allow(self) -> bool:
+        """是否允许发起请求"""
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+            self.state = self.HALF_OPEN
+            self._probing = False
+        if self.state == self.HALF_OPEN and not self._probing:
+            self._probing = True
+            return True
+        return False
+
+    def record_success(self):
+        """记录一次成功"""
+        self.state = self.CLOSED
+        self.failures = 0
+        self._probing = False
+
+    def record_failure(self):
+        """记录一次失败"""
+        self.failures += 1
+        self._probing = False
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+    def release_probe(self):
+        """
+        探测请求未得出结果就结束（被取消、调用方提前关闭流）时释放探测名额，
+        保持半开状态，由下一个请求重新探测
+        """
+        self._probing = False
+
+    def stats(self) -> Dict[str, object]:
+        """获取熔断器状态"""
+        return {"state": self.state, "failures": self.failures}
+
+
+def backoff_delay(attempt: int, base_delay: float) -> float:
+    """指数退避加完全抖动"""
+    return random.uniform(0, base_delay * (2 ** attempt))
+
+
+async def _close_stream(iterator: AsyncIterator[str]):
+    """关闭未读完的上游流（释放连接和并发名额）"""
+    aclose = getattr(iterator, "aclose", None)
+    if aclose is not None:
+        try:
+            await aclose()
+        except Exception:
+            pass
+
+
+class UpstreamGuard:
+    """上游调用保护：熔断、重试与对冲请求"""
+
+    def __init__(
+        self,
+        breaker: Optional[CircuitBreaker] = None,
+        max_retries: Optional[int] = None,
+        retry_base_delay: Optional[float] = None,
+        hedge_delay: Optional[float] = None,
+    ):
+        self.breaker = breaker or CircuitBreaker()
+        self.max_retries = max_retries if max_retries is not None else settings.UPSTREAM_MAX_RETRIES
+        self.retry_base_delay = retry_base_delay if retry_base_delay is not None else settings.UPSTREAM_RETRY_BASE_DELAY
+        self.hedge_delay = hedge_delay if hedge_delay is not None else settings.UPSTREAM_HEDGE_DELAY
+
+    async def _with_retries(self, factory: Callable[[], Awaitable[T]]) -> T:
+        """对可重试的错误进行带抖动的重试"""
+        attempt = 0
+        while True:
+            try:
+                return await factory()
+            except Exception as e:
+                if attempt >= self.max_retries or not is_retryable(e):
+                    raise
+                await asyncio.sleep(backoff_delay(attempt, self.retry_base_delay))
+                attempt += 1
+
+    async def _race(
+        self,
+        primary: Callable[[], Awaitable[T]],
+        secondary: Optional[Callable[[], Awaitable[T]]],
+        discard: Optional[Callable[[T], Awaitable[None]]] = None,
+    ) -> T:
+        """
+        主请求在对冲延迟内未完成（或已失败）时向备用上游发起第二个请求，
+        采用先成功的结果，取消另一个
+        """
+        primary_task = asyncio.ensure_future(self._with_retries(primary))
+        if secondary is None or self.hedge_delay <= 0:
+            return await primary_task
+
+        try:
+            done, _ = await asyncio.wait({primary_task}, timeout=self.hedge_delay)
+            if done and primary_task.exception() is None:
+                return primary_task.result()
+        except asyncio.CancelledError:
+            primary_task.cancel()
+            raise
+
+        tasks = [primary_task, asyncio.ensure_future(self._with_retries(secondary))]
+        pending = {task for task in tasks if not task.done()}
+        winner = None
+        try:
+            while winner is None and pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                winner = next((task for task in done if task.exception() is None), None)
+            if winner is None:
+                winner = next((task for task in tasks if task.exception() is None), None)
+            if winner is None:
+                raise primary_task.exception()
+            return winner.result()
+        finally:
+            for task in tasks:
+                if task is winner:
+                    continue
+                if not task.done():
+                    task.cancel()
+                elif discard is not None and not task.cancelled() and task.exception() is None:
+                    await discard(task.result())
+
+    def _check_circuit(self) -> bool:
+        """熔断器打开时快速失败，返回本次请求是否为半开状态的探测请求"""
+        if not self.breaker.allow():
+            raise CircuitOpenError("上游服务暂时不可用")
+        return self.breaker.state == CircuitBreaker.HALF_OPEN
+
+    def _record_error(self, error: BaseException):
+        """根据错误类型更新熔断器"""
+        if counts_as_failure(error):
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+
+    async def call(
+        self,
+        primary: Callable[[], Awaitable[T]],
+        secondary: Optional[Callable[[], Awaitable[T]]] = None,
+    ) -> T:
+        """受保护的非流式调用"""
+        probe = self._check_circuit()
+        try:
+            result = await self._race(primary, secondary)
+        except Exception as e:
+            self._record_error(e)
+            raise
+        finally:
+            # 取消时既不计为成功也不计为失败，只释放探测名额
+            if probe:
+                self.breaker.release_probe()
+        self.breaker.record_success()
+        return result
+
+    async def stream(
+        self,
+        primary: Callable[[], AsyncIterator[str]],
+        secondary: Optional[Callable[[], AsyncIterator[str]]] = None,
+    ) -> AsyncIterator[str]:
+        """受保护的流式调用：重试和对冲只作用于首个片段到达之前"""
+        probe = self._check_circuit()
+
+        async def start(factory: Callable[[], AsyncIterator[str]]) -> StreamStart:
+            iterator = factory()
+            try:
+                return await iterator.__anext__(), iterator
+            except StopAsyncIteration:
+                return None, iterator
+            except BaseException:
+                await _close_stream(iterator)
+                raise
+
+        async def discard(started: StreamStart):
+            await _close_stream(started[1])
+
+        iterator = None
+        try:
+            first, iterator = await self._race(
+                lambda: start(primary),
+                (lambda: start(secondary)) if secondary is not None else None,
+                discard,
+            )
+            if first is not None:
+                yield first
+                async for chunk in iterator:
+                    yield chunk
+        except Exception as e:
+            self._record_error(e)
+            raise
+        finally:
+            # 调用方提前停止读取时关闭上游流，并释放探测名额（不计入成功或失败）
+            if probe:
+                self.breaker.release_probe()
+            if iterator is not None:
+                await _close_stream(iterator)
+        self.breaker.record_success()
+
+
+# 全局上游保护实例（所有agent共享同一个上游，因此共享熔断状态）
+upstream_guard = UpstreamGuard()
@@ -0,0 +1,106 @@
+"""
+对话服务层
+API 路由、WebSocket 和 Gradio 界面共用的进程内接口，直接调用 agent_manager，
+界面无需再通过 HTTP 回环访问本服务
+"""
+
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from .agent import AGENT_PROFILES, BirdilandAgent, agent_manager
+from .config import settings
+from .registry import profile_registry
+from .session import DEFAULT_SESSION_ID
+from .sse import coalesce_chunks
+
+
+class ChatEvent:
+    """流式回复事件"""
+
+    __slots__ = ("content", "emotion", "is_final")
+
+    def __init__(self, content: str, emotion: Optional[str] = None, is_final: bool = False):
+        self.content = content
+        self.emotion = emotion  # 只在情感变化时（以及最终事件中）给出
+        self.is_final = is_final
+
+
+async def stream_reply(
+    agent: BirdilandAgent,
+    message: str,
+    session_id: str = DEFAULT_SESSION_ID,
+    heartbeat: float = 0,
+) -> AsyncIterator[Optional[ChatEvent]]:
+    """
+    流式生成回复事件
+
+    片段经过合并后产出，最后产出一个携带最终情感的结束事件；
+    heartbeat 大于0时，空闲超过该时间产出 None，由调用方发送心跳。
+    """
+    # 增量分析情感，每个片段只扫描一次
+    tracker = agent.create_emotion_tracker()
+    last_emotion = None
+    async for chunk in coalesce_chunks(agent.chat_stream(message, session_id), heartbeat=heartbeat):
+        if chunk is None:
+            yield None
+            continue
+        emotion = tracker.feed(chunk)
+        yield ChatEvent(chunk, emotion if emotion != last_emotion else None)
+        last_emotion = emotion
+
+    # 最终情感可由本地模型给出
+    yield ChatEvent("", await agent.analyze_emotion_async(tracker.text), is_final=True)
+
+
+def profiles_version() -> str:
+    """获取当前的agent资料版本号（文件变化由后台任务检查）；版本号为资料内容的哈希，界面据此使元数据缓存失效"""
+    profile_registry.ensure_loaded()
+    return profile_registry.version
+
+
+def get_agent_metadata() -> Dict[str, Any]:
+    """一次性获取版本号、agent列表及全部个人资料（界面加载只需一次请求）"""
+    return {
+        "version": profiles_version(),
+        "agents": list_agents(),
+        "profiles": dict(AGENT_PROFILES.snapshot()),
+    }
+
+
+def list_agents() -> List[Dict[str, Any]]:
+    """获取可用的agent列表"""
+    return agent_manager.get_available_agents()
+
+
+def get_profile(agent_id: str) -> Optional[Dict[str, Any]]:
+    """获取agent的个人资料，不存在时返回None"""
+    return AGENT_PROFILES.get(agent_id)
+
+
+async def get_history_page(
+    agent_id: str,
+    session_id: str = DEFAULT_SESSION_ID,
+    before_seq: Optional[int] = None,
+    since_seq: Optional[int] = None,
+    limit: Optional[int] = None,
+) -> Dict[str, Any]:
+    """
+    分页获取对话历史
+
+    默认返回最新的一页，before_seq 向前翻页，since_seq 增量读取该序号及之后的消息；
+    version 在历史变化（追加、清空）时变化，可作为 ETag；
+    epoch 变化表示会话已被清空或重新创建，客户端缓存的序号全部失效。
+    """
+    limit = min(limit or settings.HISTORY_PAGE_SIZE, settings.HISTORY_PAGE_MAX_SIZE)
+    agent = agent_manager.get_agent(agent_id)
+    session = await agent.sessions.run(agent.sessions.get, agent_id, session_id) if agent else None
+    if session is None:
+        return {"version": "0-0", "epoch": 0, "next_seq": 0, "turns": [], "has_more": False}
+
+    turns, has_more = session.page(limit, before_seq, since_seq)
+    return {
+        "version": session.history_version,
+        "epoch": session.epoch,
+        "next_seq": session.next_seq,
+        "turns": [turn.to_dict() for turn in turns],
+        "has_more": has_more,
+    }
@@ -0,0 +1,257 @@
+"""
+会话存储
+按 (agent_id, session_id) 管理对话历史，支持会话数量/内存上限以及 LRU/TTL 淘汰
+"""
+
+import random
+import time
+from collections import OrderedDict, deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple, TypeVar
+
+from .config import settings
+from .tokenizer import count_message_tokens
+
+
+T = TypeVar("T")
+
+# 默认会话ID（未指定session_id的调用共用此会话）
+DEFAULT_SESSION_ID = "default"
+
+# 每条消息的固定开销估算（字典、字符串对象等），用于内存统计
+MESSAGE_OVERHEAD_BYTES = 64
+
+
+def message_size(content: str) -> int:
+    """估算单条消息占用的字节数"""
+    return len(content.encode("utf-8")) + MESSAGE_OVERHEAD_BYTES
+
+
+def new_epoch() -> int:
+    """生成会话纪元：会话创建或清空时更换，与消息序号一起构成历史版本"""
+    return random.getrandbits(31)
+
+
+class Turn:
+    """一条对话消息，缓存其token数"""
+
+    __slots__ = ("seq", "role", "content", "tokens")
+
+    def __init__(self, role: str, content: str, seq: int = 0):
+        self.seq = seq
+        self.role = role
+        self.content = content
+        self.tokens = count_message_tokens(content)
+
+    def to_message(self) -> Dict[str, str]:
+        """转换为聊天API使用的消息格式"""
+        return {"role": self.role, "content": self.content}
+
+    def to_dict(self) -> Dict[str, object]:
+        """转换为带序号的历史记录格式"""
+        return {"seq": self.seq, "role": self.role, "content": self.content}
+
+
+class Session:
+    """单个会话（某个agent与某个用户之间的对话）"""
+
+    def __init__(self, agent_id: str, session_id: str, max_messages: int):
+        self.agent_id = agent_id
+        self.session_id = session_id
+        self.max_messages = max_messages
+        # 环形缓冲区，追加和淘汰最旧消息均为 O(1)
+        self.turns: Deque[Turn] = deque(maxlen=max_messages)
+        self.next_seq = 0
+        # 历史只会追加，因此 (纪元, next_seq) 即为历史版本；清空或重新创建时更换纪元
+        self.epoch = new_epoch()
+        self.size_bytes = 0
+        self.last_access = time.monotonic()
+
+        # 上下文窗口起点：seq小于此值的消息不再原样发送，而是折叠进摘要
+        self.window_start = 0
+        self.summary = ""
+        # seq小于此值的消息已折叠进摘要
+        self.summarized_seq = 0
+        # 已移出窗口、等待折叠进摘要的消息
+        self.pending_summary: Deque[Turn] = deque(maxlen=settings.SUMMARY_MAX_PENDING)
+
+    @property
+    def history(self) -> List[Dict[str, str]]:
+        """对话历史（聊天API消息格式）"""
+        return [turn.to_message() for turn in self.turns]
+
+    @property
+    def history_version(self) -> str:
+        """历史版本号，历史内容变化时随之变化"""
+        return f"{self.epoch}-{self.next_seq}"
+
+    def page(
+        self,
+        limit: int,
+        before_seq: Optional[int] = None,
+        since_seq: Optional[int] = None,
+    ) -> Tuple[List[Turn], bool]:
+        """
+        分页读取历史，返回 (消息列表, 是否还有更多)
+
+        指定 since_seq 时返回 seq 不小于它的最早 limit 条消息（增量读取），更多指更新的消息；
+        否则返回 seq 小于 before_seq（默认为全部）的最新 limit 条消息，更多指更早的消息。
+        """
+        if since_seq is not None:
+            turns = [turn for turn in self.turns if turn.seq >= since_seq]
+            return turns[:limit], len(turns) > limit
+        turns = list(self.turns) if before_seq is None else [turn for turn in self.turns if turn.seq < before_seq]
+        return turns[-limit:], len(turns) > limit
+
+    def window_turns(self) -> List[Turn]:
+        """当前上下文窗口内的消息（按时间顺序）"""
+        return [turn for turn in self.turns if turn.seq >= self.window_start]
+
+    def advance_window(self, seq: int):
+        """将窗口起点推进到seq，移出窗口的消息进入待摘要队列"""
+        for turn in self.turns:
+            if turn.seq >= seq:
+                break
+            if turn.seq >= self.window_start:
+                self.pending_summary.append(turn)
+        self.window_start = max(self.window_start, seq)
+
+    def append(self, role: str, content: str) -> int:
+        """追加一条消息，返回占用字节数的变化量"""
+        delta = message_size(content)
+
+        # 缓冲区已满时，最旧的消息会被挤出
+        if len(self.turns) == self.max_messages:
+            evicted = self.turns[0]
+            delta -= message_size(evicted.content)
+            self.advance_window(evicted.seq + 1)
+        self.turns.append(Turn(role, content, self.next_seq))
+        self.next_seq += 1
+
+        self.size_bytes += delta
+        return delta
+
+    def copy(self) -> "Session":
+        """复制会话（消息对象不可变，可以共用；两个副本之后的修改互不影响）"""
+        session = Session.__new__(Session)
+        session.__dict__.update(self.__dict__)
+        session.turns = deque(self.turns, maxlen=self.max_messages)
+        session.pending_summary = deque(self.pending_summary, maxlen=self.pending_summary.maxlen)
+        return session
+
+    def clear(self) -> int:
+        """清空会话历史，返回占用字节数的变化量"""
+        delta = -self.size_bytes
+        self.turns.clear()
+        self.pending_summary.clear()
+        self.window_start = self.next_seq
+        self.summary = ""
+        self.summarized_seq = self.next_seq
+        self.epoch = new_epoch()
+        self.size_bytes = 0
+        return delta
+
+
+class SessionStore:
+    """会话存储，O(1) 查找，按最近访问顺序进行 LRU/TTL 淘汰"""
+
+    def __init__(
+        self,
+        max_sessions: Optional[int] = None,
+        max_bytes: Optional[int] = None,
+        ttl_seconds: Optional[float] = None,
+    ):
+        self.max_sessions = max_sessions or settings.SESSION_MAX_COUNT
+        self.max_bytes = max_bytes or settings.SESSION_MAX_BYTES
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else settings.SESSION_TTL_SECONDS
+
+        # OrderedDict 按访问时间排序，最久未访问的在最前面
+        self._sessions: "OrderedDict[Tuple[str, str], Session]" = OrderedDict()
+        self.total_bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def get(self, agent_id: str, session_id: str) -> Optional[Session]:
+        """获取会话（不存在或已过期时返回None）"""
+        self._evict_expired()
+        key = (agent_id, session_id)
+        session = self._sessions.get(key)
+        if session is not None:
+            self._touch(key, session)
+        return session
+
+    def get_or_create(self, agent_id: str, session_id: str, max_messages: int) -> Session:
+        """获取会话，不存在时创建"""
+        session = self.get(agent_id, session_id)
+        if session is None:
+            session = Session(agent_id, session_id, max_messages)
+            self._sessions[(agent_id, session_id)] = session
+            self._evict_overflow(keep=session)
+        return session
+
+    def append(self, session: Session, role: str, content: str):
+        """向会话追加消息并更新内存统计"""
+        self.total_bytes += session.append(role, content)
+        self._touch((session.agent_id, session.session_id), session)
+        self._evict_overflow(keep=session)
+
+    def save(self, session: Session):
+        """保存会话的窗口起点和摘要（内存存储中会话对象即为存储本身，无需操作）"""
+
+    def clear(self, agent_id: str, session_id: str):
+        """清空指定会话的历史"""
+        session = self._sessions.pop((agent_id, session_id), None)
+        if session is not None:
+            self.total_bytes += session.clear()
+
+    async def run(self, fn: Callable[..., T], *args: Any) -> T:
+        """
+        执行访问会话存储的同步操作（如读取历史后构建提示词、记录一轮对话）
+
+        内存存储直接在事件循环中执行；访问磁盘或网络的共享存储在存储线程中执行，
+        等待锁或网络往返时不阻塞其他请求。
+        """
+        return fn(*args)
+
+    async def close(self):
+        """关闭存储（内存存储无需操作）"""
+
+    def stats(self) -> Dict[str, int]:
+        """获取存储统计信息"""
+        return {
+            "sessions": len(self._sessions),
+            "bytes": self.total_bytes,
+            "max_sessions": self.max_sessions,
+            "max_bytes": self.max_bytes,
+        }
+
+    def _touch(self, key: Tuple[str, str], session: Session):
+        """标记会话为最近访问"""
+        session.last_access = time.monotonic()
+        self._sessions.move_to_end(key)
+
+    def _remove_oldest(self):
+        """移除最久未访问的会话"""
+        _, session = self._sessions.popitem(last=False)
+        self.total_bytes -= session.size_bytes
+
+    def _evict_expired(self):
+        """淘汰过期会话（按访问顺序排列，只需检查队首）"""
+        if self.ttl_seconds <= 0:
+            return
+        deadline = time.monotonic() - self.ttl_seconds
+        while self._sessions:
+            oldest = next(iter(self._sessions.values()))
+            if oldest.last_access >= deadline:
+                break
+            self._remove_oldest()
+
+    def _evict_overflow(self, keep: Session):
+        """超出会话数量或内存上限时淘汰最久未访问的会话"""
+        while len(self._sessions) > 1 and (
+            len(self._sessions) > self.max_sessions or self.total_bytes > self.max_bytes
+        ):
+            oldest = next(iter(self._sessions.values()))
+            if oldest is keep:
+                break
+            self._remove_oldest()
@@ -0,0 +1,112 @@
+"""
+请求合并（single-flight）
+相同的并发上游请求只执行一次，结果分发给所有等待者；流式响应通过多播缓冲区分发
+"""
+
+import asyncio
+from contextlib import aclosing
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+class StreamBroadcast:
+    """流式响应多播缓冲区：一个上游流，多个订阅者（后加入的订阅者从头回放）"""
+
+    def __init__(self, source: AsyncIterator[str], on_finish: Callable[["StreamBroadcast"], None]):
+        self.chunks: List[str] = []
+        self.done = False
+        # 所有订阅者都已离开、上游读取已被取消（不再接受新的订阅者）
+        self.cancelled = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self._changed = asyncio.Event()
+        self._on_finish = on_finish
+        self._task = asyncio.create_task(self._pump(source))
+
+    def _notify(self):
+        """唤醒所有等待新片段的订阅者"""
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def _pump(self, source: AsyncIterator[str]):
+        """读取上游流并写入缓冲区"""
+        try:
+            async for chunk in source:
+                self.chunks.append(chunk)
+                self._notify()
+        except BaseException as e:
+            self.error = e
+        finally:
+            self.done = True
+            self._on_finish(self)
+            self._notify()
+
+    async def subscribe(self) -> AsyncIterator[str]:
+        """订阅流式片段"""
+        self.subscribers += 1
+        position = 0
+        try:
+            while True:
+                while position < len(self.chunks):
+                    yield self.chunks[position]
+                    position += 1
+                if self.done:
+                    if self.error is not None:
+                        raise self.error
+                    return
+                await self._changed.wait()
+        finally:
+            self.subscribers -= 1
+            # 所有订阅者都已离开时停止读取上游
+            if self.subscribers == 0 and not self.done:
+                # 先移出合并表再取消，之后到达的相同请求发起新的上游流
+                self.cancelled = True
+                self._on_finish(self)
+                self._task.cancel()
+
+
+class SingleFlight:
+    """按键合并进行中的请求"""
+
+    def __init__(self):
+        self._calls: Dict[str, asyncio.Task] = {}
+        self._streams: Dict[str, StreamBroadcast] = {}
+
+    def __len__(self) -> int:
+        return len(self._calls) + len(self._streams)
+
+    async def do(self, key: str, factory: Callable[[], Awaitable[T]]) -> T:
+        """
+        执行请求；相同键的请求正在进行时直接等待其结果
+
+        请求在独立任务中运行，单个等待者被取消不会影响其他等待者。
+        """
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(factory())
+            self._calls[key] = task
+            task.add_done_callback(lambda _: self._calls.pop(key, None))
+        return await asyncio.shield(task)
+
+    async def stream(self, key: str, factory: Callable[[], AsyncIterator[str]]) -> AsyncIterator[str]:
+        """
+        订阅流式请求；相同键的流正在进行时加入其多播缓冲区
+
+        查找和订阅在首次读取时同步完成，中间没有让出事件循环，不会加入刚被取消或已结束的多播。
+        """
+        broadcast = self._streams.get(key)
+        if broadcast is None or broadcast.cancelled or broadcast.done:
+            broadcast = StreamBroadcast(factory(), lambda finished: self._forget(key, finished))
+            self._streams[key] = broadcast
+        async with aclosing(broadcast.subscribe()) as chunks:
+            async for chunk in chunks:
+                yield chunk
+
+    def _forget(self, key: str, broadcast: StreamBroadcast):
+        """移出合并表（键已对应新的多播时保留）"""
+        if self._streams.get(key) is broadcast:
+            del self._streams[key]
+
+# 全局请求合并实例（键中包含agent_id，所有agent共享）
+inflight_requests = SingleFlight()
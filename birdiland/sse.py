@@ -0,0 +1,173 @@
+"""
+Server-Sent Events 流式输出
+将上游的细碎片段按时间或字节数合并为较大的帧，空闲时发送心跳，
+帧使用预先构建的 JSON 编码器和常量片段拼接，降低每个片段的序列化开销；
+界面刷新同样按帧率合并更新
+"""
+
+import asyncio
+import json
+from typing import AsyncIterator, Dict, List, Optional, TypeVar
+
+from .config import settings
+
+
+T = TypeVar("T")
+
+# 预先构建的编码器（避免每帧重新创建编码器和解析参数）
+_encode = json.JSONEncoder(ensure_ascii=False, separators=(",", ":")).encode
+
+# 心跳为 SSE 注释行，客户端会忽略
+HEARTBEAT_FRAME = ": ping\n\n"
+DONE_FRAME = "data: [DONE]\n\n"
+
+# 情感字段片段缓存（情感标签数量很少）
+_emotion_fields: Dict[str, str] = {}
+
+
+def _emotion_field(emotion: str) -> str:
+    """获取 ,"emotion":"..." 片段"""
+    field = _emotion_fields.get(emotion)
+    if field is None:
+        field = _emotion_fields[emotion] = ',"emotion":' + _encode(emotion)
+    return field
+
+
+def format_event(event_id: int, content: str, emotion: Optional[str] = None, is_final: bool = False) -> str:
+    """
+    构造一帧 SSE 事件
+
+    Args:
+        event_id: 事件ID（客户端断线重连时通过 Last-Event-ID 回传）
+        content: 文本内容
+        emotion: 情感标签，未变化时传 None 以省略该字段
+        is_final: 是否为最后一帧
+    """
+    data = '{"content":' + _encode(content)
+    if emotion is not None:
+        data += _emotion_field(emotion)
+    data += ',"is_final":true}' if is_final else ',"is_final":false}'
+    return f"id: {event_id}\ndata: {data}\n\n"
+
+
+async def coalesce_chunks(
+    source: AsyncIterator[str],
+    flush_interval: Optional[float] = None,
+    flush_bytes: Optional[int] = None,
+    heartbeat: Optional[float] = None,
+) -> AsyncIterator[Optional[str]]:
+    """
+    合并流式片段
+
+    第一个片段到达后立即输出，不增加首字延迟；之后的片段在缓冲区中第一个片段到达后经过
+    flush_interval 秒，或缓冲内容达到 flush_bytes 字节时输出一次；
+    没有任何输出超过 heartbeat 秒时产出 None，由调用方发送心跳。
+
+    Args:
+        source: 上游文本片段
+        flush_interval: 最长缓冲时间（秒），0 表示不按时间合并
+        flush_bytes: 缓冲字节数上限
+        heartbeat: 心跳间隔（秒），0 表示不发送心跳
+    """
+    flush_interval = flush_interval if flush_interval is not None else settings.SSE_FLUSH_INTERVAL_MS / 1000
+    flush_bytes = flush_bytes if flush_bytes is not None else settings.SSE_FLUSH_BYTES
+    heartbeat = heartbeat if heartbeat is not None else settings.SSE_HEARTBEAT_SECONDS
+
+    loop = asyncio.get_running_loop()
+    iterator = source.__aiter__()
+    buffer = []
+    size = 0
+    deadline = 0.0
+    first = True
+    pending: Optional[asyncio.Future] = None
+    try:
+        while True:
+            if pending is None:
+                pending = asyncio.ensure_future(iterator.__anext__())
+            if buffer:
+                timeout = max(0.0, deadline - loop.time())
+            else:
+                timeout = heartbeat if heartbeat > 0 else None
+            done, _ = await asyncio.wait({pending}, timeout=timeout)
+
+            if not done:
+                # 等待下一个片段超时：输出缓冲内容，或在空闲时发送心跳
+                if buffer:
+                    yield "".join(buffer)
+                    buffer, size = [], 0
+                else:
+                    yield None
+                continue
+
+            future, pending = pending, None
+            try:
+                chunk = future.result()
+            except StopAsyncIteration:
+                break
+
+            if first and chunk:
+                first = False
+                yield chunk
+                continue
+            if not buffer:
+                deadline = loop.time() + flush_interval
+            buffer.append(chunk)
+            size += len(chunk.encode("utf-8"))
+            if size >= flush_bytes or flush_interval <= 0:
+                yield "".join(buffer)
+                buffer, size = [], 0
+
+        if buffer:
+            yield "".join(buffer)
+    finally:
+        # 调用方提前停止时取消正在等待的片段并关闭上游
+        if pending is not None:
+            pending.cancel()
+            try:
+                await pending
+            except BaseException:
+                pass
+        aclose = getattr(iterator, "aclose", None)
+        if aclose is not None:
+            await aclose()
+
+
+async def throttle(source: AsyncIterator[T], interval: float) -> AsyncIterator[List[T]]:
+    """
+    按帧率合并更新：第一个条目立即产出，之后每个间隔最多产出一次，
+    产出间隔内到达的所有条目；上游停顿时已到达的条目也会按时产出
+    """
+    loop = asyncio.get_running_loop()
+    iterator = source.__aiter__()
+    batch: List[T] = []
+    next_render = 0.0
+    pending: Optional[asyncio.Future] = None
+    try:
+        while True:
+            if pending is None:
+                pending = asyncio.ensure_future(iterator.__anext__())
+            timeout = max(0.0, next_render - loop.time()) if batch else None
+            done, _ = await asyncio.wait({pending}, timeout=timeout)
+            if done:
+                future, pending = pending, None
+                try:
+                    batch.append(future.result())
+                except StopAsyncIteration:
+                    break
+            if batch and loop.time() >= next_render:
+                yield batch
+                batch = []
+                next_render = loop.time() + interval
+        if batch:
+            yield batch
+    finally:
+        # 调用方提前停止（如用户中断）时取消等待并关闭上游
+        if pending is not None:
+            pending.cancel()
+            try:
+                await pending
+            except BaseException:
+                pass
+        aclose = getattr(iterator, "aclose", None)
+        if aclose is not None:
+            await aclose()
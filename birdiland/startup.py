@@ -0,0 +1,58 @@
+"""
+启动耗时统计
+按阶段记录模块导入、应用构建和启动预热的耗时，启动完成后输出报告
+"""
+
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Tuple
+
+
+class StartupTimer:
+    """启动阶段计时器"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases: List[Tuple[str, float]] = []
+        self.ready_at = 0.0
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """记录一个阶段的耗时"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append((name, time.perf_counter() - start))
+
+    def mark_ready(self):
+        """标记启动完成（开始接受请求）"""
+        self.ready_at = time.perf_counter()
+
+    @property
+    def total(self) -> float:
+        """从导入本模块到启动完成（尚未完成时到当前）的耗时"""
+        return (self.ready_at or time.perf_counter()) - self.started
+
+    def report(self) -> str:
+        """生成各阶段耗时报告"""
+        # 未单独计时的部分（FastAPI 等基础模块的导入、应用对象的创建）
+        other = self.total - sum(seconds for _, seconds in self.phases)
+        phases = self.phases + [("其他", max(0.0, other))]
+        width = max(len(name) for name, _ in phases)
+        lines = [f"⏱️ 启动耗时 {self.total:.2f}s"]
+        for name, seconds in phases:
+            lines.append(f"   {name.ljust(width)}  {seconds * 1000:8.1f} ms")
+        return "\n".join(lines)
+
+    def stats(self) -> Dict[str, object]:
+        """获取各阶段耗时（毫秒）"""
+        return {
+            "total_ms": round(self.total * 1000, 1),
+            "ready": bool(self.ready_at),
+            "phases": {name: round(seconds * 1000, 1) for name, seconds in self.phases},
+        }
+
+
+# 全局启动计时器（birdiland.main 最先导入，计时起点接近进程启动）
+startup_timer = StartupTimer()
@@ -0,0 +1,952 @@
+"""
+持久化与可共享的会话存储后端
+内存中的 SessionStore 重启即丢失；DurableSessionStore 以 write-behind 方式将历史写入 SQLite。
+多个工作进程需要使用同一主机上的 SQLite（WAL模式）或 Redis 协议的存储，
+使任意进程都能读到同一会话的历史、窗口起点和摘要
+"""
+
+import asyncio
+import functools
+import json
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple, TypeVar
+
+from .config import settings
+from .session import Session, SessionStore, Turn, message_size, new_epoch
+
+
+T = TypeVar("T")
+
+# 会话版本：(纪元, 版本号)。会话被删除后重新创建时版本号从头计数，纪元保证版本不会重复
+Version = Tuple[int, int]
+
+# 会话存储后端名称
+SESSION_BACKENDS = ("memory", "durable", "sqlite", "redis")
+
+# 每个进程缓存的会话快照数量（版本号未变化时不重新读取消息）
+SNAPSHOT_CACHE_SIZE = 1024
+
+# 最近访问时间的写入间隔（秒），避免每次读取都产生一次写入
+TOUCH_INTERVAL = 10.0
+
+
+def restore_session(
+    agent_id: str,
+    session_id: str,
+    state: Dict[str, Any],
+    turns: Iterable[Tuple[int, str, str]],
+) -> Session:
+    """根据持久化的状态重建会话对象"""
+    max_messages = int(state["max_messages"])
+    session = Session(agent_id, session_id, max_messages)
+    session.next_seq = int(state["next_seq"])
+    session.window_start = int(state["window_start"])
+    session.summarized_seq = int(state["summarized_seq"])
+    session.summary = state["summary"]
+    session.epoch = int(state.get("epoch", 0))
+
+    ring_start = session.next_seq - max_messages
+    for seq, role, content in sorted(turns):
+        turn = Turn(role, content, seq)
+        if seq >= ring_start:
+            session.turns.append(turn)
+            session.size_bytes += message_size(content)
+        if session.summarized_seq <= seq < session.window_start:
+            session.pending_summary.append(turn)
+    return session
+
+
+def retained_from(next_seq: int, max_messages: int, summarized_seq: int) -> int:
+    """需要保留的最早消息：环形缓冲区内的消息，以及移出缓冲区但尚未折叠进摘要的消息"""
+    ring_start = max(0, next_seq - max_messages)
+    return min(ring_start, max(summarized_seq, ring_start - settings.SUMMARY_MAX_PENDING))
+
+
+class SharedSessionStore(ABC):
+    """
+    共享会话存储的公共逻辑
+
+    每次读取只查询会话的版本号，版本未变化时复用本进程缓存的会话快照；
+    所有修改都直接写入存储并递增版本号，其他进程下次读取时重新加载。
+    读写会等待数据库锁或网络往返，由 run() 在存储线程中执行。缓存的快照只在锁内读写，
+    get() 返回快照的副本，并发的请求各自修改自己的副本，不会互相影响。
+    """
+
+    def __init__(self, ttl_seconds: Optional[float] = None, sweep_interval: Optional[float] = None):
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else settings.SESSION_TTL_SECONDS
+        self.sweep_interval = sweep_interval if sweep_interval is not None else settings.SESSION_SWEEP_INTERVAL
+        # (agent_id, session_id) -> (版本, 会话快照)
+        self._snapshots: "OrderedDict[Tuple[str, str], Tuple[Version, Session]]" = OrderedDict()
+        self._snapshots_lock = threading.RLock()
+        self._last_sweep = 0.0
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    async def run(self, fn: Callable[..., T], *args: Any) -> T:
+        """在存储线程中执行访问存储的同步操作，不阻塞事件循环"""
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=max(settings.SESSION_IO_THREADS, 1), thread_name_prefix="session-store"
+            )
+        return await asyncio.get_running_loop().run_in_executor(self._executor, functools.partial(fn, *args))
+
+    def _shutdown_executor(self):
+        """等待进行中的存储操作完成并停止存储线程"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    # 以下方法由具体后端实现
+
+    @abstractmethod
+    def _read_version(self, agent_id: str, session_id: str) -> Optional[Tuple[Version, float]]:
+        """读取会话的 (版本, 最近访问时间)，不存在时返回None"""
+
+    @abstractmethod
+    def _load(self, agent_id: str, session_id: str) -> Optional[Tuple[Version, Session]]:
+        """读取完整会话"""
+
+    @abstractmethod
+    def _create(self, agent_id: str, session_id: str, max_messages: int):
+        """创建会话（已存在时不做任何操作）"""
+
+    @abstractmethod
+    def _append(self, session: Session, role: str, content: str) -> Tuple[Version, Version]:
+        """追加消息，返回 (追加前的版本, 追加后的版本)"""
+
+    @abstractmethod
+    def _save(self, session: Session) -> Optional[Tuple[Version, Version]]:
+        """
+        写回窗口起点和摘要（只向前推进，不覆盖其他进程更新的进度），返回 (写入前的版本, 写入后的版本)；
+        会话已被删除或重新创建时不写入，返回None
+        """
+
+    @abstractmethod
+    def _delete(self, agent_id: str, session_id: str):
+        """删除会话"""
+
+    @abstractmethod
+    def _touch(self, agent_id: str, session_id: str, now: float):
+        """更新最近访问时间"""
+
+    def _sweep(self, now: float):
+        """清理过期会话（默认不做任何操作，由存储自身的过期机制清理）"""
+
+    @abstractmethod
+    def _count(self) -> int:
+        """会话数量"""
+
+    # 与 SessionStore 相同的接口
+
+    def __len__(self) -> int:
+        return self._count()
+
+    def get(self, agent_id: str, session_id: str) -> Optional[Session]:
+        """获取会话（不存在或已过期时返回None）"""
+        now = time.time()
+        if now - self._last_sweep >= self.sweep_interval:
+            self._last_sweep = now
+            self._sweep(now)
+
+        key = (agent_id, session_id)
+        current = self._read_version(agent_id, session_id)
+        if current is None:
+            with self._snapshots_lock:
+                self._snapshots.pop(key, None)
+            return None
+        version, last_access = current
+        if self.ttl_seconds > 0 and now - last_access > self.ttl_seconds:
+            self.clear(agent_id, session_id)
+            return None
+
+        session = None
+        with self._snapshots_lock:
+            cached = self._snapshots.get(key)
+            if cached is not None and cached[0] == version:
+                self._snapshots.move_to_end(key)
+                session = cached[1].copy()
+        if session is None:
+            loaded = self._load(agent_id, session_id)
+            if loaded is None:
+                return None
+            version, session = loaded
+            self._remember(key, version, session.copy())
+
+        if now - last_access >= TOUCH_INTERVAL:
+            self._touch(agent_id, session_id, now)
+        session.last_access = time.monotonic()
+        return session
+
+    def get_or_create(self, agent_id: str, session_id: str, max_messages: int) -> Session:
+        """获取会话，不存在时创建"""
+        session = self.get(agent_id, session_id)
+        if session is None:
+            self._create(agent_id, session_id, max_messages)
+            session = self.get(agent_id, session_id)
+        return session
+
+    def append(self, session: Session, role: str, content: str):
+        """追加消息"""
+        before, after = self._append(session, role, content)
+        session.append(role, content)
+        key = (session.agent_id, session.session_id)
+        with self._snapshots_lock:
+            snapshot = self._current(key, before)
+            if snapshot is not None:
+                # 期间没有其他进程写入，缓存的快照同步追加即可，无需重新读取
+                snapshot.append(role, content)
+                self._remember(key, after, snapshot)
+            else:
+                self._snapshots.pop(key, None)
+
+    def save(self, session: Session):
+        """保存会话的窗口起点和摘要"""
+        versions = self._save(session)
+        key = (session.agent_id, session.session_id)
+        with self._snapshots_lock:
+            snapshot = self._current(key, versions[0]) if versions is not None else None
+            if snapshot is not None:
+                # 按与存储相同的规则合并进缓存的快照：窗口起点和摘要进度都只向前推进
+                snapshot.advance_window(session.window_start)
+                if session.summarized_seq > snapshot.summarized_seq:
+                    snapshot.summary = session.summary
+                    snapshot.summarized_seq = session.summarized_seq
+                    pending = [turn for turn in snapshot.pending_summary if turn.seq >= session.summarized_seq]
+                    snapshot.pending_summary.clear()
+                    snapshot.pending_summary.extend(pending)
+                self._remember(key, versions[1], snapshot)
+            else:
+                self._snapshots.pop(key, None)
+
+    def clear(self, agent_id: str, session_id: str):
+        """清空指定会话的历史"""
+        self._delete(agent_id, session_id)
+        with self._snapshots_lock:
+            self._snapshots.pop((agent_id, session_id), None)
+
+    def _current(self, key: Tuple[str, str], version: Version) -> Optional[Session]:
+        """缓存的快照恰好是指定版本时返回该快照（调用方需持有锁）"""
+        cached = self._snapshots.get(key)
+        return cached[1] if cached is not None and cached[0] == version else None
+
+    def _remember(self, key: Tuple[str, str], version: Version, session: Session):
+        """缓存会话快照"""
+        with self._snapshots_lock:
+            self._snapshots[key] = (version, session)
+            self._snapshots.move_to_end(key)
+            while len(self._snapshots) > SNAPSHOT_CACHE_SIZE:
+                self._snapshots.popitem(last=False)
+
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    agent_id TEXT NOT NULL,
+    session_id TEXT NOT NULL,
+    max_messages INTEGER NOT NULL,
+    next_seq INTEGER NOT NULL DEFAULT 0,
+    window_start INTEGER NOT NULL DEFAULT 0,
+    summarized_seq INTEGER NOT NULL DEFAULT 0,
+    summary TEXT NOT NULL DEFAULT '',
+    epoch INTEGER NOT NULL DEFAULT 0,
+    version INTEGER NOT NULL DEFAULT 0,
+    last_access REAL NOT NULL,
+    PRIMARY KEY (agent_id, session_id)
+);
+CREATE INDEX IF NOT EXISTS sessions_last_access ON sessions (last_access);
+CREATE TABLE IF NOT EXISTS turns (
+    agent_id TEXT NOT NULL,
+    session_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    PRIMARY KEY (agent_id, session_id, seq)
+) WITHOUT ROWID;
+"""
+
+
+def open_database(path: str) -> sqlite3.Connection:
+    """打开会话数据库（WAL模式）并创建表结构"""
+    if path != ":memory:":
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+    # 手动管理事务；连接可能在写入线程中使用，由调用方保证同一时刻只有一个线程访问
+    db = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute("PRAGMA synchronous=NORMAL")
+    db.execute("PRAGMA busy_timeout=5000")
+    db.executescript(SQLITE_SCHEMA)
+    # 早期版本创建的数据库没有 epoch 列
+    columns = {row[1] for row in db.execute("PRAGMA table_info(sessions)")}
+    if "epoch" not in columns:
+        db.execute("ALTER TABLE sessions ADD COLUMN epoch INTEGER NOT NULL DEFAULT 0")
+    return db
+
+
+def read_session(db: sqlite3.Connection, agent_id: str, session_id: str) -> Optional[Tuple[Version, Session]]:
+    """在一个读事务中读取会话状态和消息，返回 (版本, 会话)"""
+    db.execute("BEGIN")
+    try:
+        row = db.execute(
+            "SELECT version, max_messages, next_seq, window_start, summarized_seq, summary, epoch "
+            "FROM sessions WHERE agent_id = ? AND session_id = ?",
+            (agent_id, session_id),
+        ).fetchone()
+        if row is None:
+            return None
+        turns = db.execute(
+            "SELECT seq, role, content FROM turns WHERE agent_id = ? AND session_id = ?",
+            (agent_id, session_id),
+        ).fetchall()
+    finally:
+        db.execute("COMMIT")
+    version, max_messages, next_seq, window_start, summarized_seq, summary, epoch = row
+    state = {
+        "epoch": epoch,
+        "max_messages": max_messages,
+        "next_seq": next_seq,
+        "window_start": window_start,
+        "summarized_seq": summarized_seq,
+        "summary": summary,
+    }
+    return (epoch, version), restore_session(agent_id, session_id, state, turns)
+
+
+def sweep_database(db: sqlite3.Connection, now: float, ttl_seconds: float, max_sessions: int):
+    """删除过期会话及超出数量上限的最久未访问会话（在调用方的写事务中执行）"""
+    if ttl_seconds > 0:
+        db.execute("DELETE FROM sessions WHERE last_access < ?", (now - ttl_seconds,))
+    db.execute(
+        "DELETE FROM sessions WHERE rowid IN "
+        "(SELECT rowid FROM sessions ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+        (max_sessions,),
+    )
+    db.execute(
+        "DELETE FROM turns WHERE NOT EXISTS (SELECT 1 FROM sessions s "
+        "WHERE s.agent_id = turns.agent_id AND s.session_id = turns.session_id)"
+    )
+
+
+class SqliteSessionStore(SharedSessionStore):
+    """
+    SQLite 会话存储（WAL模式），同一主机上的多个工作进程共享同一个数据库文件
+
+    每个存储线程使用各自的连接，读取可以并发，写事务由 SQLite 的锁排队。
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        max_sessions: Optional[int] = None,
+        ttl_seconds: Optional[float] = None,
+        sweep_interval: Optional[float] = None,
+    ):
+        super().__init__(ttl_seconds, sweep_interval)
+        self.path = path or settings.SESSION_SQLITE_PATH
+        self.max_sessions = max_sessions or settings.SESSION_MAX_COUNT
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+
+    @property
+    def db(self) -> sqlite3.Connection:
+        """当前线程的数据库连接（首次使用时打开）"""
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = self._local.db = open_database(self.path)
+            with self._snapshots_lock:
+                self._connections.append(db)
+        return db
+
+    async def close(self):
+        """停止存储线程并关闭所有数据库连接"""
+        self._shutdown_executor()
+        with self._snapshots_lock:
+            connections, self._connections = self._connections, []
+        for db in connections:
+            db.close()
+        self._local = threading.local()
+
+    def _read_version(self, agent_id: str, session_id: str) -> Optional[Tuple[Version, float]]:
+        row = self.db.execute(
+            "SELECT epoch, version, last_access FROM sessions WHERE agent_id = ? AND session_id = ?",
+            (agent_id, session_id),
+        ).fetchone()
+        return ((row[0], row[1]), row[2]) if row is not None else None
+
+    def _load(self, agent_id: str, session_id: str) -> Optional[Tuple[Version, Session]]:
+        return read_session(self.db, agent_id, session_id)
+
+    def _create(self, agent_id: str, session_id: str, max_messages: int):
+        self.db.execute(
+            "INSERT OR IGNORE INTO sessions (agent_id, session_id, max_messages, epoch, last_access) VALUES (?, ?, ?, ?, ?)",
+            (agent_id, session_id, max_messages, new_epoch(), time.time()),
+        )
+
+    def _append(self, session: Session, role: str, content: str) -> Tuple[Version, Version]:
+        db = self.db
+        key = (session.agent_id, session.session_id)
+        # 写事务立即加锁，多个进程同时追加时按顺序分配seq
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            db.execute(
+                "INSERT OR IGNORE INTO sessions (agent_id, session_id, max_messages, epoch, last_access) VALUES (?, ?, ?, ?, ?)",
+                (*key, session.max_messages, new_epoch(), time.time()),
+            )
+            epoch, version, max_messages, next_seq, window_start, summarized_seq = db.execute(
+                "SELECT epoch, version, max_messages, next_seq, window_start, summarized_seq "
+                "FROM sessions WHERE agent_id = ? AND session_id = ?",
+                key,
+            ).fetchone()
+            db.execute(
+                "INSERT INTO turns (agent_id, session_id, seq, role, content) VALUES (?, ?, ?, ?, ?)",
+                (*key, next_seq, role, content),
+            )
+            next_seq += 1
+            # 被挤出环形缓冲区的消息同时移出上下文窗口（与内存存储一致）
+            window_start = max(window_start, next_seq - max_messages)
+            db.execute(
+                "DELETE FROM turns WHERE agent_id = ? AND session_id = ? AND seq < ?",
+                (*key, retained_from(next_seq, max_messages, summarized_seq)),
+            )
+            db.execute(
+                "UPDATE sessions SET next_seq = ?, window_start = ?, version = ?, last_access = ? "
+                "WHERE agent_id = ? AND session_id = ?",
+                (next_seq, window_start, version + 1, time.time(), *key),
+            )
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        return (epoch, version), (epoch, version + 1)
+
+    def _save(self, session: Session) -> Optional[Tuple[Version, Version]]:
+        row = self.db.execute(
+            "UPDATE sessions SET "
+            "window_start = MAX(window_start, ?), "
+            "summary = CASE WHEN ? > summarized_seq THEN ? ELSE summary END, "
+            "summarized_seq = MAX(summarized_seq, ?), "
+            "version = version + 1 "
+            "WHERE agent_id = ? AND session_id = ? AND epoch = ? RETURNING version",
+            (
+                session.window_start,
+                session.summarized_seq,
+                session.summary,
+                session.summarized_seq,
+                session.agent_id,
+                session.session_id,
+                session.epoch,
+            ),
+        ).fetchone()
+        if row is None:
+            return None
+        return (session.epoch, row[0] - 1), (session.epoch, row[0])
+
+    def _delete(self, agent_id: str, session_id: str):
+        db = self.db
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            db.execute("DELETE FROM sessions WHERE agent_id = ? AND session_id = ?", (agent_id, session_id))
+            db.execute("DELETE FROM turns WHERE agent_id = ? AND session_id = ?", (agent_id, session_id))
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+
+    def _touch(self, agent_id: str, session_id: str, now: float):
+        self.db.execute(
+            "UPDATE sessions SET last_access = ? WHERE agent_id = ? AND session_id = ?",
+            (now, agent_id, session_id),
+        )
+
+    def _sweep(self, now: float):
+        """删除过期会话及超出数量上限的最久未访问会话"""
+        db = self.db
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            sweep_database(db, now, self.ttl_seconds, self.max_sessions)
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+
+    def _count(self) -> int:
+        return self.db.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+    def stats(self) -> Dict[str, Any]:
+        """获取存储统计信息（统计全部消息的大小，需通过 run() 在存储线程中调用）"""
+        sessions, size = self.db.execute(
+            "SELECT (SELECT COUNT(*) FROM sessions), (SELECT COALESCE(SUM(LENGTH(CAST(content AS BLOB))), 0) FROM turns)"
+        ).fetchone()
+        return {
+            "backend": "sqlite",
+            "sessions": sessions,
+            "bytes": size,
+            "max_sessions": self.max_sessions,
+            "cached_snapshots": len(self._snapshots),
+        }
+
+
+class RedisSessionStore(SharedSessionStore):
+    """
+    Redis 协议会话存储（需要安装 redis 包），可由 Redis 或兼容的本地服务提供
+
+    会话状态保存在哈希中，消息保存在列表中，两者都按闲置过期时间设置 TTL；
+    会话数量由服务端的内存淘汰策略控制。
+    """
+
+    def __init__(self, url: Optional[str] = None, prefix: Optional[str] = None, ttl_seconds: Optional[float] = None):
+        super().__init__(ttl_seconds)
+        self.url = url or settings.SESSION_REDIS_URL
+        self.prefix = prefix if prefix is not None else settings.SESSION_REDIS_PREFIX
+        self._redis = None
+
+    @property
+    def redis(self):
+        """Redis 客户端（首次使用时连接；客户端自带连接池，各存储线程共用）"""
+        if self._redis is None:
+            import redis
+
+            with self._snapshots_lock:
+                if self._redis is None:
+                    self._redis = redis.Redis.from_url(self.url, decode_responses=True)
+        return self._redis
+
+    async def close(self):
+        """停止存储线程并关闭连接"""
+        self._shutdown_executor()
+        if self._redis is not None:
+            self._redis.close()
+            self._redis = None
+
+    def _keys(self, agent_id: str, session_id: str) -> Tuple[str, str]:
+        """会话状态与消息列表的键"""
+        suffix = f"{agent_id}:{session_id}"
+        return f"{self.prefix}:session:{suffix}", f"{self.prefix}:turns:{suffix}"
+
+    def _expire(self, pipe, *keys: str):
+        """设置闲置过期时间"""
+        if self.ttl_seconds > 0:
+            for key in keys:
+                pipe.expire(key, int(self.ttl_seconds))
+
+    def _read_version(self, agent_id: str, session_id: str) -> Optional[Tuple[Version, float]]:
+        epoch, version, last_access = self.redis.hmget(
+            self._keys(agent_id, session_id)[0], "epoch", "version", "last_access"
+        )
+        if version is None:
+            return None
+        return (int(epoch or 0), int(version)), float(last_access) if last_access else time.time()
+
+    def _load(self, agent_id: str, session_id: str) -> Optional[Tuple[Version, Session]]:
+        state_key, turns_key = self._keys(agent_id, session_id)
+        pipe = self.redis.pipeline(transaction=True)
+        pipe.hgetall(state_key)
+        pipe.lrange(turns_key, 0, -1)
+        state, raw_turns = pipe.execute()
+        if not state:
+            return None
+        turns = [tuple(json.loads(item)) for item in raw_turns]
+        version = (int(state.get("epoch", 0)), int(state["version"]))
+        return version, restore_session(agent_id, session_id, state, turns)
+
+    def _initial_state(self, max_messages: int) -> Dict[str, Any]:
+        """新会话的初始状态"""
+        return {
+            "max_messages": max_messages,
+            "epoch": new_epoch(),
+            "next_seq": 0,
+            "window_start": 0,
+            "summarized_seq": 0,
+            "summary": "",
+            "version": 0,
+            "last_access": time.time(),
+        }
+
+    def _create(self, agent_id: str, session_id: str, max_messages: int):
+        state_key, _ = self._keys(agent_id, session_id)
+
+        def create(pipe):
+            if pipe.exists(state_key):
+                return
+            pipe.multi()
+            pipe.hset(state_key, mapping=self._initial_state(max_messages))
+            self._expire(pipe, state_key)
+
+        self.redis.transaction(create, state_key)
+
+    def _append(self, session: Session, role: str, content: str) -> Tuple[Version, Version]:
+        state_key, turns_key = self._keys(session.agent_id, session.session_id)
+
+        def update(pipe) -> Tuple[Version, Version]:
+            # WATCH 期间读取状态，其他进程并发修改时整个事务自动重试
+            state = pipe.hgetall(state_key) or self._initial_state(session.max_messages)
+            epoch = int(state.get("epoch", 0))
+            version = int(state["version"])
+            max_messages = int(state["max_messages"])
+            seq = int(state["next_seq"])
+            next_seq = seq + 1
+            keep = next_seq - retained_from(next_seq, max_messages, int(state["summarized_seq"]))
+
+            pipe.multi()
+            pipe.rpush(turns_key, json.dumps([seq, role, content], ensure_ascii=False))
+            pipe.ltrim(turns_key, -keep, -1)
+            pipe.hset(state_key, mapping={
+                "max_messages": max_messages,
+                "epoch": epoch,
+                "next_seq": next_seq,
+                "window_start": max(int(state["window_start"]), next_seq - max_messages),
+                "summarized_seq": state["summarized_seq"],
+                "summary": state["summary"],
+                "version": version + 1,
+                "last_access": time.time(),
+            })
+            self._expire(pipe, state_key, turns_key)
+            return (epoch, version), (epoch, version + 1)
+
+        return self.redis.transaction(update, state_key, turns_key, value_from_callable=True)
+
+    def _save(self, session: Session) -> Optional[Tuple[Version, Version]]:
+        state_key, _ = self._keys(session.agent_id, session.session_id)
+
+        def update(pipe) -> Optional[Tuple[Version, Version]]:
+            state = pipe.hgetall(state_key)
+            if not state or int(state.get("epoch", 0)) != session.epoch:
+                return None
+            version = int(state["version"])
+            updates = {
+                "window_start": max(int(state["window_start"]), session.window_start),
+                "version": version + 1,
+            }
+            if session.summarized_seq > int(state["summarized_seq"]):
+                updates["summary"] = session.summary
+                updates["summarized_seq"] = session.summarized_seq
+            pipe.multi()
+            pipe.hset(state_key, mapping=updates)
+            return (session.epoch, version), (session.epoch, version + 1)
+
+        return self.redis.transaction(update, state_key, value_from_callable=True)
+
+    def _delete(self, agent_id: str, session_id: str):
+        self.redis.delete(*self._keys(agent_id, session_id))
+
+    def _touch(self, agent_id: str, session_id: str, now: float):
+        pipe = self.redis.pipeline(transaction=False)
+        keys = self._keys(agent_id, session_id)
+        pipe.hset(keys[0], "last_access", now)
+        self._expire(pipe, *keys)
+        pipe.execute()
+
+    def _count(self) -> int:
+        return sum(1 for _ in self.redis.scan_iter(f"{self.prefix}:session:*", count=1000))
+
+    def stats(self) -> Dict[str, Any]:
+        """获取存储统计信息（不扫描键空间）"""
+        return {"backend": "redis", "url": self.url, "cached_snapshots": len(self._snapshots)}
+
+
+class DurableSessionStore(SessionStore):
+    """
+    持久化会话存储（单进程）
+
+    读写都在内存中的 SessionStore 完成，修改由后台任务按批次写入 SQLite（write-behind），
+    追加消息不会等待磁盘；内存中没有的冷会话在首次访问时从磁盘加载，关闭时写入所有未落盘的修改。
+    磁盘上的会话与内存一样受 ttl_seconds 和 max_sessions 限制：过期的会话不再加载，
+    写入批次时定期清理过期及超出数量上限的会话。
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        flush_interval: Optional[float] = None,
+        batch_size: Optional[int] = None,
+        max_sessions: Optional[int] = None,
+        max_bytes: Optional[int] = None,
+        ttl_seconds: Optional[float] = None,
+        sweep_interval: Optional[float] = None,
+    ):
+        super().__init__(max_sessions, max_bytes, ttl_seconds)
+        self.path = path or settings.SESSION_SQLITE_PATH
+        self.flush_interval = flush_interval if flush_interval is not None else settings.HISTORY_FLUSH_INTERVAL
+        self.batch_size = batch_size or settings.HISTORY_FLUSH_BATCH_SIZE
+        self.sweep_interval = sweep_interval if sweep_interval is not None else settings.SESSION_SWEEP_INTERVAL
+        self._db: Optional[sqlite3.Connection] = None
+        # 写入连接只在写入线程（以及关闭时）使用，由锁保证同一时刻只有一个线程访问
+        self._db_lock = threading.Lock()
+        # 加载冷会话使用独立的只读连接：WAL模式下读取不等待写事务，也不等待写入线程持有的锁
+        self._reader: Optional[sqlite3.Connection] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+        # 等待写入的修改：新消息、需要更新状态的会话、需要删除的会话
+        self._pending_turns: Dict[Tuple[str, str], List[Tuple[int, str, str]]] = {}
+        self._dirty: Dict[Tuple[str, str], Session] = {}
+        self._deleted: Set[Tuple[str, str]] = set()
+        self._pending_count = 0
+        # 正在写入的批次涉及的会话（写入完成前磁盘上的数据不是最新的）
+        self._writing: Dict[Tuple[str, str], Session] = {}
+        self._writing_deleted: Set[Tuple[str, str]] = set()
+        self._flush_task: Optional[asyncio.Task] = None
+        self._batch_full: Optional[asyncio.Event] = None
+        self._last_sweep = 0.0
+
+        # 统计信息
+        self.flushes = 0
+        self.flushed_turns = 0
+        self.loaded = 0
+
+    @property
+    def db(self) -> sqlite3.Connection:
+        """写入连接（首次使用时打开）"""
+        if self._db is None:
+            self._db = open_database(self.path)
+        return self._db
+
+    @property
+    def reader(self) -> sqlite3.Connection:
+        """加载冷会话的读取连接（首次使用时打开，只在事件循环线程中使用）"""
+        if self._reader is None:
+            self._reader = open_database(self.path)
+        return self._reader
+
+    def get(self, agent_id: str, session_id: str) -> Optional[Session]:
+        """获取会话，内存中没有时从磁盘加载"""
+        session = super().get(agent_id, session_id)
+        if session is None:
+            session = self._load(agent_id, session_id)
+        return session
+
+    def append(self, session: Session, role: str, content: str):
+        """追加消息（写入内存并排队等待落盘）"""
+        seq = session.next_seq
+        super().append(session, role, content)
+        key = (session.agent_id, session.session_id)
+        self._pending_turns.setdefault(key, []).append((seq, role, content))
+        self._mark_dirty(key, session)
+
+    def save(self, session: Session):
+        """排队写入会话的窗口起点和摘要"""
+        self._mark_dirty((session.agent_id, session.session_id), session)
+
+    def clear(self, agent_id: str, session_id: str):
+        """清空会话（丢弃尚未写入的修改并排队删除磁盘上的记录）"""
+        super().clear(agent_id, session_id)
+        key = (agent_id, session_id)
+        self._pending_count -= len(self._pending_turns.pop(key, ()))
+        self._dirty.pop(key, None)
+        self._deleted.add(key)
+        self._schedule_flush()
+
+    def _mark_dirty(self, key: Tuple[str, str], session: Session):
+        """记录需要写入的会话"""
+        # 清空后又写入的会话保留待删除标记：新会话的seq从0开始，写入前必须先删除磁盘上的旧消息
+        self._dirty[key] = session
+        self._pending_count += 1
+        self._schedule_flush()
+
+    def _load(self, agent_id: str, session_id: str) -> Optional[Session]:
+        """从磁盘加载冷会话"""
+        key = (agent_id, session_id)
+        # 会话已被挤出内存但修改尚未落盘时，直接复用内存中的会话对象
+        session = self._dirty.get(key) or self._writing.get(key)
+        if session is None:
+            if key in self._deleted or key in self._writing_deleted:
+                return None
+            # 正在写入的批次涉及的会话已在上面从内存中取得，读到的已提交数据对其余会话是最新的
+            row = self.reader.execute(
+                "SELECT last_access FROM sessions WHERE agent_id = ? AND session_id = ?", key
+            ).fetchone()
+            expired = row is not None and self.ttl_seconds > 0 and time.time() - row[0] > self.ttl_seconds
+            loaded = read_session(self.reader, agent_id, session_id) if row is not None and not expired else None
+            if expired:
+                # 已过期的会话不再加载，并排队删除磁盘上的记录
+                self._deleted.add(key)
+                self._schedule_flush()
+            if loaded is None:
+                return None
+            session = loaded[1]
+            self.loaded += 1
+        self._sessions[key] = session
+        self.total_bytes += session.size_bytes
+        self._evict_overflow(keep=session)
+        return session
+
+    def _schedule_flush(self):
+        """确保后台写入任务在运行；积压达到批次大小时立即写入"""
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # 没有事件循环（如同步脚本中）时直接写入
+            self._write(self._take_batch())
+            return
+        if self._batch_full is None:
+            self._batch_full = asyncio.Event()
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = loop.create_task(self._flush_loop())
+        if self._pending_count >= self.batch_size:
+            self._batch_full.set()
+
+    async def _flush_loop(self):
+        """每隔 flush_interval 秒（或积压达到批次大小时）写入一批修改，直到没有积压"""
+        while self._has_pending():
+            try:
+                await asyncio.wait_for(self._batch_full.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._batch_full.clear()
+            await self.flush()
+
+    def _has_pending(self) -> bool:
+        return bool(self._pending_turns or self._dirty or self._deleted)
+
+    def _take_batch(self) -> Optional[Dict[str, Any]]:
+        """取出所有待写入的修改（在事件循环线程中复制会话状态，写入线程不接触会话对象）"""
+        if not self._has_pending():
+            return None
+        now = time.time()
+        batch = {
+            "deleted": list(self._deleted),
+            "turns": [
+                (agent_id, session_id, seq, role, content)
+                for (agent_id, session_id), turns in self._pending_turns.items()
+                for seq, role, content in turns
+            ],
+            "states": [
+                (
+                    session.agent_id,
+                    session.session_id,
+                    session.max_messages,
+                    session.next_seq,
+                    session.window_start,
+                    session.summarized_seq,
+                    session.summary,
+                    session.epoch,
+                    now,
+                )
+                for session in self._dirty.values()
+            ],
+            "sweep": None,
+            "touched": [],
+        }
+        if now - self._last_sweep >= self.sweep_interval:
+            # 清理前先写入内存中会话的最近访问时间，只读未写的活跃会话不会被当作过期或最久未访问
+            self._last_sweep = now
+            monotonic = time.monotonic()
+            batch["sweep"] = now
+            batch["touched"] = [
+                (now - (monotonic - session.last_access), agent_id, session_id)
+                for (agent_id, session_id), session in self._sessions.items()
+            ]
+        self._deleted = set()
+        self._pending_turns = {}
+        self._dirty = {}
+        self._pending_count = 0
+        return batch
+
+    def _write(self, batch: Optional[Dict[str, Any]]):
+        """在一个事务中写入一批修改"""
+        if batch is None:
+            return
+        with self._db_lock:
+            db = self.db
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                # 先删除，再写入同一批次中清空后重新写入的消息和状态
+                for key in batch["deleted"]:
+                    db.execute("DELETE FROM sessions WHERE agent_id = ? AND session_id = ?", key)
+                    db.execute("DELETE FROM turns WHERE agent_id = ? AND session_id = ?", key)
+                db.executemany(
+                    "INSERT OR REPLACE INTO turns (agent_id, session_id, seq, role, content) VALUES (?, ?, ?, ?, ?)",
+                    batch["turns"],
+                )
+                db.executemany(
+                    "INSERT INTO sessions (agent_id, session_id, max_messages, next_seq, window_start, "
+                    "summarized_seq, summary, epoch, last_access) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT (agent_id, session_id) DO UPDATE SET "
+                    "max_messages = excluded.max_messages, next_seq = excluded.next_seq, "
+                    "window_start = excluded.window_start, summarized_seq = excluded.summarized_seq, "
+                    "summary = excluded.summary, epoch = excluded.epoch, version = version + 1, "
+                    "last_access = excluded.last_access",
+                    batch["states"],
+                )
+                # 删除既不在环形缓冲区、也不再等待摘要的旧消息
+                db.executemany(
+                    "DELETE FROM turns WHERE agent_id = ? AND session_id = ? AND seq < ?",
+                    [
+                        (agent_id, session_id, retained_from(next_seq, max_messages, summarized_seq))
+                        for agent_id, session_id, max_messages, next_seq, _, summarized_seq, _, _, _ in batch["states"]
+                    ],
+                )
+                if batch["sweep"] is not None:
+                    db.executemany(
+                        "UPDATE sessions SET last_access = MAX(last_access, ?) WHERE agent_id = ? AND session_id = ?",
+                        batch["touched"],
+                    )
+                    sweep_database(db, batch["sweep"], self.ttl_seconds, self.max_sessions)
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+        self.flushes += 1
+        self.flushed_turns += len(batch["turns"])
+
+    async def flush(self):
+        """在写入线程中写入所有待写入的修改"""
+        self._writing, self._writing_deleted = dict(self._dirty), set(self._deleted)
+        batch = self._take_batch()
+        if batch is None:
+            return
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="history-writer")
+        try:
+            await asyncio.get_running_loop().run_in_executor(self._executor, self._write, batch)
+        finally:
+            self._writing, self._writing_deleted = {}, set()
+
+    async def close(self):
+        """停止后台任务，写入所有未落盘的修改并关闭数据库"""
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+            self._flush_task = None
+        # 先等待正在写入的批次完成，保证写入顺序
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        self._write(self._take_batch())
+        with self._db_lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+        if self._reader is not None:
+            self._reader.close()
+            self._reader = None
+
+    def stats(self) -> Dict[str, Any]:
+        """获取存储统计信息"""
+        return {
+            **super().stats(),
+            "backend": "durable",
+            "pending_writes": self._pending_count,
+            "flushes": self.flushes,
+            "flushed_turns": self.flushed_turns,
+            "loaded_from_disk": self.loaded,
+        }
+
+
+def create_session_store(backend: Optional[str] = None):
+    """根据配置创建会话存储"""
+    backend = backend or settings.SESSION_BACKEND
+    if backend == "durable":
+        return DurableSessionStore()
+    if backend == "sqlite":
+        return SqliteSessionStore()
+    if backend == "redis":
+        return RedisSessionStore()
+    if backend != "memory":
+        raise ValueError(f"未知的会话存储后端: {backend}（可选: {', '.join(SESSION_BACKENDS)}）")
+    return SessionStore()
@@ -0,0 +1,97 @@
+"""
+滚动摘要
+将移出上下文窗口的旧消息在后台增量折叠进会话摘要
+"""
+
+import asyncio
+from typing import List, Optional, Set, Tuple
+
+from openai import AsyncOpenAI
+
+from .config import settings
+from .llm import upstream_slot
+from .resilience import upstream_guard
+from .session import Session, SessionStore, Turn
+
+
+SUMMARY_SYSTEM_PROMPT = (
+    "你负责维护一段对话的滚动摘要。"
+    "请把新的对话内容合并进已有摘要，保留关键事实、用户的偏好和身份信息、尚未结束的话题，"
+    "删除寒暄和重复内容。只输出更新后的摘要，不超过{max_chars}字。"
+)
+
+ROLE_NAMES = {"user": "用户", "assistant": "助手"}
+
+
+class RollingSummarizer:
+    """滚动摘要器（在回复结束后于后台运行，不占用请求路径）"""
+
+    def __init__(self, client: AsyncOpenAI, model: str, store: Optional[SessionStore] = None):
+        self.client = client
+        self.model = model
+        # 摘要更新后写回存储（共享存储中其他进程才能看到）
+        self.store = store
+        self.max_tokens = settings.SUMMARY_MAX_TOKENS
+        # 持有后台任务的引用，防止被垃圾回收
+        self._tasks: Set[asyncio.Task] = set()
+        # 正在摘要的会话 (agent_id, session_id)，同一会话同一时刻只运行一个摘要任务
+        self._active: Set[Tuple[str, str]] = set()
+
+    def schedule(self, session: Session):
+        """如有待摘要的消息，则调度一次后台摘要"""
+        key = (session.agent_id, session.session_id)
+        if not session.pending_summary or key in self._active:
+            return
+        self._active.add(key)
+        task = asyncio.create_task(self._run(session))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, session: Session):
+        """持续折叠待摘要消息，直到队列清空"""
+        try:
+            while session.pending_summary:
+                batch = list(session.pending_summary)
+                session.pending_summary.clear()
+                try:
+                    summary = await self._summarize(session.summary, batch)
+                except Exception:
+                    # 摘要失败时放回队列，等待下一次调度
+                    pending = list(session.pending_summary)
+                    session.pending_summary.clear()
+                    session.pending_summary.extend(batch + pending)
+                    break
+                session.summary = summary
+                session.summarized_seq = batch[-1].seq + 1
+                if self.store is not None:
+                    await self.store.run(self.store.save, session)
+        finally:
+            self._active.discard((session.agent_id, session.session_id))
+
+    async def _summarize(self, summary: str, turns: List[Turn]) -> str:
+        """调用模型生成新的摘要（与对话请求共用上游并发名额和熔断器）"""
+        dialogue = "\n".join(
+            f"{ROLE_NAMES.get(turn.role, turn.role)}：{turn.content}" for turn in turns
+        )
+        messages = [
+            {
+                "role": "system",
+                "content": SUMMARY_SYSTEM_PROMPT.format(max_chars=self.max_tokens),
+            },
+            {
+                "role": "user",
+                "content": f"已有摘要：\n{summary or '（无）'}\n\n新的对话：\n{dialogue}",
+            },
+        ]
+
+        async def request() -> str:
+            async with upstream_slot():
+                response = await self.client.chat.completions.create(
+                    model=self.model,
+                    messages=messages,
+                    temperature=0.3,
+                    max_tokens=self.max_tokens,
+                )
+            return response.choices[0].message.content or ""
+
+        return (await upstream_guard.call(request)).strip() or summary
@@ -0,0 +1,62 @@
+"""
+本地分词计数
+优先使用 tiktoken 计算 token 数，不可用时退回到基于字符类别的估算
+"""
+
+import math
+import re
+from functools import lru_cache
+from typing import Optional
+
+from .config import settings
+
+try:
+    import tiktoken
+except ImportError:  # tiktoken 为可选依赖
+    tiktoken = None
+
+
+# 每条消息在聊天格式中的额外开销（role、分隔符等）
+MESSAGE_TOKEN_OVERHEAD = 4
+
+# 中日韩文字及全角标点，通常每个字符约占一个token
+_CJK_PATTERN = re.compile(r"[　-〿㐀-䶿一-鿿豈-﫿＀-￯]")
+
+_encoding = None
+_encoding_loaded = False
+
+
+def _get_encoding() -> Optional[object]:
+    """惰性加载 tiktoken 编码（加载失败时返回None）"""
+    global _encoding, _encoding_loaded
+    if not _encoding_loaded:
+        _encoding_loaded = True
+        if tiktoken is not None:
+            try:
+                _encoding = tiktoken.get_encoding(settings.TOKENIZER_ENCODING)
+            except Exception:
+                _encoding = None
+    return _encoding
+
+
+def _estimate_tokens(text: str) -> int:
+    """估算token数：中文按字计数，其余字符约4个字符一个token"""
+    cjk_count = len(_CJK_PATTERN.findall(text))
+    other_count = len(text) - cjk_count
+    return cjk_count + math.ceil(other_count / 4)
+
+
+@lru_cache(maxsize=4096)
+def count_tokens(text: str) -> int:
+    """计算文本的token数（结果会被缓存）"""
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return _estimate_tokens(text)
+
+
+def count_message_tokens(content: str) -> int:
+    """计算单条聊天消息的token数（含格式开销）"""
+    return count_tokens(content) + MESSAGE_TOKEN_OVERHEAD
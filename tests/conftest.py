@@ -0,0 +1,20 @@
+"""
+测试公共配置
+"""
+
+import os
+
+# 测试使用不落盘的内存会话存储（需在导入 birdiland 之前设置）
+os.environ.setdefault("SESSION_BACKEND", "memory")
+
+import pytest
+
+from birdiland.resilience import CircuitBreaker, upstream_guard
+
+
+@pytest.fixture(autouse=True)
+def reset_circuit_breaker():
+    """每个测试使用全新的熔断器，避免上一个测试的失败计数影响后续测试"""
+    upstream_guard.breaker = CircuitBreaker()
+    yield
+    upstream_guard.breaker = CircuitBreaker()
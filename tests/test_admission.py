@@ -0,0 +1,78 @@
+"""
+准入控制测试用例
+"""
+
+import asyncio
+
+import pytest
+
+from birdiland.admission import AdmissionController, AdmissionRejected
+
+
+class TestAdmissionController:
+    """AdmissionController 测试类"""
+
+    @pytest.mark.asyncio
+    async def test_queue_full_rejected_with_429(self):
+        """测试等待队列已满时快速拒绝"""
+        controller = AdmissionController(max_concurrency=1, max_per_agent=1, queue_size=1, queue_timeout=1)
+        ticket = await controller.acquire("canary")
+        waiter = asyncio.create_task(controller.acquire("canary"))
+        await asyncio.sleep(0)
+
+        with pytest.raises(AdmissionRejected) as exc_info:
+            await controller.acquire("canary")
+        assert exc_info.value.status_code == 429
+        assert exc_info.value.retry_after >= 1
+
+        ticket.release()
+        (await waiter).release()
+        assert controller.active == 0
+
+    @pytest.mark.asyncio
+    async def test_queue_timeout_rejected_with_503(self):
+        """测试排队超时后返回503"""
+        controller = AdmissionController(max_concurrency=1, max_per_agent=1, queue_size=4, queue_timeout=0.01)
+        ticket = await controller.acquire("canary")
+
+        with pytest.raises(AdmissionRejected) as exc_info:
+            await controller.acquire("canary")
+        assert exc_info.value.status_code == 503
+        assert controller.queue_depth == 0
+        ticket.release()
+
+    @pytest.mark.asyncio
+    async def test_priority_order(self):
+        """测试高优先级请求先获得名额"""
+        controller = AdmissionController(max_concurrency=1, max_per_agent=1, queue_size=4, queue_timeout=1)
+        ticket = await controller.acquire("canary")
+        order = []
+
+        async def run(priority):
+            granted = await controller.acquire("canary", priority)
+            order.append(priority)
+            granted.release()
+
+        tasks = [asyncio.create_task(run("batch")), asyncio.create_task(run("interactive"))]
+        await asyncio.sleep(0)
+        assert controller.stats()["queue_depth"] == 2
+
+        ticket.release()
+        await asyncio.gather(*tasks)
+        assert order == ["interactive", "batch"]
+
+    @pytest.mark.asyncio
+    async def test_per_agent_limit_does_not_block_other_agents(self):
+        """测试单个agent达到上限时，其他agent的请求仍可执行"""
+        controller = AdmissionController(max_concurrency=4, max_per_agent=1, queue_size=4, queue_timeout=1)
+        ticket = await controller.acquire("canary")
+        blocked = asyncio.create_task(controller.acquire("canary"))
+        await asyncio.sleep(0)
+
+        other = await asyncio.wait_for(controller.acquire("snow_fairy"), 0.1)
+        assert controller.stats()["active_per_agent"] == {"canary": 1, "snow_fairy": 1}
+
+        other.release()
+        ticket.release()
+        (await blocked).release()
+        assert controller.active == 0
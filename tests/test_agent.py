@@ -7,6 +7,9 @@ import pytest
 import asyncio
 from unittest.mock import AsyncMock, patch, MagicMock
 from birdiland.agent import BirdilandAgent, AGENT_PROFILES
+from birdiland.cache import ResponseCache
+from birdiland.config import settings
+from birdiland.resilience import CircuitBreaker, CircuitOpenError, upstream_guard
 
 
 class TestBirdilandAgent:
@@ -29,7 +32,12 @@ class TestBirdilandAgent:
         assert agent.agent_id == "canary"
         assert agent.character_profile == AGENT_PROFILES["canary"]
         assert agent.conversation_history == []
-        assert agent.max_history_length == 10
+        assert agent.max_history_length == settings.HISTORY_MAX_MESSAGES
+    
+    def test_agents_share_upstream_client(self, agent: BirdilandAgent):
+        """测试所有agent共享同一个上游客户端"""
+        other = BirdilandAgent("snow_fairy")
+        assert other.client is agent.client
     
     def test_agent_initialization_with_invalid_id(self):
         """测试使用无效 agent_id 初始化"""
@@ -125,10 +133,10 @@ class TestBirdilandAgent:
             async for chunk in agent.chat_stream("你好"):
                 chunks.append(chunk)
             
-            # 应该返回错误消息
+            # 应该返回与非流式一致的回退响应，而不是原始错误信息
             assert len(chunks) == 1
-            assert "抱歉" in chunks[0]
-            assert "Stream Error" in chunks[0]
+            assert "你好" in chunks[0]
+            assert "Stream Error" not in chunks[0]
     
     def test_analyze_emotion_positive(self, agent):
         """测试积极情感分析"""
@@ -148,6 +156,130 @@ class TestBirdilandAgent:
         emotion = agent.analyze_emotion(response)
         assert emotion == "neutral"
     
+    @pytest.mark.asyncio
+    async def test_conversation_history_per_session(self, agent, mock_openai_response):
+        """测试不同会话的对话历史相互隔离"""
+        with patch.object(agent.client.chat.completions, 'create', 
+                         new_callable=AsyncMock, return_value=mock_openai_response):
+            await agent.chat("你好", session_id="alice")
+            
+            assert len(agent.get_conversation_history("alice")) == 2
+            assert agent.get_conversation_history("bob") == []
+            assert agent.conversation_history == []
+    
+    @pytest.mark.asyncio
+    async def test_history_packed_within_token_budget(self, agent, mock_openai_response):
+        """测试发送给模型的历史受token预算限制"""
+        agent.context_token_budget = 600
+        with patch.object(agent.client.chat.completions, 'create', 
+                         new_callable=AsyncMock, return_value=mock_openai_response) as mock_create:
+            await agent.chat("长" * 2000)
+            await agent.chat("你好")
+            
+            messages = mock_create.call_args.kwargs["messages"]
+            assert messages[0]["role"] == "system"
+            assert messages[-1]["content"] == "你好"
+            assert all(m["content"] != "长" * 2000 for m in messages)
+            # 完整历史仍然保留
+            assert len(agent.conversation_history) == 4
+    
+    @pytest.mark.asyncio
+    async def test_evicted_history_folded_into_summary(self, agent, mock_openai_response):
+        """测试移出窗口的旧消息在后台折叠为摘要并加入提示词"""
+        agent.context_token_budget = 600
+        with patch.object(agent.client.chat.completions, 'create', 
+                         new_callable=AsyncMock, return_value=mock_openai_response) as mock_create:
+            await agent.chat("长" * 2000)
+            await agent.chat("你好")
+            
+            # 等待后台摘要任务完成
+            for _ in range(5):
+                await asyncio.sleep(0)
+            
+            await agent.chat("还记得吗？")
+            messages = mock_create.call_args.kwargs["messages"]
+            assert messages[1]["role"] == "system"
+            assert "你好！我是Canary，很高兴认识你！" in messages[1]["content"]
+    
+    @pytest.mark.asyncio
+    async def test_summary_shares_upstream_guard(self, agent, mock_openai_response):
+        """测试摘要请求与对话请求共用熔断器：摘要失败后熔断，对话请求不再调用上游"""
+        async def create(**kwargs):
+            if "滚动摘要" in kwargs["messages"][0]["content"]:
+                raise RuntimeError("upstream down")
+            return mock_openai_response
+        
+        agent.context_token_budget = 600
+        upstream_guard.breaker = CircuitBreaker(failure_threshold=1)
+        with patch.object(agent.client.chat.completions, 'create', new=AsyncMock(side_effect=create)) as mock_create:
+            await agent.chat("长" * 2000)
+            await agent.chat("你好")
+            # 等待后台摘要任务完成
+            for _ in range(5):
+                await asyncio.sleep(0)
+            assert upstream_guard.breaker.state == "open"
+            
+            calls = mock_create.await_count
+            with pytest.raises(CircuitOpenError):
+                await agent.chat("还在吗？", fallback=False)
+            assert mock_create.await_count == calls
+    
+    @pytest.mark.asyncio
+    async def test_system_prompt_minified_and_prefix_stable(self, agent, mock_openai_response):
+        """测试系统提示词已去除多余空白，且多轮对话间消息前缀保持一致"""
+        agent.context_token_budget = 1000
+        agent.summarizer = None  # 摘要更新也会改变前缀，这里只验证窗口推进策略
+        with patch.object(agent.client.chat.completions, 'create', 
+                         new_callable=AsyncMock, return_value=mock_openai_response) as mock_create:
+            prompts = []
+            for i in range(12):
+                await agent.chat(f"第{i}条消息" + "内容" * 60)
+                prompts.append(mock_create.call_args.kwargs["messages"])
+        
+        system_prompt = prompts[0][0]["content"]
+        assert system_prompt == system_prompt.strip()
+        assert "\n " not in system_prompt
+        
+        # 大部分相邻轮次的请求共享上一轮的完整前缀（不含上一轮的当前消息）
+        stable = sum(
+            1 for prev, cur in zip(prompts, prompts[1:])
+            if cur[:len(prev) - 1] == prev[:-1]
+        )
+        assert stable >= len(prompts) - 4
+    
+    @pytest.mark.asyncio
+    async def test_response_cache_replays_stream(self, agent, mock_openai_response):
+        """测试相同提示词命中回复缓存，并可作为流式响应回放"""
+        agent.response_cache = ResponseCache(max_bytes=1024 * 1024, ttl_seconds=60)
+        with patch.object(agent.client.chat.completions, 'create', 
+                         new_callable=AsyncMock, return_value=mock_openai_response) as mock_create:
+            first = await agent.chat("你好", session_id="a")
+            chunks = [chunk async for chunk in agent.chat_stream("你好", session_id="b")]
+            
+            assert mock_create.await_count == 1
+            assert "".join(chunks) == first
+            assert agent.response_cache.hits == 1
+            assert len(agent.get_conversation_history("b")) == 2
+    
+    @pytest.mark.asyncio
+    async def test_identical_concurrent_requests_coalesced(self, agent):
+        """测试相同的并发请求只调用一次上游，且各自记录到自己的会话"""
+        async def slow_create(**kwargs):
+            await asyncio.sleep(0.01)
+            response = MagicMock()
+            response.choices[0].message.content = "大家好！"
+            return response
+        
+        with patch.object(agent.client.chat.completions, 'create', 
+                         new_callable=AsyncMock, side_effect=slow_create) as mock_create:
+            results = await asyncio.gather(
+                *(agent.chat("你好", session_id=f"user-{i}") for i in range(5))
+            )
+            
+            assert results == ["大家好！"] * 5
+            assert mock_create.await_count == 1
+            assert all(len(agent.get_conversation_history(f"user-{i}")) == 2 for i in range(5))
+    
     @pytest.mark.asyncio
     async def test_clear_conversation_history(self, agent, mock_openai_response):
         """测试清除对话历史"""
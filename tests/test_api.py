@@ -0,0 +1,312 @@
+"""
+API 路由测试用例
+"""
+
+import asyncio
+import json
+import threading
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+from fastapi import FastAPI, WebSocketDisconnect
+from fastapi.testclient import TestClient
+
+from birdiland.admission import AdmissionController
+from birdiland.agent import agent_manager
+from birdiland.api.routes import router
+from birdiland.config import settings
+from birdiland.registry import profile_registry
+from birdiland.storage import SqliteSessionStore
+
+
+def append_history(session_id: str, role: str, *contents: str):
+    """通过会话存储的公开接口写入canary的对话历史"""
+    store = agent_manager.session_store
+    session = store.get_or_create("canary", session_id, settings.HISTORY_MAX_MESSAGES)
+    for content in contents:
+        store.append(session, role, content)
+
+
+@pytest.fixture
+def client():
+    """创建只包含API路由的测试客户端"""
+    app = FastAPI()
+    app.include_router(router, prefix="/api/v1")
+    return TestClient(app)
+
+
+@pytest.fixture
+def mock_create():
+    """模拟上游聊天接口（所有agent共享同一个客户端）"""
+    async def create(**kwargs):
+        response = MagicMock()
+        response.choices[0].message.content = f"回复：{kwargs['messages'][-1]['content']}"
+        return response
+
+    client = agent_manager.get_agent("canary").client
+    with patch.object(client.chat.completions, "create", new=AsyncMock(side_effect=create)) as mock:
+        yield mock
+
+
+class TestBatchChat:
+    """批量聊天接口测试类"""
+
+    def test_batch_results_stream_as_ndjson(self, client, mock_create):
+        """测试批量结果以NDJSON逐行返回，并包含错误与耗时"""
+        items = [
+            {"agent_id": "canary", "session_id": "batch-a", "message": "你好"},
+            {"agent_id": "snow_fairy", "session_id": "batch-b", "message": "晚上好"},
+            {"agent_id": "unknown", "session_id": "batch-c", "message": "在吗"},
+        ]
+        response = client.post("/api/v1/chat/batch", json={"items": items, "concurrency": 2})
+
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("application/x-ndjson")
+        results = {r["index"]: r for r in map(json.loads, response.text.strip().splitlines())}
+        assert results[0]["response"] == "回复：你好"
+        assert results[1]["response"] == "回复：晚上好"
+        assert "error" in results[2]
+        assert all("elapsed_ms" in r for r in results.values())
+
+    def test_same_session_items_run_in_order(self, client, mock_create):
+        """测试同一会话的条目按顺序处理"""
+        items = [{"session_id": "batch-order", "message": str(i)} for i in range(4)]
+        client.post("/api/v1/chat/batch", json={"items": items})
+
+        history = agent_manager.get_agent("canary").get_conversation_history("batch-order")
+        assert [m["content"] for m in history if m["role"] == "user"] == ["0", "1", "2", "3"]
+
+    def test_upstream_failure_is_reported_as_item_error(self, client):
+        """测试上游失败时条目报告错误，而不是返回降级回复"""
+        client_ = agent_manager.get_agent("canary").client
+        failing = AsyncMock(side_effect=RuntimeError("upstream down"))
+        with patch.object(client_.chat.completions, "create", new=failing):
+            response = client.post(
+                "/api/v1/chat/batch", json={"items": [{"session_id": "batch-down", "message": "q1"}]}
+            )
+
+        result = json.loads(response.text)
+        assert result["error"] == "upstream down"
+        assert "response" not in result and "emotion" not in result
+
+
+class TestAdmission:
+    """准入控制接口测试类"""
+
+    def test_overload_returns_429_with_retry_after(self, client, mock_create):
+        """测试超出并发上限且队列已满时快速返回429"""
+        controller = AdmissionController(max_concurrency=1, max_per_agent=1, queue_size=0, queue_timeout=1)
+        controller.active = 1  # 模拟名额已被占满
+        with patch("birdiland.api.routes.admission_controller", controller):
+            response = client.post("/api/v1/chat", json={"message": "你好"})
+
+        assert response.status_code == 429
+        assert "Retry-After" in response.headers
+        mock_create.assert_not_called()
+
+    def test_stats_expose_queue(self, client):
+        """测试统计接口包含排队信息"""
+        stats = client.get("/api/v1/stats").json()
+        assert "queue_depth" in stats["admission"]
+
+    def test_shared_store_stats_run_in_store_thread(self, client, tmp_path):
+        """测试共享存储的统计查询在存储线程中执行，不占用事件循环"""
+        store = SqliteSessionStore(str(tmp_path / "sessions.db"), ttl_seconds=0)
+        threads = []
+        stats = store.stats
+
+        def record_thread():
+            threads.append(threading.current_thread().name)
+            return stats()
+
+        with patch.object(agent_manager, "session_store", store), patch.object(store, "stats", new=record_thread):
+            body = client.get("/api/v1/stats").json()
+        asyncio.run(store.close())
+
+        assert body["sessions"]["backend"] == "sqlite"
+        assert threads[0].startswith("session-store")
+
+
+class TestEmotionAnalyze:
+    """情感分析接口测试类"""
+
+    def test_analyze_with_agent_lexicon(self, client):
+        """测试批量分析文本的情感标签"""
+        response = client.post("/api/v1/emotion/analyze", json={"texts": ["我很开心", "我很难过"], "agent_id": "canary"})
+        assert response.json() == {"emotions": ["happy", "sad"]}
+
+    def test_unknown_agent_is_rejected(self, client):
+        """测试未知的agent（包括指向词典目录之外的路径）返回404"""
+        response = client.post("/api/v1/emotion/analyze", json={"texts": ["你好"], "agent_id": "../profiles/canary"})
+        assert response.status_code == 404
+
+
+class TestChatStream:
+    """流式聊天接口测试类"""
+
+    def test_stream_is_event_stream_with_coalesced_frames(self, client):
+        """测试流式响应为 text/event-stream，片段合并且情感只在变化时发送"""
+        async def chunk_stream():
+            for text in ["今天", "很", "开心", "！"]:
+                chunk = MagicMock()
+                chunk.choices[0].delta.content = text
+                yield chunk
+
+        async def create(**kwargs):
+            return chunk_stream()
+
+        agent_client = agent_manager.get_agent("canary").client
+        with patch.object(agent_client.chat.completions, "create", new=AsyncMock(side_effect=create)):
+            response = client.post(
+                "/api/v1/chat",
+                json={"message": "你好", "session_id": "sse-test", "stream": True},
+            )
+
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/event-stream")
+        events = [e for e in response.text.split("\n\n") if e]
+        assert events[-1] == "data: [DONE]"
+        frames = [json.loads(e.split("data: ", 1)[1]) for e in events[:-1]]
+        assert all(e.startswith("id: ") for e in events[:-1])
+        assert "".join(f["content"] for f in frames) == "今天很开心！"
+        # 快速到达的片段被合并，帧数少于片段数
+        assert len(frames) < 5
+        assert frames[-1]["is_final"] is True
+        emotions = [f["emotion"] for f in frames[:-1] if "emotion" in f]
+        assert all(a != b for a, b in zip(emotions, emotions[1:]))
+
+
+def mock_stream(chunks, delay: float = 0):
+    """模拟上游流式接口，片段之间可设置延迟"""
+    async def chunk_stream():
+        for text in chunks:
+            await asyncio.sleep(delay)
+            chunk = MagicMock()
+            chunk.choices[0].delta.content = text
+            yield chunk
+
+    async def create(**kwargs):
+        return chunk_stream()
+
+    agent_client = agent_manager.get_agent("canary").client
+    return patch.object(agent_client.chat.completions, "create", new=AsyncMock(side_effect=create))
+
+
+def receive_until(websocket, event_type: str) -> list:
+    """接收事件直到出现指定类型"""
+    events = []
+    while True:
+        event = websocket.receive_json()
+        events.append(event)
+        if event["type"] == event_type:
+            return events
+
+
+class TestChatWebSocket:
+    """WebSocket 聊天接口测试类"""
+
+    def test_multiple_turns_on_one_connection(self, client):
+        """测试同一连接上连续对话，并按顺序收到 start/chunk/end 事件"""
+        with mock_stream(["今天", "很开心"]):
+            with client.websocket_connect("/api/v1/chat/ws?session_id=ws-turns") as websocket:
+                for turn, message in enumerate(["你好", "再见"], start=1):
+                    websocket.send_json({"type": "message", "message": message})
+                    events = receive_until(websocket, "end")
+                    assert events[0] == {"type": "start", "turn": turn}
+                    chunks = [e for e in events if e["type"] == "chunk"]
+                    assert "".join(e["content"] for e in chunks) == "今天很开心"
+                    assert "emotion" in chunks[0]
+                    assert events[-1]["turn"] == turn
+
+        history = agent_manager.get_agent("canary").get_conversation_history("ws-turns")
+        assert [m["content"] for m in history if m["role"] == "user"] == ["你好", "再见"]
+
+    def test_cancel_interrupts_reply(self, client):
+        """测试 cancel 命令中断进行中的回复"""
+        with mock_stream(["一"] * 100, delay=0.05):
+            with client.websocket_connect("/api/v1/chat/ws?session_id=ws-cancel") as websocket:
+                websocket.send_json({"type": "message", "message": "讲个长故事"})
+                receive_until(websocket, "start")
+                websocket.send_json({"type": "cancel"})
+                events = receive_until(websocket, "cancelled")
+                assert all(e["type"] != "end" for e in events)
+
+                websocket.send_json({"type": "ping"})
+                assert receive_until(websocket, "pong")[-1] == {"type": "pong"}
+
+    def test_invalid_message_reports_error(self, client):
+        """测试无效消息返回错误事件而不断开连接"""
+        with client.websocket_connect("/api/v1/chat/ws") as websocket:
+            websocket.send_text("not json")
+            assert websocket.receive_json()["type"] == "error"
+            websocket.send_json({"type": "ping"})
+            assert websocket.receive_json() == {"type": "pong"}
+
+    def test_unknown_agent_is_rejected(self, client):
+        """测试未知agent直接关闭连接"""
+        with pytest.raises(WebSocketDisconnect):
+            with client.websocket_connect("/api/v1/chat/ws?agent_id=unknown") as websocket:
+                websocket.receive_json()
+
+
+class TestAgentMetadata:
+    """agent元数据接口测试类"""
+
+    def test_profiles_use_version_etag(self, client):
+        """测试资料接口返回版本ETag，未变化时返回304"""
+        response = client.get("/api/v1/agent/profiles")
+        assert response.status_code == 200
+        etag = response.headers["ETag"]
+        assert "canary" in response.json()["profiles"]
+
+        cached = client.get("/api/v1/agent/profiles", headers={"If-None-Match": etag})
+        assert cached.status_code == 304
+
+        with patch.object(profile_registry, "version", "changed"):
+            changed = client.get("/api/v1/agent/profiles", headers={"If-None-Match": etag})
+        assert changed.status_code == 200
+        assert changed.headers["ETag"] != etag
+
+
+class TestHistory:
+    """对话历史接口测试类"""
+
+    def test_pagination_and_incremental_reads(self, client):
+        """测试按 before_seq 向前翻页以及按 since_seq 增量读取"""
+        append_history("history-pages", "user", *(str(i) for i in range(5)))
+        url = "/api/v1/agent/canary/history"
+
+        latest = client.get(url, params={"session_id": "history-pages", "limit": 2}).json()
+        assert [turn["seq"] for turn in latest["turns"]] == [3, 4]
+        assert latest["has_more"] and latest["next_seq"] == 5
+
+        older = client.get(url, params={"session_id": "history-pages", "limit": 2, "before_seq": 3}).json()
+        assert [turn["content"] for turn in older["turns"]] == ["1", "2"]
+
+        append_history("history-pages", "user", "5")
+        newer = client.get(url, params={"session_id": "history-pages", "since_seq": latest["next_seq"]}).json()
+        assert [turn["content"] for turn in newer["turns"]] == ["5"]
+        assert not newer["has_more"] and newer["epoch"] == latest["epoch"]
+
+        conflict = client.get(url, params={"session_id": "history-pages", "before_seq": 1, "since_seq": 1})
+        assert conflict.status_code == 400
+
+    def test_history_uses_version_etag(self, client):
+        """测试历史接口返回版本ETag，未变化时返回304，新消息或清空后返回200"""
+        append_history("history-etag", "user", "你好")
+        url = "/api/v1/agent/canary/history"
+        params = {"session_id": "history-etag"}
+
+        response = client.get(url, params=params)
+        etag = response.headers["ETag"]
+        assert client.get(url, params=params, headers={"If-None-Match": etag}).status_code == 304
+
+        append_history("history-etag", "assistant", "你好呀")
+        changed = client.get(url, params=params, headers={"If-None-Match": etag})
+        assert changed.status_code == 200
+        etag = changed.headers["ETag"]
+
+        agent_manager.get_agent("canary").clear_conversation_history("history-etag")
+        cleared = client.get(url, params=params, headers={"If-None-Match": etag})
+        assert cleared.status_code == 200
+        assert cleared.json()["turns"] == []
@@ -0,0 +1,106 @@
+"""
+图片资源测试用例
+"""
+
+import json
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from birdiland.assets import IMMUTABLE_CACHE_CONTROL, AssetRegistry, CachedStaticFiles, build_assets
+
+
+@pytest.fixture
+def build_dir(tmp_path):
+    """写入资源清单的临时目录"""
+    manifest = {
+        "canary": {
+            "avatar": {"path": "images/_build/canary/avatar.0123456789ab.webp", "width": 128, "height": 128, "key": "k"},
+            "icon-192": {"path": "images/_build/canary/icon-192.ba9876543210.png", "width": 192, "height": 192, "key": "k"},
+        }
+    }
+    (tmp_path / "assets.json").write_text(json.dumps(manifest), encoding="utf-8")
+    return tmp_path
+
+
+class TestAssetRegistry:
+    """AssetRegistry 测试类"""
+
+    def test_profiles_point_at_variants(self, build_dir):
+        """测试个人资料改用已生成的变体，未生成的保留原图"""
+        registry = AssetRegistry(build_dir)
+        assert registry.load()
+        profiles = {"canary": {"avatar": "images/canary/avatar.png", "full_image": "images/canary/full.png"}}
+        registry.apply_to_profiles(profiles)
+
+        assert profiles["canary"]["avatar"] == "images/_build/canary/avatar.0123456789ab.webp"
+        assert profiles["canary"]["full_image"] == "images/canary/full.png"
+
+    def test_manifest_icons_point_at_variants(self, build_dir):
+        """测试应用清单中同尺寸的图标被替换"""
+        registry = AssetRegistry(build_dir)
+        registry.load()
+        manifest = registry.rewrite_manifest({
+            "icons": [
+                {"src": "images/canary/avatar.png", "sizes": "192x192", "type": "image/png"},
+                {"src": "images/canary/avatar.png", "sizes": "512x512", "type": "image/png"},
+            ],
+        })
+
+        assert manifest["icons"][0]["src"] == "images/_build/canary/icon-192.ba9876543210.png"
+        assert manifest["icons"][1]["src"] == "images/canary/avatar.png"
+
+    def test_missing_manifest(self, tmp_path):
+        """测试没有资源清单时使用原图"""
+        registry = AssetRegistry(tmp_path)
+        assert not registry.load()
+        assert registry.path("canary", "avatar", "images/canary/avatar.png") == "images/canary/avatar.png"
+
+
+class TestCachedStaticFiles:
+    """CachedStaticFiles 测试类"""
+
+    @pytest.fixture
+    def client(self, tmp_path):
+        (tmp_path / "avatar.0123456789ab.webp").write_bytes(b"webp")
+        (tmp_path / "avatar.png").write_bytes(b"png")
+        app = FastAPI()
+        app.mount("/images", CachedStaticFiles(directory=str(tmp_path)), name="images")
+        return TestClient(app)
+
+    def test_hashed_files_are_immutable(self, client):
+        """测试带内容哈希的文件使用不可变缓存头，ETag 匹配时返回304并保留缓存头"""
+        response = client.get("/images/avatar.0123456789ab.webp")
+        assert response.status_code == 200
+        assert response.headers["Cache-Control"] == IMMUTABLE_CACHE_CONTROL
+
+        cached = client.get("/images/avatar.0123456789ab.webp", headers={"If-None-Match": response.headers["ETag"]})
+        assert cached.status_code == 304
+        assert cached.headers["Cache-Control"] == IMMUTABLE_CACHE_CONTROL
+
+    def test_plain_files_revalidate(self, client):
+        """测试原图只缓存较短时间"""
+        response = client.get("/images/avatar.png")
+        assert response.headers["Cache-Control"].startswith("public, max-age=")
+        assert "immutable" not in response.headers["Cache-Control"]
+
+
+class TestBuildAssets:
+    """build_assets 测试类（需要安装 Pillow）"""
+
+    def test_builds_hashed_variants_incrementally(self, tmp_path, monkeypatch):
+        """测试生成带哈希的变体，源文件未变化时复用"""
+        Image = pytest.importorskip("PIL.Image")
+        monkeypatch.setattr("birdiland.assets.ROOT_DIR", tmp_path)
+        images_dir = tmp_path / "images"
+        (images_dir / "canary").mkdir(parents=True)
+        Image.new("RGB", (192, 192), "yellow").save(images_dir / "canary" / "avatar.png")
+        Image.new("RGB", (1200, 900), "green").save(images_dir / "canary" / "full.png")
+
+        manifest = build_assets(images_dir, images_dir / "_build", quality=80)
+        entries = manifest["canary"]
+        assert entries["avatar"]["path"].endswith(".webp") and entries["avatar"]["width"] == 128
+        assert entries["profile"]["width"] == 640
+        assert "icon-512" not in entries  # 不放大原图
+        assert build_assets(images_dir, images_dir / "_build", quality=80) == manifest
@@ -0,0 +1,154 @@
+"""
+基准测试工具测试用例
+"""
+
+import json
+from unittest.mock import patch
+
+import httpx
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from openai import AsyncOpenAI
+
+from benchmarks.compare import compare
+from benchmarks.load import RequestResult, percentile, run_load, summarize
+from benchmarks.mock_llm import MockLLMConfig, create_mock_app
+from benchmarks.run import server_env
+from birdiland.agent import agent_manager
+from birdiland.api.routes import router
+from birdiland.config import settings
+
+
+def sse_frames(text: str):
+    """解析SSE响应中的数据帧"""
+    return [line[6:] for line in text.splitlines() if line.startswith("data: ")]
+
+
+class TestMockLLM:
+    """模拟上游测试类"""
+
+    def test_stream_yields_configured_tokens(self):
+        """测试流式响应按配置的token数逐帧返回"""
+        app = create_mock_app(MockLLMConfig(ttft_ms=0, token_delay_ms=0, reply_tokens=5))
+        client = TestClient(app)
+        response = client.post("/v1/chat/completions", json={"model": "m", "messages": [], "stream": True})
+
+        frames = sse_frames(response.text)
+        assert frames[-1] == "[DONE]"
+        contents = [json.loads(frame)["choices"][0]["delta"].get("content") for frame in frames[:-1]]
+        assert contents[0] == "" and contents[-1] is None
+        assert len([c for c in contents if c]) == 5
+        assert client.get("/stats").json() == {"requests": 1, "streams": 1, "errors": 0, "tokens": 5}
+
+    def test_non_stream_returns_full_reply(self):
+        """测试非流式响应一次返回完整回复和用量"""
+        client = TestClient(create_mock_app(MockLLMConfig(ttft_ms=0, token_delay_ms=0, reply_tokens=3)))
+        body = client.post("/v1/chat/completions", json={"messages": [{"role": "user", "content": "你好"}]}).json()
+
+        assert body["choices"][0]["message"]["content"] == "你好呀"
+        assert body["usage"] == {"prompt_tokens": 2, "completion_tokens": 3, "total_tokens": 5}
+
+    def test_error_rate(self):
+        """测试按错误率返回配置的错误状态码"""
+        client = TestClient(create_mock_app(MockLLMConfig(error_rate=1.0, error_status=429)))
+        response = client.post("/v1/chat/completions", json={"messages": []})
+        assert response.status_code == 429
+        assert client.get("/stats").json()["errors"] == 1
+
+
+class TestStatistics:
+    """统计与对比测试类"""
+
+    def test_percentile_interpolates(self):
+        """测试百分位数线性插值"""
+        values = [1.0, 2.0, 3.0, 4.0]
+        assert percentile(values, 50) == 2.5
+        assert percentile(values, 100) == 4.0
+        assert percentile([], 99) == 0.0
+
+    def test_summarize_counts_errors_and_latencies(self):
+        """测试汇总成功率、吞吐量和延迟分布"""
+        results = []
+        for ttft in (0.1, 0.2, 0.3):
+            result = RequestResult()
+            result.ok, result.status, result.ttft, result.total = True, 200, ttft, ttft * 2
+            result.gaps, result.chunks = [0.01, 0.03], 3
+            results.append(result)
+        failed = RequestResult()
+        failed.status = 503
+        results.append(failed)
+
+        summary = summarize(results, elapsed=2.0)
+        assert summary["ok"] == 3
+        assert summary["errors"] == {"503": 1}
+        assert summary["error_rate"] == 0.25
+        assert summary["throughput_rps"] == 1.5
+        assert summary["chunks_per_s"] == 4.5
+        assert summary["ttft_ms"]["p50"] == 200.0
+        assert summary["itl_ms"]["count"] == 6
+        assert summary["latency_ms"]["max"] == 600.0
+
+    def test_compare_flags_regressions(self):
+        """测试变差超过阈值的指标被标记"""
+        base = {"runs": [{"mode": "stream", "throughput_rps": 10.0, "ttft_ms": {"p50": 100.0}}]}
+        head = {"runs": [{"mode": "stream", "throughput_rps": 9.5, "ttft_ms": {"p50": 150.0}}]}
+
+        rows, regressed = compare(base, head, threshold=10)
+        flagged = {row["metric"] for row in rows if row["regressed"]}
+        assert regressed
+        assert flagged == {"ttft_ms.p50"}
+
+    def test_server_env_uses_shared_store_for_workers(self, tmp_path, monkeypatch):
+        """测试多个工作进程时改用临时 SQLite 会话存储（否则服务拒绝启动）"""
+        monkeypatch.delenv("SESSION_BACKEND", raising=False)
+        assert server_env("http://mock")["SESSION_BACKEND"] == "memory"
+
+        env = server_env("http://mock", workers=4, data_dir=str(tmp_path))
+        assert env["SESSION_BACKEND"] == "sqlite"
+        assert env["SESSION_SQLITE_PATH"] == str(tmp_path / "sessions.db")
+        assert env["OPENAI_BASE_URL"] == "http://mock/v1"
+
+
+class TestLoad:
+    """负载生成器测试类"""
+
+    @pytest.fixture
+    def mock_upstream(self):
+        """让agent共享的上游客户端改为调用模拟上游（进程内，不经过网络）"""
+        mock_app = create_mock_app(MockLLMConfig(ttft_ms=0, token_delay_ms=0, reply_tokens=8))
+        mock_client = AsyncOpenAI(
+            api_key="bench",
+            base_url="http://mock/v1",
+            http_client=httpx.AsyncClient(transport=httpx.ASGITransport(app=mock_app)),
+        )
+        client = agent_manager.get_agent("canary").client
+        with patch.object(client.chat.completions, "create", new=mock_client.chat.completions.create):
+            yield mock_app
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("mode", ["chat", "stream"])
+    async def test_run_load_against_mock_upstream(self, mode, mock_upstream, monkeypatch):
+        """测试负载生成器经由对话接口驱动模拟上游并汇总结果"""
+        # 逐片段发送，每个token都记入片段间隔
+        monkeypatch.setattr(settings, "SSE_FLUSH_INTERVAL_MS", 0.0)
+        app = FastAPI()
+        app.include_router(router, prefix="/api/v1")
+
+        result = await run_load(
+            "http://bench", mode, concurrency=2, requests=4, transport=httpx.ASGITransport(app=app)
+        )
+
+        assert result["mode"] == mode
+        assert result["ok"] == 4 and result["errors"] == {}
+        assert result["ttft_ms"]["count"] == 4
+        if mode == "stream":
+            assert result["itl_ms"]["count"] == 4 * 7
+        assert mock_upstream.state.stats["requests"] >= 4
+        assert mock_upstream.state.stats["errors"] == 0
+
+    @pytest.mark.asyncio
+    async def test_unknown_mode(self):
+        """测试未知的负载模式"""
+        with pytest.raises(ValueError):
+            await run_load("http://bench", "ws", requests=1)
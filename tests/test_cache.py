@@ -0,0 +1,54 @@
+"""
+回复缓存测试用例
+"""
+
+import time
+from unittest.mock import patch
+
+from birdiland.cache import ResponseCache, make_cache_key
+
+
+class TestResponseCache:
+    """ResponseCache 测试类"""
+
+    def test_hit_and_miss_counters(self):
+        """测试命中和未命中计数"""
+        cache = ResponseCache(max_bytes=1024, ttl_seconds=60)
+        assert cache.get("k") is None
+        cache.put("k", "你好")
+
+        assert cache.get("k") == "你好"
+        stats = cache.stats()
+        assert stats["hits"] == 1
+        assert stats["misses"] == 1
+
+    def test_ttl_expiration(self):
+        """测试缓存过期"""
+        cache = ResponseCache(max_bytes=1024, ttl_seconds=60)
+        cache.put("k", "你好")
+
+        with patch("birdiland.cache.time.monotonic", return_value=time.monotonic() + 120):
+            assert cache.get("k") is None
+        assert len(cache) == 0
+        assert cache.total_bytes == 0
+
+    def test_lru_eviction_by_bytes(self):
+        """测试超出字节上限时淘汰最久未使用的缓存"""
+        cache = ResponseCache(max_bytes=100, ttl_seconds=60)
+        cache.put("a", "x" * 40)
+        cache.put("b", "y" * 40)
+        cache.get("a")
+        cache.put("c", "z" * 40)
+
+        assert cache.get("b") is None
+        assert cache.get("a") is not None
+        assert cache.total_bytes <= 100
+
+    def test_cache_key_depends_on_all_inputs(self):
+        """测试缓存键包含agent、模型、消息和采样参数"""
+        messages = [{"role": "user", "content": "你好"}]
+        key = make_cache_key("canary", "m", messages, temperature=0.7)
+
+        assert key == make_cache_key("canary", "m", list(messages), temperature=0.7)
+        assert key != make_cache_key("snow_fairy", "m", messages, temperature=0.7)
+        assert key != make_cache_key("canary", "m", messages, temperature=0.2)
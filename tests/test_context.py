@@ -0,0 +1,39 @@
+"""
+上下文打包测试用例
+"""
+
+from birdiland.context import pack_turns
+from birdiland.session import Turn
+from birdiland.tokenizer import count_tokens
+
+
+class TestPackTurns:
+    """pack_turns 测试类"""
+
+    def test_pack_newest_within_budget(self):
+        """测试在预算内优先保留最新的消息"""
+        turns = [Turn("user", "第一条消息"), Turn("assistant", "第二条消息"), Turn("user", "第三条消息")]
+        budget = turns[1].tokens + turns[2].tokens
+
+        packed = pack_turns(turns, budget)
+
+        assert [t.content for t in packed] == ["第二条消息", "第三条消息"]
+
+    def test_long_message_stops_packing(self):
+        """测试超长消息会截断更早的历史"""
+        turns = [Turn("user", "早期消息"), Turn("user", "长" * 1000), Turn("assistant", "最新回复")]
+
+        packed = pack_turns(turns, 100)
+
+        assert [t.content for t in packed] == ["最新回复"]
+
+    def test_empty_budget(self):
+        """测试预算不足时不添加历史"""
+        assert pack_turns([Turn("user", "你好")], 0) == []
+
+
+def test_count_tokens():
+    """测试token计数"""
+    assert count_tokens("") == 0
+    assert count_tokens("你好世界") >= 2
+    assert count_tokens("hello " * 100) > count_tokens("hello")
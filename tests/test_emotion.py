@@ -0,0 +1,125 @@
+"""
+情感分析测试用例
+"""
+
+import json
+import random
+from unittest.mock import patch
+
+import pytest
+
+from birdiland.emotion_model import EmotionClassifier
+from birdiland.emotion import EmotionLexicon, EmotionTracker, analyze_emotion, analyze_emotions, get_lexicon
+
+
+class TestEmotionTracker:
+    """EmotionTracker 测试类"""
+
+    def test_keyword_across_chunks(self):
+        """测试跨片段的关键词也能被识别"""
+        tracker = EmotionTracker()
+        for chunk in ["今天我很开", "心，太好", "了！"]:
+            tracker.feed(chunk)
+
+        assert tracker.emotion == "happy"
+        assert tracker.text == "今天我很开心，太好了！"
+
+    def test_matches_batch_analyzer(self):
+        """测试任意切分下增量结果与完整文本分析结果一致"""
+        rng = random.Random(42)
+        words = ["开心", "难过", "知道", "遗憾", "太好了", "理解", "，", "我们", "今天", "不好"]
+        for _ in range(200):
+            text = "".join(rng.choice(words) for _ in range(rng.randint(0, 20)))
+            tracker = EmotionTracker()
+            position = 0
+            while position < len(text):
+                size = rng.randint(1, 4)
+                tracker.feed(text[position:position + size])
+                position += size
+
+            assert tracker.emotion == analyze_emotion(text)
+
+
+class TestEmotionLexicon:
+    """EmotionLexicon 测试类"""
+
+    def test_overlapping_terms(self):
+        """测试互相重叠的情感词都能被匹配"""
+        lexicon = EmotionLexicon({"happy": {"好": 1, "太好了": 1}, "sad": {"不好": 3}})
+
+        assert lexicon.analyze("太好了") == "happy"
+        assert lexicon.analyze("不好") == "sad"
+
+    def test_weighted_scores(self):
+        """测试按权重计分"""
+        lexicon = EmotionLexicon({"happy": {"开心": 1}, "excited": {"激动": 2}})
+
+        assert lexicon.analyze("开心又激动") == "excited"
+        assert lexicon.analyze("开心") == "happy"
+        assert lexicon.analyze("没有情感词") == "neutral"
+
+    def test_excited_label(self):
+        """测试内置词典支持 excited 标签"""
+        assert analyze_emotion("我太激动了，迫不及待想见到你！") == "excited"
+
+    def test_batch_api(self):
+        """测试批量分析接口"""
+        texts = ["我很开心", "我很难过", "我知道了"]
+        assert analyze_emotions(texts) == ["happy", "sad", "neutral"]
+
+    def test_agent_lexicon_stays_in_lexicon_dir(self, tmp_path):
+        """测试agent_id不能指向词典目录之外的文件"""
+        directory = tmp_path / "lexicons"
+        directory.mkdir()
+        (directory / "test.json").write_text(json.dumps({"labels": {"happy": {"开心": 1}}}), encoding="utf-8")
+        (directory / "bird.json").write_text(json.dumps({"labels": {"sad": {"下雨": 1}}}), encoding="utf-8")
+        (tmp_path / "outside.json").write_text(json.dumps({"labels": {"sad": {"开心": 5}}}), encoding="utf-8")
+
+        with patch("birdiland.emotion.settings.EMOTION_LEXICON_DIR", str(directory)):
+            assert get_lexicon("bird", "test").analyze("又下雨了") == "sad"
+            assert get_lexicon("../outside", "test").analyze("我很开心") == "happy"
+            assert get_lexicon("../outside", "test") is get_lexicon(None, "test")
+
+    def test_large_lexicon(self):
+        """测试大规模词典的匹配"""
+        words = {f"词{i}": 1 for i in range(5000)}
+        lexicon = EmotionLexicon({"happy": words, "sad": {"难过": 1}})
+
+        assert lexicon.analyze("这是词4999") == "happy"
+        assert lexicon.analyze("我很难过") == "sad"
+
+
+class TestEmotionClassifier:
+    """EmotionClassifier 测试类"""
+
+    @pytest.mark.asyncio
+    async def test_fallback_when_disabled(self):
+        """测试未配置模型时使用情感词典"""
+        classifier = EmotionClassifier(model_name="")
+        assert await classifier.classify("我很开心") == "happy"
+
+    @pytest.mark.asyncio
+    async def test_micro_batching(self):
+        """测试并发请求被合并为微批次，并映射模型标签"""
+        batches = []
+
+        def predictor(texts):
+            batches.append(list(texts))
+            return [{"label": "JOY" if "开心" in t else "sadness"} for t in texts]
+
+        classifier = EmotionClassifier(
+            model_name="fake-model",
+            batch_size=8,
+            max_wait_ms=50,
+            label_map={"joy": "happy", "sadness": "sad"},
+            loader=lambda name: predictor,
+        )
+        # 模型加载前使用情感词典
+        assert await classifier.classify("我知道了") == "neutral"
+        await classifier.load()
+
+        labels = await classifier.classify_many(["开心", "难过", "开心", "平静"])
+        await classifier.close()
+
+        assert labels == ["happy", "sad", "happy", "sad"]
+        assert batches == [["开心", "难过", "开心", "平静"]]
@@ -0,0 +1,170 @@
+"""
+agent资料注册表测试用例
+"""
+
+import asyncio
+import json
+import os
+import time
+
+import pytest
+
+from birdiland.agent import AgentManager
+from birdiland.registry import ProfileRegistry
+
+
+def write_profile(directory, agent_id: str, name: str, **fields):
+    """写入一个资料文件"""
+    profile = {
+        "name": name,
+        "personality": "友好",
+        "interests": ["唱歌"],
+        "speaking_style": "温暖",
+        "background": "测试角色",
+        **fields,
+    }
+    path = directory / f"{agent_id}.json"
+    path.write_text(json.dumps(profile, ensure_ascii=False), encoding="utf-8")
+    return path
+
+
+class TestProfileRegistry:
+    """ProfileRegistry 测试类"""
+
+    def test_loads_and_indexes_by_file_name(self, tmp_path):
+        """测试按文件名索引资料并补全可选字段"""
+        write_profile(tmp_path, "lark", "Lark")
+        write_profile(tmp_path, "owl", "Owl")
+        registry = ProfileRegistry(tmp_path, reload_interval=0)
+
+        assert list(registry) == ["lark", "owl"]
+        assert registry["lark"]["name"] == "Lark"
+        assert registry["owl"]["avatar"] == ""
+        assert "robin" not in registry
+
+    def test_invalid_profile_fails_first_load(self, tmp_path):
+        """测试首次加载时资料有误直接报错"""
+        (tmp_path / "lark.json").write_text('{"name": "Lark"}', encoding="utf-8")
+        with pytest.raises(ValueError, match="lark.json"):
+            ProfileRegistry(tmp_path, reload_interval=0).reload()
+
+    def test_hot_reload_notifies_changed_agents(self, tmp_path):
+        """测试文件变化后重新加载，并通知新增、修改和删除的agent"""
+        write_profile(tmp_path, "lark", "Lark")
+        owl = write_profile(tmp_path, "owl", "Owl")
+        registry = ProfileRegistry(tmp_path, reload_interval=0)
+        registry.reload()
+        notified = []
+        registry.subscribe(notified.append)
+
+        write_profile(tmp_path, "lark", "Lark II", background="改写后的背景")
+        write_profile(tmp_path, "robin", "Robin")
+        owl.unlink()
+        assert registry.reload()
+
+        assert notified == [{"lark", "owl", "robin"}]
+        assert registry["lark"]["name"] == "Lark II"
+        assert set(registry) == {"lark", "robin"}
+
+    def test_failed_reload_keeps_current_profiles(self, tmp_path, capsys):
+        """测试重新加载失败时整体保留当前资料"""
+        write_profile(tmp_path, "lark", "Lark")
+        registry = ProfileRegistry(tmp_path, reload_interval=0)
+        registry.reload()
+        version = registry.version
+
+        write_profile(tmp_path, "robin", "Robin")
+        (tmp_path / "owl.json").write_text("{", encoding="utf-8")
+        assert not registry.reload()
+
+        assert set(registry) == {"lark"}
+        assert registry.version == version
+        assert "owl.json" in capsys.readouterr().out
+
+    def test_version_is_content_hash(self, tmp_path):
+        """测试版本号由资料内容决定：重启后不变，只修改时间变化时不变，内容变化时改变"""
+        path = write_profile(tmp_path, "lark", "Lark")
+        registry = ProfileRegistry(tmp_path, reload_interval=0)
+        registry.reload()
+        version = registry.version
+
+        restarted = ProfileRegistry(tmp_path, reload_interval=0)
+        restarted.reload()
+        assert restarted.version == version
+
+        write_profile(tmp_path, "lark", "Lark")
+        os.utime(path, ns=(path.stat().st_atime_ns, path.stat().st_mtime_ns + 10**9))
+        registry.reload()
+        assert registry.version == version
+
+        write_profile(tmp_path, "lark", "Lark II")
+        registry.reload()
+        assert registry.version != version
+
+    def test_access_does_not_scan_files(self, tmp_path):
+        """测试首次访问后读取注册表不检查文件变化"""
+        write_profile(tmp_path, "lark", "Lark")
+        registry = ProfileRegistry(tmp_path, reload_interval=0.001)
+        assert registry["lark"]["name"] == "Lark"
+
+        write_profile(tmp_path, "lark", "Lark II")
+        time.sleep(0.01)
+        assert registry["lark"]["name"] == "Lark"
+
+    @pytest.mark.asyncio
+    async def test_watch_reloads_in_background(self, tmp_path):
+        """测试后台任务检查到文件变化后重新加载并通知订阅者"""
+        write_profile(tmp_path, "lark", "Lark")
+        registry = ProfileRegistry(tmp_path, reload_interval=0.01)
+        registry.reload()
+        notified = []
+        registry.subscribe(notified.append)
+        watcher = asyncio.create_task(registry.watch())
+
+        write_profile(tmp_path, "lark", "Lark II")
+        for _ in range(100):
+            if notified:
+                break
+            await asyncio.sleep(0.01)
+        watcher.cancel()
+
+        assert notified == [{"lark"}]
+        assert registry["lark"]["name"] == "Lark II"
+
+    def test_postprocessor_applies_to_reloads(self, tmp_path):
+        """测试资料处理函数对之后的重新加载同样生效"""
+        write_profile(tmp_path, "lark", "Lark", avatar="images/lark/avatar.png")
+        registry = ProfileRegistry(tmp_path, reload_interval=0)
+
+        def use_variants(profiles):
+            for profile in profiles.values():
+                profile["avatar"] = profile["avatar"].replace(".png", ".webp")
+
+        registry.add_postprocessor(use_variants)
+        assert registry["lark"]["avatar"] == "images/lark/avatar.webp"
+        write_profile(tmp_path, "lark", "Lark", avatar="images/lark/new.png")
+        registry.reload()
+        assert registry["lark"]["avatar"] == "images/lark/new.webp"
+
+
+class TestAgentManager:
+    """AgentManager 测试类"""
+
+    def test_agents_are_created_lazily_and_bounded(self):
+        """测试agent在首次使用时创建，超出上限时淘汰最久未使用的实例"""
+        manager = AgentManager(max_agents=1)
+        assert len(manager.agents) == 0
+
+        canary = manager.get_agent("canary")
+        assert manager.get_agent("canary") is canary
+        manager.get_agent("snow_fairy")
+        assert list(manager.agents) == ["snow_fairy"]
+        assert manager.get_agent("canary") is not canary
+        assert manager.get_agent("unknown") is None
+
+    def test_agent_list_is_cached(self):
+        """测试agent列表在资料未变化时复用"""
+        manager = AgentManager()
+        agents = manager.get_available_agents()
+        assert [agent["id"] for agent in agents] == ["canary", "snow_fairy"]
+        assert manager.get_available_agents() is agents
@@ -0,0 +1,217 @@
+"""
+上游容错测试用例
+"""
+
+import asyncio
+import time
+
+import httpx
+import openai
+import pytest
+
+from birdiland.resilience import CircuitBreaker, CircuitOpenError, UpstreamGuard
+
+
+def connection_error() -> openai.APIConnectionError:
+    """构造可重试的连接错误"""
+    return openai.APIConnectionError(request=httpx.Request("POST", "http://upstream/chat"))
+
+
+class TestCircuitBreaker:
+    """CircuitBreaker 测试类"""
+
+    def test_opens_after_threshold(self):
+        """测试连续失败达到阈值后熔断"""
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+        breaker.record_failure()
+        assert breaker.allow()
+        breaker.record_failure()
+        assert breaker.state == CircuitBreaker.OPEN
+        assert not breaker.allow()
+
+    def test_half_open_allows_single_probe(self):
+        """测试冷却后只放行一个探测请求，成功后关闭"""
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+        breaker.record_failure()
+        assert breaker.allow()
+        assert not breaker.allow()
+        breaker.record_success()
+        assert breaker.state == CircuitBreaker.CLOSED
+        assert breaker.allow()
+
+    def test_failed_probe_reopens(self):
+        """测试探测失败后重新熔断"""
+        breaker = CircuitBreaker(failure_threshold=3, reset_timeout=0)
+        for _ in range(3):
+            breaker.record_failure()
+        assert breaker.allow()
+        breaker.record_failure()
+        assert breaker.state == CircuitBreaker.OPEN
+
+
+class TestUpstreamGuard:
+    """UpstreamGuard 测试类"""
+
+    @pytest.mark.asyncio
+    async def test_open_circuit_fails_fast(self):
+        """测试熔断后请求立即失败，不再调用上游"""
+        guard = UpstreamGuard(CircuitBreaker(failure_threshold=1, reset_timeout=60), max_retries=0)
+        calls = 0
+
+        async def failing():
+            nonlocal calls
+            calls += 1
+            raise RuntimeError("down")
+
+        with pytest.raises(RuntimeError):
+            await guard.call(failing)
+
+        start = time.monotonic()
+        with pytest.raises(CircuitOpenError):
+            await guard.call(failing)
+        assert time.monotonic() - start < 0.05
+        assert calls == 1
+
+    @pytest.mark.asyncio
+    async def test_retries_retryable_errors(self):
+        """测试可重试的错误会重试"""
+        guard = UpstreamGuard(CircuitBreaker(), max_retries=2, retry_base_delay=0)
+        calls = 0
+
+        async def flaky():
+            nonlocal calls
+            calls += 1
+            if calls < 3:
+                raise connection_error()
+            return "ok"
+
+        assert await guard.call(flaky) == "ok"
+        assert calls == 3
+
+    @pytest.mark.asyncio
+    async def test_does_not_retry_other_errors(self):
+        """测试不可重试的错误直接抛出"""
+        guard = UpstreamGuard(CircuitBreaker(), max_retries=2, retry_base_delay=0)
+        calls = 0
+
+        async def broken():
+            nonlocal calls
+            calls += 1
+            raise ValueError("bad request")
+
+        with pytest.raises(ValueError):
+            await guard.call(broken)
+        assert calls == 1
+
+    @pytest.mark.asyncio
+    async def test_hedged_call_uses_faster_upstream(self):
+        """测试主请求超过对冲延迟时采用备用上游的结果"""
+        guard = UpstreamGuard(CircuitBreaker(), max_retries=0, hedge_delay=0.01)
+        cancelled = asyncio.Event()
+
+        async def slow():
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+            return "primary"
+
+        async def fast():
+            return "hedge"
+
+        assert await guard.call(slow, fast) == "hedge"
+        await asyncio.wait_for(cancelled.wait(), 1)
+
+    @pytest.mark.asyncio
+    async def test_hedge_not_sent_when_primary_is_fast(self):
+        """测试主请求及时返回时不发起对冲请求"""
+        guard = UpstreamGuard(CircuitBreaker(), max_retries=0, hedge_delay=1)
+        hedged = False
+
+        async def primary():
+            return "primary"
+
+        async def secondary():
+            nonlocal hedged
+            hedged = True
+            return "hedge"
+
+        assert await guard.call(primary, secondary) == "primary"
+        assert not hedged
+
+    @pytest.mark.asyncio
+    async def test_stream_hedges_on_first_token(self):
+        """测试流式请求首个片段超时时切换到备用上游，并关闭慢的流"""
+        guard = UpstreamGuard(CircuitBreaker(), max_retries=0, hedge_delay=0.01)
+
+        async def slow_stream():
+            await asyncio.sleep(10)
+            yield "slow"
+
+        async def fast_stream():
+            yield "你"
+            yield "好"
+
+        chunks = [chunk async for chunk in guard.stream(slow_stream, fast_stream)]
+        assert chunks == ["你", "好"]
+
+    @pytest.mark.asyncio
+    async def test_stream_failure_opens_circuit(self):
+        """测试流式请求的失败同样计入熔断"""
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=60)
+        guard = UpstreamGuard(breaker, max_retries=0)
+
+        async def failing_stream():
+            raise RuntimeError("down")
+            yield
+
+        with pytest.raises(RuntimeError):
+            async for _ in guard.stream(failing_stream):
+                pass
+        assert breaker.state == CircuitBreaker.OPEN
+        with pytest.raises(CircuitOpenError):
+            async for _ in guard.stream(failing_stream):
+                pass
+
+    @pytest.mark.asyncio
+    async def test_cancelled_probe_releases_half_open(self):
+        """测试探测请求被取消后不卡在半开状态，下一个请求可以重新探测"""
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+        breaker.record_failure()
+        guard = UpstreamGuard(breaker, max_retries=0)
+
+        async def hanging():
+            await asyncio.sleep(10)
+
+        task = asyncio.create_task(guard.call(hanging))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        assert breaker.state == CircuitBreaker.HALF_OPEN
+
+        async def healthy():
+            return "ok"
+
+        assert await guard.call(healthy) == "ok"
+        assert breaker.state == CircuitBreaker.CLOSED
+
+    @pytest.mark.asyncio
+    async def test_closed_probe_stream_releases_half_open(self):
+        """测试调用方提前关闭探测流后不卡在半开状态"""
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+        breaker.record_failure()
+        guard = UpstreamGuard(breaker, max_retries=0)
+
+        async def chunks():
+            yield "你"
+            yield "好"
+
+        stream = guard.stream(chunks)
+        assert await stream.__anext__() == "你"
+        await stream.aclose()
+        assert breaker.state == CircuitBreaker.HALF_OPEN
+
+        assert [chunk async for chunk in guard.stream(chunks)] == ["你", "好"]
+        assert breaker.state == CircuitBreaker.CLOSED
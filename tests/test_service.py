@@ -0,0 +1,105 @@
+"""
+对话服务层测试用例
+"""
+
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+
+from birdiland.agent import AGENT_PROFILES, agent_manager
+from birdiland.registry import profile_registry
+from birdiland.service import (
+    get_agent_metadata,
+    get_history_page,
+    get_profile,
+    list_agents,
+    profiles_version,
+    stream_reply,
+)
+
+
+def mock_stream(chunks):
+    """模拟上游流式接口"""
+    async def chunk_stream():
+        for text in chunks:
+            chunk = MagicMock()
+            chunk.choices[0].delta.content = text
+            yield chunk
+
+    async def create(**kwargs):
+        return chunk_stream()
+
+    client = agent_manager.get_agent("canary").client
+    return patch.object(client.chat.completions, "create", new=AsyncMock(side_effect=create))
+
+
+class TestStreamReply:
+    """stream_reply 测试类"""
+
+    @pytest.mark.asyncio
+    async def test_events_end_with_final_emotion(self):
+        """测试回复事件以携带最终情感的结束事件收尾"""
+        agent = agent_manager.get_agent("canary")
+        with mock_stream(["今天", "很开心", "！"]):
+            events = [e async for e in stream_reply(agent, "你好", "service-stream")]
+
+        assert "".join(e.content for e in events) == "今天很开心！"
+        assert events[-1].is_final
+        assert events[-1].emotion == "happy"
+        assert not any(e.is_final for e in events[:-1])
+
+    @pytest.mark.asyncio
+    async def test_emotion_only_sent_on_change(self):
+        """测试情感只在变化时给出"""
+        agent = agent_manager.get_agent("canary")
+        with mock_stream(["好", "的"]), patch("birdiland.service.coalesce_chunks") as coalesce:
+            async def passthrough(source, heartbeat=0):
+                async for chunk in source:
+                    yield chunk
+            coalesce.side_effect = passthrough
+            events = [e async for e in stream_reply(agent, "你好", "service-emotion")]
+
+        emotions = [e.emotion for e in events[:-1]]
+        assert emotions[0] is not None
+        assert emotions[1:] == [None] * (len(emotions) - 1)
+
+
+class TestServiceQueries:
+    """元数据查询测试类"""
+
+    def test_list_agents(self):
+        """测试agent列表"""
+        assert {agent["id"] for agent in list_agents()} == set(AGENT_PROFILES)
+
+    def test_get_profile(self):
+        """测试个人资料查询"""
+        assert get_profile("canary") == AGENT_PROFILES["canary"]
+        assert get_profile("unknown") is None
+
+    @pytest.mark.asyncio
+    async def test_get_history_page(self):
+        """测试分页历史查询"""
+        store = agent_manager.session_store
+        session = store.get_or_create("canary", "service-history-page", 10)
+        for i in range(3):
+            store.append(session, "user", str(i))
+
+        page = await get_history_page("canary", "service-history-page", limit=2)
+        assert [turn["content"] for turn in page["turns"]] == ["1", "2"]
+        assert page["has_more"] and page["next_seq"] == 3
+        older = await get_history_page("canary", "service-history-page", before_seq=page["turns"][0]["seq"])
+        assert [turn["content"] for turn in older["turns"]] == ["0"]
+        assert older["version"] == page["version"]
+        assert (await get_history_page("unknown", "service-history-page"))["turns"] == []
+
+
+class TestProfilesVersion:
+    """资料版本测试类"""
+
+    def test_metadata_carries_registry_version(self):
+        """测试版本号即资料注册表的内容哈希，元数据中携带当前版本"""
+        version = profiles_version()
+        assert version == profile_registry.version != ""
+        metadata = get_agent_metadata()
+        assert metadata["version"] == version
+        assert set(metadata["profiles"]) == {agent["id"] for agent in metadata["agents"]}
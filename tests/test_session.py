@@ -0,0 +1,100 @@
+"""
+会话存储测试用例
+"""
+
+import time
+from unittest.mock import patch
+
+from birdiland.session import SessionStore
+
+
+class TestSessionStore:
+    """SessionStore 测试类"""
+
+    def test_sessions_are_isolated(self):
+        """测试不同会话的历史互不影响"""
+        store = SessionStore(max_sessions=10, max_bytes=1024 * 1024, ttl_seconds=0)
+        a = store.get_or_create("canary", "a", 10)
+        b = store.get_or_create("canary", "b", 10)
+        store.append(a, "user", "你好")
+
+        assert len(store.get("canary", "a").history) == 1
+        assert store.get("canary", "b").history == []
+        assert b is store.get("canary", "b")
+
+    def test_lru_eviction_by_count(self):
+        """测试超出会话数量上限时淘汰最久未访问的会话"""
+        store = SessionStore(max_sessions=2, max_bytes=1024 * 1024, ttl_seconds=0)
+        store.get_or_create("canary", "a", 10)
+        store.get_or_create("canary", "b", 10)
+        store.get("canary", "a")  # a 变为最近访问
+        store.get_or_create("canary", "c", 10)
+
+        assert store.get("canary", "b") is None
+        assert store.get("canary", "a") is not None
+        assert len(store) == 2
+
+    def test_eviction_by_bytes(self):
+        """测试超出内存上限时淘汰会话并正确统计字节数"""
+        store = SessionStore(max_sessions=10, max_bytes=600, ttl_seconds=0)
+        a = store.get_or_create("canary", "a", 10)
+        store.append(a, "user", "x" * 300)
+        b = store.get_or_create("canary", "b", 10)
+        store.append(b, "user", "y" * 300)
+
+        assert store.get("canary", "a") is None
+        assert store.total_bytes == b.size_bytes
+
+    def test_ttl_expiration(self):
+        """测试闲置会话过期"""
+        store = SessionStore(max_sessions=10, max_bytes=1024 * 1024, ttl_seconds=60)
+        store.get_or_create("canary", "a", 10)
+
+        with patch("birdiland.session.time.monotonic", return_value=time.monotonic() + 120):
+            assert store.get("canary", "a") is None
+        assert len(store) == 0
+
+    def test_history_length_limit(self):
+        """测试单个会话的历史长度限制"""
+        store = SessionStore(max_sessions=10, max_bytes=1024 * 1024, ttl_seconds=0)
+        session = store.get_or_create("canary", "a", 2)
+        for i in range(5):
+            store.append(session, "user", str(i))
+
+        assert [m["content"] for m in session.history] == ["3", "4"]
+        assert store.total_bytes == session.size_bytes
+
+    def test_history_pages(self):
+        """测试按序号分页和增量读取历史"""
+        store = SessionStore(max_sessions=10, max_bytes=1024 * 1024, ttl_seconds=0)
+        session = store.get_or_create("canary", "a", 10)
+        for i in range(5):
+            store.append(session, "user", str(i))
+
+        turns, has_more = session.page(2)
+        assert [turn.seq for turn in turns] == [3, 4] and has_more
+        turns, has_more = session.page(2, before_seq=3)
+        assert [turn.seq for turn in turns] == [1, 2] and has_more
+        turns, has_more = session.page(2, before_seq=1)
+        assert [turn.seq for turn in turns] == [0] and not has_more
+        turns, has_more = session.page(2, since_seq=2)
+        assert [turn.seq for turn in turns] == [2, 3] and has_more
+        turns, has_more = session.page(10, since_seq=5)
+        assert turns == [] and not has_more
+
+    def test_history_version_changes_on_append_and_clear(self):
+        """测试历史版本在追加和清空后变化，清空后重新创建的会话不会复用旧版本"""
+        store = SessionStore(max_sessions=10, max_bytes=1024 * 1024, ttl_seconds=0)
+        session = store.get_or_create("canary", "a", 10)
+        store.append(session, "user", "你好")
+        version = session.history_version
+
+        store.append(session, "assistant", "你好呀")
+        assert session.history_version != version
+
+        versions = {session.history_version}
+        store.clear("canary", "a")
+        recreated = store.get_or_create("canary", "a", 10)
+        store.append(recreated, "user", "你好")
+        store.append(recreated, "assistant", "你好呀")
+        assert recreated.history_version not in versions
@@ -0,0 +1,89 @@
+"""
+请求合并测试用例
+"""
+
+import asyncio
+
+import pytest
+
+from birdiland.singleflight import SingleFlight
+
+
+class TestSingleFlight:
+    """SingleFlight 测试类"""
+
+    @pytest.mark.asyncio
+    async def test_concurrent_calls_share_one_execution(self):
+        """测试相同键的并发请求只执行一次"""
+        flight = SingleFlight()
+        calls = 0
+
+        async def work():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.01)
+            return "结果"
+
+        results = await asyncio.gather(*(flight.do("k", work) for _ in range(5)))
+
+        assert results == ["结果"] * 5
+        assert calls == 1
+        assert len(flight) == 0
+
+    @pytest.mark.asyncio
+    async def test_error_fans_out(self):
+        """测试上游错误会分发给所有等待者"""
+        flight = SingleFlight()
+
+        async def work():
+            await asyncio.sleep(0.01)
+            raise RuntimeError("upstream down")
+
+        results = await asyncio.gather(*(flight.do("k", work) for _ in range(3)), return_exceptions=True)
+
+        assert all(isinstance(r, RuntimeError) for r in results)
+
+    @pytest.mark.asyncio
+    async def test_stream_multicast(self):
+        """测试流式请求的所有订阅者都收到完整片段，包括后加入的订阅者"""
+        flight = SingleFlight()
+        calls = 0
+
+        async def source():
+            nonlocal calls
+            calls += 1
+            for chunk in ["你", "好", "！"]:
+                await asyncio.sleep(0.01)
+                yield chunk
+
+        async def consume(delay):
+            await asyncio.sleep(delay)
+            return "".join([chunk async for chunk in flight.stream("k", source)])
+
+        results = await asyncio.gather(consume(0), consume(0), consume(0.015))
+
+        assert results == ["你好！"] * 3
+        assert calls == 1
+
+    @pytest.mark.asyncio
+    async def test_request_after_last_subscriber_leaves_starts_new_stream(self):
+        """测试最后一个订阅者离开后立即到达的相同请求发起新的上游流，而不是加入已取消的多播"""
+        flight = SingleFlight()
+        calls = 0
+
+        async def source():
+            nonlocal calls
+            calls += 1
+            for chunk in ["你", "好"]:
+                await asyncio.sleep(0.01)
+                yield chunk
+
+        first = flight.stream("k", source)
+        assert await first.__anext__() == "你"
+        await first.aclose()
+
+        # 被取消的上游任务尚未结束时到达的相同请求
+        assert "".join([chunk async for chunk in flight.stream("k", source)]) == "你好"
+        assert calls == 2
+        await asyncio.sleep(0.03)
+        assert len(flight) == 0
@@ -0,0 +1,135 @@
+"""
+SSE 流式输出测试用例
+"""
+
+import asyncio
+import json
+
+import pytest
+
+from birdiland.sse import coalesce_chunks, format_event, throttle
+
+
+async def timed_chunks(items):
+    """按给定间隔产出片段：items 为 (延迟秒数, 片段) 列表"""
+    for delay, chunk in items:
+        await asyncio.sleep(delay)
+        yield chunk
+
+
+class TestFormatEvent:
+    """format_event 测试类"""
+
+    def test_frame_is_valid_json_with_id(self):
+        """测试帧包含事件ID且数据为合法JSON"""
+        frame = format_event(3, '你好"\n', "happy")
+        lines = frame.split("\n")
+        assert lines[0] == "id: 3"
+        assert json.loads(lines[1][len("data: "):]) == {"content": '你好"\n', "emotion": "happy", "is_final": False}
+        assert frame.endswith("\n\n")
+
+    def test_emotion_omitted_when_unchanged(self):
+        """测试未传情感时省略该字段"""
+        data = json.loads(format_event(1, "片段").split("\n")[1][len("data: "):])
+        assert "emotion" not in data
+
+    def test_final_frame(self):
+        """测试最终帧"""
+        data = json.loads(format_event(9, "", "neutral", is_final=True).split("\n")[1][len("data: "):])
+        assert data == {"content": "", "emotion": "neutral", "is_final": True}
+
+
+class TestCoalesceChunks:
+    """coalesce_chunks 测试类"""
+
+    @pytest.mark.asyncio
+    async def test_merges_fast_chunks(self):
+        """测试首个片段之后、缓冲时间内到达的片段合并为一帧"""
+        source = timed_chunks([(0, "你"), (0, "好"), (0, "呀")])
+        frames = [f async for f in coalesce_chunks(source, flush_interval=0.05, flush_bytes=1024, heartbeat=0)]
+        assert frames == ["你", "好呀"]
+
+    @pytest.mark.asyncio
+    async def test_first_chunk_sent_immediately(self):
+        """测试第一个片段不等待缓冲时间，立即输出"""
+        loop = asyncio.get_running_loop()
+        source = timed_chunks([(0, "你"), (0, "好")])
+        frames = coalesce_chunks(source, flush_interval=10, flush_bytes=1024, heartbeat=0)
+        started = loop.time()
+        assert await frames.__anext__() == "你"
+        assert loop.time() - started < 1
+        await frames.aclose()
+
+    @pytest.mark.asyncio
+    async def test_flushes_after_interval(self):
+        """测试超过缓冲时间后先发送已缓冲的内容"""
+        source = timed_chunks([(0, "a"), (0, "b"), (0, "c"), (0.1, "d")])
+        frames = [f async for f in coalesce_chunks(source, flush_interval=0.02, flush_bytes=1024, heartbeat=0)]
+        assert frames == ["a", "bc", "d"]
+
+    @pytest.mark.asyncio
+    async def test_flushes_at_byte_limit(self):
+        """测试缓冲字节数达到上限时立即发送"""
+        source = timed_chunks([(0, "ab"), (0, "cd"), (0, "ef"), (0, "g")])
+        frames = [f async for f in coalesce_chunks(source, flush_interval=10, flush_bytes=4, heartbeat=0)]
+        assert frames == ["ab", "cdef", "g"]
+
+    @pytest.mark.asyncio
+    async def test_heartbeat_when_idle(self):
+        """测试长时间没有片段时产出心跳"""
+        source = timed_chunks([(0.08, "晚")])
+        frames = [f async for f in coalesce_chunks(source, flush_interval=0, flush_bytes=1024, heartbeat=0.03)]
+        assert None in frames
+        assert frames[-1] == "晚"
+
+    @pytest.mark.asyncio
+    async def test_early_close_closes_source(self):
+        """测试调用方提前停止时关闭上游"""
+        closed = asyncio.Event()
+
+        async def source():
+            try:
+                yield "a"
+                await asyncio.sleep(10)
+                yield "b"
+            finally:
+                closed.set()
+
+        frames = coalesce_chunks(source(), flush_interval=0, flush_bytes=1024, heartbeat=0)
+        assert await frames.__anext__() == "a"
+        await frames.aclose()
+        assert closed.is_set()
+
+
+class TestThrottle:
+    """throttle 测试类"""
+
+    @pytest.mark.asyncio
+    async def test_first_item_is_immediate_and_rest_batched(self):
+        """测试第一个条目立即产出，间隔内到达的条目合并产出"""
+        source = timed_chunks([(0, "a"), (0, "b"), (0, "c")])
+        batches = [b async for b in throttle(source, 0.05)]
+        assert batches == [["a"], ["b", "c"]]
+
+    @pytest.mark.asyncio
+    async def test_limits_update_rate(self):
+        """测试更新次数受帧率限制"""
+        source = timed_chunks([(0.002, str(i)) for i in range(50)])
+        batches = [b async for b in throttle(source, 0.03)]
+        assert sum(len(b) for b in batches) == 50
+        assert len(batches) < 25
+
+    @pytest.mark.asyncio
+    async def test_flushes_during_upstream_pause(self):
+        """测试上游停顿时已到达的条目按时产出，而不是等到下一个条目"""
+        received = []
+
+        async def consume():
+            async for batch in throttle(timed_chunks([(0, "a"), (0, "b"), (0.3, "c")]), 0.02):
+                received.append(batch)
+
+        task = asyncio.create_task(consume())
+        await asyncio.sleep(0.1)
+        assert received == [["a"], ["b"]]
+        await task
+        assert received[-1] == ["c"]
@@ -0,0 +1,57 @@
+"""
+启动与运行模式测试用例
+"""
+
+import sys
+from unittest.mock import patch
+
+import pytest
+from fastapi.testclient import TestClient
+
+from birdiland.config import settings
+from birdiland.main import create_app, parse_args
+from birdiland.startup import StartupTimer
+
+
+class TestStartupTimer:
+    """StartupTimer 测试类"""
+
+    def test_phases_are_reported(self):
+        """测试按阶段记录耗时并生成报告"""
+        timer = StartupTimer()
+        with timer.phase("导入对话服务"):
+            pass
+        timer.mark_ready()
+
+        stats = timer.stats()
+        assert stats["ready"]
+        assert list(stats["phases"]) == ["导入对话服务"]
+        report = timer.report()
+        assert "导入对话服务" in report and "其他" in report
+
+
+class TestRunMode:
+    """运行模式测试类"""
+
+    def test_api_only_app_skips_gradio(self):
+        """测试只提供API的模式不导入 Gradio，API和静态资源正常可用"""
+        with patch.object(settings, "RUN_MODE", "api"):
+            app = create_app()
+        client = TestClient(app)
+
+        assert client.get("/api/v1/health").status_code == 200
+        assert "startup" in client.get("/api/v1/stats").json()
+        assert client.get("/manifest.json").status_code == 200
+        assert "birdiland.gradio_ui" not in sys.modules
+        assert not any(getattr(route, "path", "") == "/chat" for route in app.routes)
+
+    def test_unknown_mode_is_rejected(self):
+        """测试未知的运行模式"""
+        with patch.object(settings, "RUN_MODE", "ui"):
+            with pytest.raises(ValueError):
+                create_app()
+
+    def test_api_only_flag(self):
+        """测试 --api-only 命令行参数"""
+        assert parse_args(["--api-only"]).api_only
+        assert not parse_args([]).api_only
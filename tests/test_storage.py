@@ -0,0 +1,361 @@
+"""
+共享会话存储测试用例
+"""
+
+import asyncio
+import time
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+
+from birdiland.agent import BirdilandAgent
+from birdiland.session import SessionStore
+from birdiland.storage import DurableSessionStore, SqliteSessionStore, create_session_store, open_database
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    """临时数据库文件"""
+    return str(tmp_path / "sessions.db")
+
+
+class TestSqliteSessionStore:
+    """SqliteSessionStore 测试类"""
+
+    def test_history_round_trip(self, db_path):
+        """测试追加的消息可以读回"""
+        store = SqliteSessionStore(db_path, ttl_seconds=0)
+        session = store.get_or_create("canary", "a", 10)
+        store.append(session, "user", "你好")
+        store.append(session, "assistant", "你好呀")
+
+        assert store.get("canary", "a").history == [
+            {"role": "user", "content": "你好"},
+            {"role": "assistant", "content": "你好呀"},
+        ]
+        assert store.get("canary", "b") is None
+        assert len(store) == 1
+
+    def test_shared_between_processes(self, db_path):
+        """测试两个存储实例（模拟两个工作进程）看到彼此的写入"""
+        worker_a = SqliteSessionStore(db_path, ttl_seconds=0)
+        worker_b = SqliteSessionStore(db_path, ttl_seconds=0)
+
+        session = worker_a.get_or_create("canary", "shared", 10)
+        worker_a.append(session, "user", "第一条")
+        other = worker_b.get("canary", "shared")
+        worker_b.append(other, "user", "第二条")
+
+        history = worker_a.get("canary", "shared").history
+        assert [m["content"] for m in history] == ["第一条", "第二条"]
+        assert [turn.seq for turn in worker_a.get("canary", "shared").turns] == [0, 1]
+
+    def test_history_length_limit_moves_window(self, db_path):
+        """测试超出长度上限时最旧的消息被挤出并进入待摘要队列"""
+        store = SqliteSessionStore(db_path, ttl_seconds=0)
+        session = store.get_or_create("canary", "a", 2)
+        for i in range(5):
+            store.append(session, "user", str(i))
+
+        fresh = SqliteSessionStore(db_path, ttl_seconds=0).get("canary", "a")
+        assert [m["content"] for m in fresh.history] == ["3", "4"]
+        assert fresh.window_start == 3
+        assert [turn.content for turn in fresh.pending_summary] == ["0", "1", "2"]
+
+    def test_summary_progress_is_persisted(self, db_path):
+        """测试摘要和摘要进度写回存储，已摘要的消息不再进入待摘要队列"""
+        store = SqliteSessionStore(db_path, ttl_seconds=0)
+        session = store.get_or_create("canary", "a", 2)
+        for i in range(4):
+            store.append(session, "user", str(i))
+        session = store.get("canary", "a")
+        session.summary = "用户数了数"
+        session.summarized_seq = 2
+        store.save(session)
+
+        fresh = SqliteSessionStore(db_path, ttl_seconds=0).get("canary", "a")
+        assert fresh.summary == "用户数了数"
+        assert list(fresh.pending_summary) == []
+
+    def test_stale_summary_does_not_overwrite(self, db_path):
+        """测试较旧的摘要不会覆盖其他进程写入的较新摘要"""
+        worker_a = SqliteSessionStore(db_path, ttl_seconds=0)
+        worker_b = SqliteSessionStore(db_path, ttl_seconds=0)
+        session = worker_a.get_or_create("canary", "a", 2)
+        for i in range(4):
+            worker_a.append(session, "user", str(i))
+
+        newer = worker_a.get("canary", "a")
+        older = worker_b.get("canary", "a")
+        newer.summary, newer.summarized_seq = "新摘要", 2
+        worker_a.save(newer)
+        older.summary, older.summarized_seq = "旧摘要", 1
+        worker_b.save(older)
+
+        assert worker_a.get("canary", "a").summary == "新摘要"
+
+    def test_clear(self, db_path):
+        """测试清空会话"""
+        store = SqliteSessionStore(db_path, ttl_seconds=0)
+        session = store.get_or_create("canary", "a", 10)
+        store.append(session, "user", "你好")
+        store.clear("canary", "a")
+
+        assert store.get("canary", "a") is None
+        assert store.stats()["bytes"] == 0
+
+    def test_history_version_is_shared(self, db_path):
+        """测试各工作进程读到相同的历史版本，清空后重新创建的会话版本不同"""
+        worker_a = SqliteSessionStore(db_path, ttl_seconds=0)
+        worker_b = SqliteSessionStore(db_path, ttl_seconds=0)
+        session = worker_a.get_or_create("canary", "a", 10)
+        worker_a.append(session, "user", "你好")
+        version = worker_a.get("canary", "a").history_version
+
+        assert worker_b.get("canary", "a").history_version == version
+        worker_b.clear("canary", "a")
+        recreated = worker_b.get_or_create("canary", "a", 10)
+        worker_b.append(recreated, "user", "你好")
+        assert worker_a.get("canary", "a").history_version != version
+
+    def test_ttl_expiration(self, db_path):
+        """测试闲置会话过期"""
+        store = SqliteSessionStore(db_path, ttl_seconds=60)
+        store.get_or_create("canary", "a", 10)
+
+        with patch("birdiland.storage.time.time", return_value=time.time() + 120):
+            assert store.get("canary", "a") is None
+        assert len(store) == 0
+
+    @pytest.mark.asyncio
+    async def test_run_does_not_block_event_loop(self, db_path):
+        """测试等待数据库写锁时存储操作在存储线程中等待，事件循环继续处理其他任务"""
+        store = SqliteSessionStore(db_path, ttl_seconds=0)
+        session = await store.run(store.get_or_create, "canary", "a", 10)
+        # 另一个连接（模拟其他工作进程）持有写锁
+        other = SqliteSessionStore(db_path, ttl_seconds=0).db
+        other.execute("BEGIN IMMEDIATE")
+
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await asyncio.sleep(0.01)
+
+        ticking = asyncio.create_task(ticker())
+        append = asyncio.create_task(store.run(store.append, session, "user", "你好"))
+        await asyncio.sleep(0.2)
+        assert not append.done()
+        other.execute("COMMIT")
+        await append
+        ticking.cancel()
+
+        assert ticks >= 10
+        assert [m["content"] for m in (await store.run(store.get, "canary", "a")).history] == ["你好"]
+        await store.close()
+
+    def test_get_returns_independent_snapshot(self, db_path):
+        """测试每次读取得到独立的会话副本，其他请求的追加不会修改已读取的会话"""
+        store = SqliteSessionStore(db_path, ttl_seconds=0)
+        store.append(store.get_or_create("canary", "a", 10), "user", "第一条")
+        reading = store.get("canary", "a")
+        store.append(store.get("canary", "a"), "assistant", "第二条")
+
+        assert [m["content"] for m in reading.history] == ["第一条"]
+        assert [m["content"] for m in store.get("canary", "a").history] == ["第一条", "第二条"]
+
+    @pytest.mark.asyncio
+    async def test_concurrent_access_to_same_session(self, db_path):
+        """测试同一会话的并发读取和追加在不同存储线程中执行时互不干扰"""
+        store = SqliteSessionStore(db_path, ttl_seconds=0)
+        await store.run(store.get_or_create, "canary", "a", 200)
+
+        def write(i: int):
+            store.append(store.get("canary", "a"), "user", str(i))
+
+        def read() -> int:
+            session = store.get("canary", "a")
+            for _ in range(1000):
+                window = session.window_turns()
+                session.advance_window(window[len(window) // 2].seq if window else session.next_seq)
+            return len(session.turns)
+
+        # 读取时遍历的消息队列被其他线程修改会抛出 RuntimeError
+        reads = await asyncio.gather(
+            *(store.run(write, i) if i % 2 else store.run(read) for i in range(400))
+        )
+
+        assert all(count <= 200 for count in reads[::2])
+        assert (await store.run(store.get, "canary", "a")).next_seq == 200
+        await store.close()
+
+    @pytest.mark.asyncio
+    async def test_agent_uses_shared_store(self, db_path):
+        """测试agent通过共享存储记录对话"""
+        store = SqliteSessionStore(db_path, ttl_seconds=0)
+        agent = BirdilandAgent("canary", store)
+        response = MagicMock()
+        response.choices[0].message.content = "你好呀"
+        with patch.object(agent.client.chat.completions, "create", new=AsyncMock(return_value=response)):
+            assert await agent.chat("你好", session_id="agent-session") == "你好呀"
+        await store.close()
+
+        other = BirdilandAgent("canary", SqliteSessionStore(db_path, ttl_seconds=0))
+        assert other.get_conversation_history("agent-session") == [
+            {"role": "user", "content": "你好"},
+            {"role": "assistant", "content": "你好呀"},
+        ]
+
+
+class TestDurableSessionStore:
+    """DurableSessionStore 测试类"""
+
+    @pytest.mark.asyncio
+    async def test_appends_are_written_behind(self, db_path):
+        """测试追加只写内存，由后台任务批量落盘"""
+        store = DurableSessionStore(db_path, flush_interval=0.01, ttl_seconds=0)
+        session = store.get_or_create("canary", "a", 10)
+        store.append(session, "user", "你好")
+        store.append(session, "assistant", "你好呀")
+        assert store.stats()["pending_writes"] > 0
+
+        for _ in range(100):
+            if store.stats()["pending_writes"] == 0 and store.flushes:
+                break
+            await asyncio.sleep(0.01)
+        assert store.stats()["flushed_turns"] == 2
+        assert store.flushes == 1
+
+        reader = SqliteSessionStore(db_path, ttl_seconds=0)
+        assert [m["content"] for m in reader.get("canary", "a").history] == ["你好", "你好呀"]
+        await store.close()
+
+    @pytest.mark.asyncio
+    async def test_close_flushes_and_restart_loads_lazily(self, db_path):
+        """测试关闭时写入未落盘的消息，重启后首次访问时从磁盘加载"""
+        store = DurableSessionStore(db_path, flush_interval=60, ttl_seconds=0)
+        session = store.get_or_create("canary", "a", 10)
+        store.append(session, "user", "记住我")
+        session.summary = "用户希望被记住"
+        store.save(session)
+        await store.close()
+
+        restarted = DurableSessionStore(db_path, ttl_seconds=0)
+        assert len(restarted) == 0
+        loaded = restarted.get("canary", "a")
+        assert loaded.history == [{"role": "user", "content": "记住我"}]
+        assert loaded.summary == "用户希望被记住"
+        assert loaded.history_version == session.history_version
+        assert restarted.stats()["loaded_from_disk"] == 1
+        # 再次访问直接命中内存
+        assert restarted.get("canary", "a") is loaded
+        await restarted.close()
+
+    @pytest.mark.asyncio
+    async def test_cold_load_does_not_wait_for_writer(self, db_path):
+        """测试写入线程等待数据库写锁时，加载冷会话不需要等待写入完成"""
+        store = DurableSessionStore(db_path, flush_interval=60, ttl_seconds=0)
+        store.append(store.get_or_create("canary", "cold", 10), "user", "冷会话")
+        await store.close()
+
+        restarted = DurableSessionStore(db_path, flush_interval=60, ttl_seconds=0)
+        # 另一个连接持有写锁，写入线程的写事务一直等待
+        other = open_database(db_path)
+        other.execute("BEGIN IMMEDIATE")
+        restarted.append(restarted.get_or_create("canary", "hot", 10), "user", "热会话")
+        flushing = asyncio.create_task(restarted.flush())
+        await asyncio.sleep(0.1)
+
+        started = time.monotonic()
+        loaded = restarted.get("canary", "cold")
+        assert time.monotonic() - started < 1.0
+        assert loaded.history == [{"role": "user", "content": "冷会话"}]
+
+        other.execute("COMMIT")
+        await flushing
+        await restarted.close()
+        other.close()
+
+    @pytest.mark.asyncio
+    async def test_evicted_session_keeps_unflushed_turns(self, db_path):
+        """测试尚未落盘就被挤出内存的会话再次访问时不会丢失消息"""
+        store = DurableSessionStore(db_path, flush_interval=60, max_sessions=1, ttl_seconds=0)
+        a = store.get_or_create("canary", "a", 10)
+        store.append(a, "user", "第一条")
+        store.get_or_create("canary", "b", 10)
+
+        assert store.get("canary", "a").history == [{"role": "user", "content": "第一条"}]
+        await store.close()
+
+    @pytest.mark.asyncio
+    async def test_clear_removes_persisted_history(self, db_path):
+        """测试清空会话同时删除磁盘上的记录"""
+        store = DurableSessionStore(db_path, flush_interval=60, ttl_seconds=0)
+        session = store.get_or_create("canary", "a", 10)
+        store.append(session, "user", "你好")
+        await store.flush()
+        store.clear("canary", "a")
+        assert store.get("canary", "a") is None
+        await store.close()
+
+        assert DurableSessionStore(db_path, ttl_seconds=0).get("canary", "a") is None
+
+    @pytest.mark.asyncio
+    async def test_cleared_then_rewritten_session_drops_old_turns(self, db_path):
+        """测试清空后在落盘前再次写入的会话，重启后不会出现清空前的消息"""
+        store = DurableSessionStore(db_path, flush_interval=60, ttl_seconds=0)
+        session = store.get_or_create("canary", "a", 10)
+        for i in range(6):
+            store.append(session, "user", f"old-{i}")
+        await store.flush()
+        store.clear("canary", "a")
+        session = store.get_or_create("canary", "a", 10)
+        store.append(session, "user", "new-0")
+        await store.close()
+
+        restarted = DurableSessionStore(db_path, ttl_seconds=0)
+        assert [m["content"] for m in restarted.get("canary", "a").history] == ["new-0"]
+        await restarted.close()
+
+    @pytest.mark.asyncio
+    async def test_expired_session_is_not_reloaded(self, db_path):
+        """测试磁盘上已过期的会话不再加载，并从磁盘删除"""
+        store = DurableSessionStore(db_path, flush_interval=60, ttl_seconds=0.05)
+        store.append(store.get_or_create("canary", "a", 10), "user", "过期的消息")
+        await store.close()
+        await asyncio.sleep(0.1)
+
+        restarted = DurableSessionStore(db_path, flush_interval=60, ttl_seconds=0.05)
+        assert restarted.get("canary", "a") is None
+        await restarted.close()
+        assert SqliteSessionStore(db_path, ttl_seconds=0).get("canary", "a") is None
+
+    @pytest.mark.asyncio
+    async def test_sweep_limits_sessions_on_disk(self, db_path):
+        """测试写入批次时清理超出数量上限的最久未访问会话"""
+        store = DurableSessionStore(db_path, flush_interval=60, max_sessions=2, ttl_seconds=0, sweep_interval=0)
+        for session_id in ("a", "b", "c"):
+            store.append(store.get_or_create("canary", session_id, 10), "user", session_id)
+            await store.flush()
+            await asyncio.sleep(0.01)
+        await store.close()
+
+        reader = SqliteSessionStore(db_path, ttl_seconds=0)
+        assert reader.get("canary", "a") is None
+        assert reader.get("canary", "b") is not None
+        assert reader.db.execute("SELECT COUNT(*) FROM turns WHERE session_id = 'a'").fetchone()[0] == 0
+
+
+class TestCreateSessionStore:
+    """create_session_store 测试类"""
+
+    def test_backends(self, db_path):
+        """测试按名称创建存储后端"""
+        assert isinstance(create_session_store("memory"), SessionStore)
+        with patch("birdiland.storage.settings.SESSION_SQLITE_PATH", db_path):
+            assert isinstance(create_session_store("durable"), DurableSessionStore)
+            assert isinstance(create_session_store("sqlite"), SqliteSessionStore)
+        with pytest.raises(ValueError):
+            create_session_store("unknown")